@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, CustomUserProfile, QuestionUsage, UserEntitlement
+from .models import CustomUser, CustomUserProfile, OutboundEmail, QuestionUsage, StripeEvent, UserEntitlement
 
 
 def membership_label_for_user(user):
@@ -96,4 +96,20 @@ class UserEntitlementAdmin(admin.ModelAdmin):
 class QuestionUsageAdmin(admin.ModelAdmin):
     list_display = ('user', 'date', 'question_count')
     list_filter = ('date',)
-    search_fields = ('user__email', 'user__username')
\ No newline at end of file
+    search_fields = ('user__email', 'user__username')
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'object_id', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id', 'object_id')
+    readonly_fields = ('received_at', 'processed_at')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('created_at', 'sent_at')
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import StripeEvent
+from accounts.services.stripe import process_pending_stripe_events
+
+
+class Command(BaseCommand):
+    help = "Apply pending Stripe webhook events from the StripeEvent ledger in order."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the pending queue once and exit instead of polling.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Maximum events applied per polling cycle. Defaults to 100.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when the queue is empty. Defaults to 2.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        poll_interval = options["poll_interval"]
+
+        while True:
+            handled_events = process_pending_stripe_events(limit=batch_size)
+            if handled_events:
+                self._report(handled_events)
+
+            if options["once"]:
+                if len(handled_events) < batch_size:
+                    return
+                continue
+
+            if len(handled_events) < batch_size:
+                time.sleep(poll_interval)
+
+    def _report(self, handled_events):
+        counts = {}
+        for stripe_event in handled_events:
+            counts[stripe_event.status] = counts.get(stripe_event.status, 0) + 1
+
+        summary = ", ".join(f"{counts.get(choice, 0)} {choice}" for choice, _ in StripeEvent.Status.choices)
+        self.stdout.write(f"Handled {len(handled_events)} Stripe events: {summary}")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import OutboundEmail
+from accounts.services.email import deliver_pending_emails
+
+
+class Command(BaseCommand):
+    help = "Send queued OutboundEmail messages in batches over one mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send every message that is currently due and exit instead of polling.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Maximum messages sent per connection. Defaults to 50.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when nothing is due. Defaults to 5.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        while True:
+            batch = deliver_pending_emails(batch_size=batch_size)
+            if batch:
+                sent_count = sum(1 for outbound_email in batch if outbound_email.status == OutboundEmail.Status.SENT)
+                self.stdout.write(f"Sent {sent_count} of {len(batch)} queued emails")
+
+            if len(batch) < batch_size:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
@@ -106,6 +106,72 @@ class QuestionUsage(models.Model):
     def __str__(self):
         return f"{self.user.email} | {self.date} | {self.question_count}"
 
+class StripeEvent(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        PROCESSED = 'processed', 'Processed'
+        IGNORED = 'ignored', 'Ignored'
+        FAILED = 'failed', 'Failed'
+
+    MAX_ATTEMPTS = 5
+    RETRY_BASE_SECONDS = 30
+
+    # Stripe event ids are globally unique, so the ledger doubles as the duplicate-delivery guard.
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100, db_index=True)
+    object_id = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    stripe_created = models.BigIntegerField(default=0)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # A failed event waits here before it is retried, doubling from RETRY_BASE_SECONDS after each attempt.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['stripe_created', 'id']
+        indexes = [
+            models.Index(fields=['status', 'stripe_created', 'id'], name='stripe_event_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} | {self.event_type} | {self.status}"
+
+
+class OutboundEmail(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    MAX_ATTEMPTS = 5
+    RETRY_BASE_SECONDS = 30
+    # A claimed row is hidden from other workers for this long; if its worker dies it becomes due again.
+    CLAIM_SECONDS = 300
+
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=255, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} | {self.subject} | {self.status}"
+
+
 @receiver(post_save, sender=CustomUser)
 def create_user_related_records(sender, instance, created, **kwargs):
     if created:
@@ -0,0 +1,101 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+import logging
+from accounts.models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(subject, message, recipient, from_email=None):
+    """Write a message to the outbox; callers inside transaction.atomic() commit it with their own changes."""
+    return OutboundEmail.objects.create(
+        to_email=recipient,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        subject=subject,
+        body=message,
+    )
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=OutboundEmail.RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+
+
+def _record_failure(outbound_email, error, now):
+    outbound_email.attempts += 1
+    outbound_email.last_error = str(error)
+    if outbound_email.attempts >= OutboundEmail.MAX_ATTEMPTS:
+        outbound_email.status = OutboundEmail.Status.FAILED
+    else:
+        outbound_email.next_attempt_at = now + _retry_delay(outbound_email.attempts)
+    outbound_email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def _claim_batch(batch_size, now):
+    """Lease a batch of due rows by pushing next_attempt_at past the claim window, then release the row locks."""
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.Status.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            OutboundEmail.objects.filter(pk__in=[outbound_email.pk for outbound_email in batch]).update(
+                next_attempt_at=now + timedelta(seconds=OutboundEmail.CLAIM_SECONDS)
+            )
+    return batch
+
+
+def _record_sent(outbound_email):
+    outbound_email.attempts += 1
+    outbound_email.status = OutboundEmail.Status.SENT
+    outbound_email.last_error = ''
+    # Bodies can carry password-reset and verification links; do not keep them once delivered.
+    outbound_email.body = ''
+    outbound_email.sent_at = timezone.now()
+    outbound_email.save(update_fields=['attempts', 'status', 'last_error', 'body', 'sent_at'])
+
+
+def deliver_pending_emails(batch_size=50):
+    """Send one batch of due outbox messages over a single backend connection.
+
+    Rows are claimed in a short transaction and sent outside it, so no row locks are held during SMTP I/O.
+    Returns the list of OutboundEmail rows that were attempted in this batch.
+    """
+    now = timezone.now()
+    batch = _claim_batch(batch_size, now)
+    if not batch:
+        return []
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.exception('Unable to open email connection for %s queued messages', len(batch))
+        for outbound_email in batch:
+            _record_failure(outbound_email, exc, now)
+        return batch
+
+    try:
+        for outbound_email in batch:
+            message = EmailMessage(
+                subject=outbound_email.subject,
+                body=outbound_email.body,
+                from_email=outbound_email.from_email or settings.DEFAULT_FROM_EMAIL,
+                to=[outbound_email.to_email],
+                connection=connection,
+            )
+            try:
+                message.send(fail_silently=False)
+            except Exception as exc:
+                logger.warning('Sending queued email %s failed: %s', outbound_email.pk, exc)
+                _record_failure(outbound_email, exc, now)
+                continue
+            _record_sent(outbound_email)
+    finally:
+        connection.close()
+
+    return batch
@@ -1,12 +1,20 @@
+from datetime import timedelta
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.utils import timezone
+import json
+import logging
 import stripe
-from accounts.models import CustomUser, UserEntitlement
+from accounts.models import CustomUser, StripeEvent, UserEntitlement
 
 
+logger = logging.getLogger(__name__)
+
 ACTIVE_SUBSCRIPTION_STATUSES = {'active', 'trialing', 'past_due'}
 SUPPORTED_CHECKOUT_MODES = {'payment', 'subscription'}
+CHECKOUT_EVENT_TYPES = {'checkout.session.completed', 'checkout.session.async_payment_succeeded'}
+SUBSCRIPTION_EVENT_TYPES = {'customer.subscription.created', 'customer.subscription.updated', 'customer.subscription.deleted'}
+HANDLED_EVENT_TYPES = CHECKOUT_EVENT_TYPES | SUBSCRIPTION_EVENT_TYPES
 
 
 class CheckoutNotAllowedError(Exception):
@@ -216,4 +224,120 @@ def sync_entitlement_from_subscription(subscription):
                 'paid_at',
             ]
         )
-    return entitlement
\ No newline at end of file
+    return entitlement
+
+
+def _stripe_event_payload(event):
+    if isinstance(event, dict):
+        return event
+    to_dict = getattr(event, 'to_dict', None)
+    if callable(to_dict):
+        return to_dict()
+    return json.loads(str(event))
+
+
+def _stripe_event_object(payload):
+    event_data = stripe_value(payload, 'data', {}) or {}
+    return stripe_value(event_data, 'object', {}) or {}
+
+
+def record_stripe_event(event):
+    """Store a verified webhook event in the ledger without applying it.
+
+    Returns ``(stripe_event, created)``; ``created`` is False for a redelivery of an event id we already hold.
+    """
+    payload = _stripe_event_payload(event)
+    event_id = stripe_value(payload, 'id')
+    if not event_id:
+        raise ValueError('Stripe event is missing an id.')
+
+    event_type = stripe_value(payload, 'type') or ''
+    handled = event_type in HANDLED_EVENT_TYPES
+    try:
+        return StripeEvent.objects.get_or_create(
+            event_id=event_id,
+            defaults={
+                'event_type': event_type,
+                'object_id': stripe_value(_stripe_event_object(payload), 'id') or '',
+                'stripe_created': int(stripe_value(payload, 'created') or 0),
+                'payload': payload,
+                'status': StripeEvent.Status.PENDING if handled else StripeEvent.Status.IGNORED,
+                'processed_at': None if handled else timezone.now(),
+            },
+        )
+    except IntegrityError:
+        # A concurrent redelivery inserted the same event id first; its row may not be visible to us yet.
+        return StripeEvent.objects.filter(event_id=event_id).first(), False
+
+
+def apply_stripe_event(stripe_event):
+    event_object = _stripe_event_object(stripe_event.payload)
+    if stripe_event.event_type in CHECKOUT_EVENT_TYPES:
+        return sync_entitlement_from_checkout_session(event_object)
+    if stripe_event.event_type in SUBSCRIPTION_EVENT_TYPES:
+        return sync_entitlement_from_subscription(event_object)
+    return None
+
+
+def _is_superseded_subscription_event(stripe_event):
+    # Stripe does not guarantee delivery order, so a late subscription update must not undo a newer one.
+    if stripe_event.event_type not in SUBSCRIPTION_EVENT_TYPES or not stripe_event.object_id:
+        return False
+    return StripeEvent.objects.filter(
+        object_id=stripe_event.object_id,
+        event_type__in=SUBSCRIPTION_EVENT_TYPES,
+        status=StripeEvent.Status.PROCESSED,
+        stripe_created__gt=stripe_event.stripe_created,
+    ).exists()
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=StripeEvent.RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+
+
+def process_next_stripe_event(exclude_ids=()):
+    now = timezone.now()
+    with transaction.atomic():
+        stripe_event = (
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=StripeEvent.Status.PENDING, next_attempt_at__lte=now)
+            .exclude(pk__in=exclude_ids)
+            .order_by('stripe_created', 'id')
+            .first()
+        )
+        if stripe_event is None:
+            return None
+
+        stripe_event.attempts += 1
+        if _is_superseded_subscription_event(stripe_event):
+            stripe_event.status = StripeEvent.Status.IGNORED
+        else:
+            try:
+                with transaction.atomic():
+                    apply_stripe_event(stripe_event)
+            except Exception as exc:
+                logger.exception('Stripe event %s failed on attempt %s', stripe_event.event_id, stripe_event.attempts)
+                stripe_event.last_error = str(exc)
+                if stripe_event.attempts >= StripeEvent.MAX_ATTEMPTS:
+                    stripe_event.status = StripeEvent.Status.FAILED
+                else:
+                    stripe_event.next_attempt_at = now + _retry_delay(stripe_event.attempts)
+                stripe_event.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+                return stripe_event
+            stripe_event.status = StripeEvent.Status.PROCESSED
+
+        stripe_event.last_error = ''
+        stripe_event.processed_at = timezone.now()
+        stripe_event.save(update_fields=['attempts', 'last_error', 'status', 'processed_at'])
+    return stripe_event
+
+
+def process_pending_stripe_events(limit=100):
+    """Apply pending ledger events oldest-first; each event is tried at most once per call."""
+    handled_events = []
+    while len(handled_events) < limit:
+        stripe_event = process_next_stripe_event(exclude_ids=[event.pk for event in handled_events])
+        if stripe_event is None:
+            break
+        handled_events.append(stripe_event)
+    return handled_events
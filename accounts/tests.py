@@ -1,13 +1,22 @@
+import hashlib
+import hmac
+import json
 import re
+import time
 from unittest.mock import patch
 from types import SimpleNamespace
+from datetime import timedelta
 from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.db import IntegrityError
+from django.utils import timezone
 from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import CustomUser, UserEntitlement
-from .services.stripe import create_stripe_checkout_session
+from .models import CustomUser, OutboundEmail, StripeEvent, UserEntitlement
+from .services.email import deliver_pending_emails, queue_email
+from .services.stripe import create_stripe_checkout_session, process_pending_stripe_events
 
 
 @override_settings(
@@ -30,6 +39,8 @@ class PasswordResetFlowTests(APITestCase):
 		response = self.client.post(self.request_url, {'email': self.user.email}, format='json')
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(len(mail.outbox), 0)
+		deliver_pending_emails()
 		self.assertEqual(len(mail.outbox), 1)
 		self.assertIn('reset-password?uid=', mail.outbox[0].body)
 		self.assertIn('&token=', mail.outbox[0].body)
@@ -38,10 +49,13 @@ class PasswordResetFlowTests(APITestCase):
 		response = self.client.post(self.request_url, {'email': 'missing@example.com'}, format='json')
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertFalse(OutboundEmail.objects.exists())
+		deliver_pending_emails()
 		self.assertEqual(len(mail.outbox), 0)
 
 	def test_password_reset_confirm_updates_password(self):
 		self.client.post(self.request_url, {'email': self.user.email}, format='json')
+		deliver_pending_emails()
 		email_body = mail.outbox[0].body
 		match = re.search(r'uid=([^&\s]+)&token=([^\s]+)', email_body)
 
@@ -94,6 +108,8 @@ class EmailVerificationFlowTests(APITestCase):
 		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 		user = CustomUser.objects.get(email='verify@example.com')
 		self.assertFalse(user.email_verified)
+		self.assertEqual(OutboundEmail.objects.filter(to_email='verify@example.com').count(), 1)
+		deliver_pending_emails()
 		self.assertEqual(len(mail.outbox), 1)
 		self.assertIn('verify-email?uid=', mail.outbox[0].body)
 		self.assertIn('&token=', mail.outbox[0].body)
@@ -110,6 +126,7 @@ class EmailVerificationFlowTests(APITestCase):
 			format='json',
 		)
 		self.assertEqual(send_response.status_code, status.HTTP_201_CREATED)
+		deliver_pending_emails()
 		verification_email = mail.outbox[-1].body
 		match = re.search(r'uid=([^&\s]+)&token=([^\s]+)', verification_email)
 		self.assertIsNotNone(match)
@@ -138,6 +155,7 @@ class EmailVerificationFlowTests(APITestCase):
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
 		self.assertEqual(response.data['detail'], 'Verification email sent.')
+		deliver_pending_emails()
 		self.assertEqual(len(mail.outbox), 1)
 
 	def test_resend_verification_email_for_verified_user_returns_already_verified(self):
@@ -153,6 +171,115 @@ class EmailVerificationFlowTests(APITestCase):
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
 		self.assertEqual(response.data['detail'], 'Email is already verified.')
+		deliver_pending_emails()
+		self.assertEqual(len(mail.outbox), 0)
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+	opened_connections = 0
+	failures_remaining = 0
+
+	def open(self):
+		FlakyEmailBackend.opened_connections += 1
+		return super().open()
+
+	def send_messages(self, messages):
+		if FlakyEmailBackend.failures_remaining:
+			FlakyEmailBackend.failures_remaining -= 1
+			raise ConnectionError('SMTP server unavailable')
+		return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='accounts.tests.FlakyEmailBackend')
+class OutboundEmailWorkerTests(APITestCase):
+	def setUp(self):
+		FlakyEmailBackend.opened_connections = 0
+		FlakyEmailBackend.failures_remaining = 0
+
+	def test_batch_is_sent_over_one_connection(self):
+		for index in range(5):
+			queue_email(f'Subject {index}', 'Body', f'user{index}@example.com')
+
+		batch = deliver_pending_emails(batch_size=10)
+
+		self.assertEqual(len(batch), 5)
+		self.assertEqual(FlakyEmailBackend.opened_connections, 1)
+		self.assertEqual(len(mail.outbox), 5)
+		self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.Status.SENT).count(), 5)
+
+	def test_sent_email_body_is_cleared(self):
+		outbound_email = queue_email('Reset your password', 'https://example.com/reset/secret-token', 'reset@example.com')
+
+		deliver_pending_emails()
+
+		outbound_email.refresh_from_db()
+		self.assertEqual(outbound_email.status, OutboundEmail.Status.SENT)
+		self.assertEqual(outbound_email.body, '')
+		self.assertIn('secret-token', mail.outbox[0].body)
+
+	def test_claimed_rows_are_not_redelivered_while_sending(self):
+		outbound_email = queue_email('Subject', 'Body', 'claimed@example.com')
+		claimed_during_send = []
+
+		def send_and_poll(messages):
+			claimed_during_send.append(deliver_pending_emails())
+			return len(messages)
+
+		with patch.object(FlakyEmailBackend, 'send_messages', side_effect=send_and_poll):
+			deliver_pending_emails()
+
+		self.assertEqual(claimed_during_send, [[]])
+		outbound_email.refresh_from_db()
+		self.assertEqual(outbound_email.status, OutboundEmail.Status.SENT)
+
+	def test_claim_expires_when_a_worker_dies(self):
+		outbound_email = queue_email('Subject', 'Body', 'orphan@example.com')
+		claimed_at = timezone.now() - timedelta(seconds=OutboundEmail.CLAIM_SECONDS + 1)
+		OutboundEmail.objects.filter(pk=outbound_email.pk).update(next_attempt_at=claimed_at)
+
+		with patch('accounts.services.email.get_connection', side_effect=SystemExit):
+			with patch('accounts.services.email.timezone.now', return_value=claimed_at):
+				with self.assertRaises(SystemExit):
+					deliver_pending_emails()
+
+		outbound_email.refresh_from_db()
+		self.assertEqual(outbound_email.status, OutboundEmail.Status.PENDING)
+		deliver_pending_emails()
+
+		outbound_email.refresh_from_db()
+		self.assertEqual(outbound_email.status, OutboundEmail.Status.SENT)
+
+	def test_failed_send_is_retried_with_backoff(self):
+		FlakyEmailBackend.failures_remaining = 1
+		outbound_email = queue_email('Subject', 'Body', 'retry@example.com')
+
+		deliver_pending_emails()
+
+		outbound_email.refresh_from_db()
+		self.assertEqual(outbound_email.status, OutboundEmail.Status.PENDING)
+		self.assertEqual(outbound_email.attempts, 1)
+		self.assertEqual(outbound_email.last_error, 'SMTP server unavailable')
+		self.assertGreater(outbound_email.next_attempt_at, timezone.now())
+		self.assertEqual(deliver_pending_emails(), [])
+
+		OutboundEmail.objects.filter(pk=outbound_email.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+		deliver_pending_emails()
+
+		outbound_email.refresh_from_db()
+		self.assertEqual(outbound_email.status, OutboundEmail.Status.SENT)
+		self.assertEqual(len(mail.outbox), 1)
+
+	def test_email_is_marked_failed_after_max_attempts(self):
+		FlakyEmailBackend.failures_remaining = OutboundEmail.MAX_ATTEMPTS
+		outbound_email = queue_email('Subject', 'Body', 'broken@example.com')
+
+		for _ in range(OutboundEmail.MAX_ATTEMPTS):
+			OutboundEmail.objects.filter(pk=outbound_email.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+			deliver_pending_emails()
+
+		outbound_email.refresh_from_db()
+		self.assertEqual(outbound_email.status, OutboundEmail.Status.FAILED)
+		self.assertEqual(outbound_email.attempts, OutboundEmail.MAX_ATTEMPTS)
 		self.assertEqual(len(mail.outbox), 0)
 
 
@@ -271,6 +398,7 @@ class StripeBillingTests(APITestCase):
 	@patch('accounts.views.construct_stripe_event')
 	def test_checkout_completed_webhook_promotes_user_to_both_paid_access(self, mock_construct_event):
 		mock_construct_event.return_value = {
+			'id': 'evt_checkout_both',
 			'type': 'checkout.session.completed',
 			'data': {
 				'object': {
@@ -291,6 +419,7 @@ class StripeBillingTests(APITestCase):
 		)
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		process_pending_stripe_events()
 		self.user.refresh_from_db()
 		self.assertTrue(self.user.has_gcse_paid_access)
 		self.assertTrue(self.user.has_alevel_paid_access)
@@ -307,6 +436,7 @@ class StripeBillingTests(APITestCase):
 		entitlement.save(update_fields=['plan_type', 'stripe_customer_id', 'stripe_subscription_id'])
 
 		mock_construct_event.return_value = {
+			'id': 'evt_subscription_deleted_both',
 			'type': 'customer.subscription.deleted',
 			'data': {
 				'object': {
@@ -326,6 +456,7 @@ class StripeBillingTests(APITestCase):
 		)
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		process_pending_stripe_events()
 		self.user.refresh_from_db()
 		self.assertFalse(self.user.has_gcse_paid_access)
 		self.assertFalse(self.user.has_alevel_paid_access)
@@ -333,6 +464,7 @@ class StripeBillingTests(APITestCase):
 	@patch('accounts.views.construct_stripe_event')
 	def test_checkout_completed_webhook_promotes_user_to_paid(self, mock_construct_event):
 		mock_construct_event.return_value = {
+			'id': 'evt_checkout_alevel',
 			'type': 'checkout.session.completed',
 			'data': {
 				'object': {
@@ -353,6 +485,7 @@ class StripeBillingTests(APITestCase):
 		)
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		process_pending_stripe_events()
 		entitlement = self.user.entitlement
 		entitlement.refresh_from_db()
 		self.assertEqual(entitlement.plan_type, UserEntitlement.PlanType.PAID)
@@ -374,6 +507,7 @@ class StripeBillingTests(APITestCase):
 		entitlement.save(update_fields=['plan_type', 'stripe_customer_id', 'stripe_subscription_id'])
 
 		mock_construct_event.return_value = {
+			'id': 'evt_subscription_deleted_gcse',
 			'type': 'customer.subscription.deleted',
 			'data': {
 				'object': {
@@ -393,12 +527,186 @@ class StripeBillingTests(APITestCase):
 		)
 
 		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		process_pending_stripe_events()
 		entitlement.refresh_from_db()
 		self.user.refresh_from_db()
 		self.assertEqual(entitlement.plan_type, UserEntitlement.PlanType.FREE)
 		self.assertFalse(self.user.has_gcse_paid_access)
 
 
+def _stripe_event_payload(event_id, event_type, event_object, created):
+	return {
+		'id': event_id,
+		'object': 'event',
+		'type': event_type,
+		'created': created,
+		'data': {'object': event_object},
+	}
+
+
+def _stripe_signature_header(payload, secret='whsec_123'):
+	# Mirrors Stripe's v1 scheme so the real construct_event path verifies locally.
+	timestamp = int(time.time())
+	signed_payload = f'{timestamp}.{payload}'.encode('utf-8')
+	signature = hmac.new(secret.encode('utf-8'), signed_payload, hashlib.sha256).hexdigest()
+	return f't={timestamp},v1={signature}'
+
+
+@override_settings(
+	STRIPE_SECRET_KEY='sk_test_123',
+	STRIPE_WEBHOOK_SECRET='whsec_123',
+)
+class StripeWebhookLedgerTests(APITestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create_user(
+			email='ledger@example.com',
+			username='ledger-user',
+			password='LedgerPass123',
+		)
+		self.webhook_url = reverse('stripe-webhook')
+
+	def _post_event(self, payload):
+		body = json.dumps(payload)
+		return self.client.post(
+			self.webhook_url,
+			data=body,
+			content_type='application/json',
+			HTTP_STRIPE_SIGNATURE=_stripe_signature_header(body),
+		)
+
+	def _checkout_event(self, event_id, created=1700000000):
+		return _stripe_event_payload(
+			event_id,
+			'checkout.session.completed',
+			{
+				'id': 'cs_ledger',
+				'customer': 'cus_ledger',
+				'subscription': 'sub_ledger',
+				'client_reference_id': str(self.user.id),
+				'metadata': {'plan_type': UserEntitlement.PlanType.PAID, 'qualification': 'GCSE_SCIENCE'},
+			},
+			created,
+		)
+
+	def _subscription_event(self, event_id, subscription_status, created):
+		return _stripe_event_payload(
+			event_id,
+			'customer.subscription.updated',
+			{
+				'id': 'sub_ledger',
+				'customer': 'cus_ledger',
+				'status': subscription_status,
+				'metadata': {'qualification': 'GCSE_SCIENCE'},
+			},
+			created,
+		)
+
+	def test_webhook_records_event_without_applying_it(self):
+		response = self._post_event(self._checkout_event('evt_ledger_1'))
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertFalse(response.data['duplicate'])
+		self.assertEqual(StripeEvent.objects.get(event_id='evt_ledger_1').status, StripeEvent.Status.PENDING)
+		self.user.refresh_from_db()
+		self.assertFalse(self.user.has_gcse_paid_access)
+
+		process_pending_stripe_events()
+
+		self.user.refresh_from_db()
+		self.assertTrue(self.user.has_gcse_paid_access)
+		self.assertEqual(StripeEvent.objects.get(event_id='evt_ledger_1').status, StripeEvent.Status.PROCESSED)
+
+	def test_invalid_signature_is_rejected_and_not_recorded(self):
+		response = self.client.post(
+			self.webhook_url,
+			data=json.dumps(self._checkout_event('evt_forged')),
+			content_type='application/json',
+			HTTP_STRIPE_SIGNATURE='t=1,v1=forged',
+		)
+
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertFalse(StripeEvent.objects.exists())
+
+	@patch('accounts.services.stripe.sync_entitlement_from_checkout_session')
+	def test_replayed_event_ids_are_applied_once(self, mock_sync_checkout):
+		payload = self._checkout_event('evt_replayed')
+		responses = [self._post_event(payload) for _ in range(25)]
+
+		self.assertTrue(all(response.status_code == status.HTTP_200_OK for response in responses))
+		self.assertEqual([response.data['duplicate'] for response in responses].count(False), 1)
+		self.assertEqual(StripeEvent.objects.count(), 1)
+
+		process_pending_stripe_events()
+		process_pending_stripe_events()
+
+		mock_sync_checkout.assert_called_once()
+
+	def test_events_apply_in_stripe_created_order_and_stale_updates_are_ignored(self):
+		self._post_event(self._checkout_event('evt_checkout', created=100))
+		self._post_event(self._subscription_event('evt_sub_cancelled', 'canceled', created=300))
+		self._post_event(self._subscription_event('evt_sub_active', 'active', created=200))
+
+		handled = process_pending_stripe_events()
+
+		self.assertEqual([event.event_id for event in handled], ['evt_checkout', 'evt_sub_active', 'evt_sub_cancelled'])
+		self.user.refresh_from_db()
+		self.assertFalse(self.user.has_gcse_paid_access)
+
+		late_active = self._subscription_event('evt_sub_late_active', 'active', created=250)
+		self._post_event(late_active)
+		process_pending_stripe_events()
+
+		self.assertEqual(StripeEvent.objects.get(event_id='evt_sub_late_active').status, StripeEvent.Status.IGNORED)
+		self.user.refresh_from_db()
+		self.assertFalse(self.user.has_gcse_paid_access)
+
+	def test_unhandled_event_types_are_recorded_as_ignored(self):
+		self._post_event(_stripe_event_payload('evt_invoice', 'invoice.created', {'id': 'in_1'}, 100))
+
+		self.assertEqual(StripeEvent.objects.get(event_id='evt_invoice').status, StripeEvent.Status.IGNORED)
+		self.assertEqual(process_pending_stripe_events(), [])
+
+	@patch('accounts.services.stripe.sync_entitlement_from_checkout_session')
+	def test_failed_events_are_retried_then_marked_failed(self, mock_sync_checkout):
+		mock_sync_checkout.side_effect = RuntimeError('database unavailable')
+		self._post_event(self._checkout_event('evt_failing'))
+
+		for _ in range(StripeEvent.MAX_ATTEMPTS):
+			process_pending_stripe_events()
+			StripeEvent.objects.filter(status=StripeEvent.Status.PENDING).update(next_attempt_at=timezone.now())
+
+		stripe_event = StripeEvent.objects.get(event_id='evt_failing')
+		self.assertEqual(stripe_event.status, StripeEvent.Status.FAILED)
+		self.assertEqual(stripe_event.attempts, StripeEvent.MAX_ATTEMPTS)
+		self.assertEqual(stripe_event.last_error, 'database unavailable')
+		self.assertEqual(mock_sync_checkout.call_count, StripeEvent.MAX_ATTEMPTS)
+
+	@patch('accounts.services.stripe.sync_entitlement_from_checkout_session')
+	def test_failed_events_back_off_before_retrying(self, mock_sync_checkout):
+		mock_sync_checkout.side_effect = RuntimeError('database unavailable')
+		self._post_event(self._checkout_event('evt_backoff'))
+
+		process_pending_stripe_events()
+		process_pending_stripe_events()
+
+		stripe_event = StripeEvent.objects.get(event_id='evt_backoff')
+		self.assertEqual(stripe_event.status, StripeEvent.Status.PENDING)
+		self.assertEqual(stripe_event.attempts, 1)
+		self.assertGreater(stripe_event.next_attempt_at, timezone.now())
+		self.assertEqual(mock_sync_checkout.call_count, 1)
+
+	def test_concurrent_redelivery_is_reported_as_duplicate(self):
+		payload = self._checkout_event('evt_race')
+		self._post_event(payload)
+
+		with patch('accounts.services.stripe.StripeEvent.objects.get_or_create', side_effect=IntegrityError):
+			response = self._post_event(payload)
+
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertTrue(response.data['duplicate'])
+		self.assertEqual(StripeEvent.objects.filter(event_id='evt_race').count(), 1)
+
+
 class PerformanceTrackingResetTests(APITestCase):
 	def setUp(self):
 		self.user = CustomUser.objects.create_user(
@@ -3,20 +3,20 @@ from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
+from django.db import transaction
 from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 import stripe
 import logging
 from .models import CustomUser
+from .services.email import queue_email
 from .services.stripe import (
     CheckoutNotAllowedError,
     create_stripe_checkout_session,
     construct_stripe_event,
+    record_stripe_event,
     stripe_value,
-    sync_entitlement_from_checkout_session,
-    sync_entitlement_from_subscription,
 )
 from .serializers import (
     CustomUserSerializer,
@@ -44,13 +44,7 @@ def send_email_verification_email(user):
         f'Verify your email address using this link:\n{verification_link}\n\n'
         'If you did not create this account, you can ignore this email.'
     )
-    send_mail(
-        subject='Verify your ExamBuilder email',
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[user.email],
-        fail_silently=False,
-    )
+    return queue_email('Verify your ExamBuilder email', message, user.email)
 
 
 class UserRegistrationAPIView(GenericAPIView):
@@ -60,8 +54,9 @@ class UserRegistrationAPIView(GenericAPIView):
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception = True)
-        user = serializer.save()
-        send_email_verification_email(user)
+        with transaction.atomic():
+            user = serializer.save()
+            send_email_verification_email(user)
         token = RefreshToken.for_user(user)
         data = {
             'user': CustomUserSerializer(user).data,
@@ -160,13 +155,7 @@ class PasswordResetRequestAPIView(GenericAPIView):
             f'Use this link to reset your password:\n{reset_link}\n\n'
             'If you did not request this, you can ignore this email.'
         )
-        send_mail(
-            subject='Reset your ExamBuilder password',
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
+        return queue_email('Reset your ExamBuilder password', message, user.email)
 
 
 class PasswordResetConfirmAPIView(GenericAPIView):
@@ -267,17 +256,13 @@ class StripeWebhookAPIView(GenericAPIView):
             logger.exception('Unexpected Stripe webhook validation failure')
             return Response({'detail': 'Unexpected error while validating Stripe webhook.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        event_type = stripe_value(event, 'type')
-        event_data = stripe_value(event, 'data', {}) or {}
-        event_object = stripe_value(event_data, 'object', {}) or {}
-
         try:
-            if event_type in {'checkout.session.completed', 'checkout.session.async_payment_succeeded'}:
-                sync_entitlement_from_checkout_session(event_object)
-            elif event_type in {'customer.subscription.created', 'customer.subscription.updated', 'customer.subscription.deleted'}:
-                sync_entitlement_from_subscription(event_object)
+            _, created = record_stripe_event(event)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception:
-            logger.exception('Unexpected Stripe webhook processing failure for event %s', event_type)
-            return Response({'detail': 'Unexpected error while processing Stripe webhook.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.exception('Unexpected failure while recording Stripe webhook event')
+            return Response({'detail': 'Unexpected error while recording Stripe webhook.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        return Response({'received': True}, status=status.HTTP_200_OK)
\ No newline at end of file
+        # Entitlement changes are applied by the process_stripe_events worker, not in the request.
+        return Response({'received': True, 'duplicate': not created}, status=status.HTTP_200_OK)
@@ -0,0 +1,211 @@
+"""Lightweight request instrumentation: ``span()`` timings, Server-Timing headers, and a Prometheus endpoint.
+
+Metrics live in process memory. Under gunicorn each worker keeps its own registry, so a scrape reports the
+worker that served it; rates and quantiles are still correct when Prometheus aggregates across scrapes.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_spans = ContextVar("request_spans", default=None)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}" for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames))
+        return series["count"] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(series, counts=list(series["counts"]))) for key, series in self._series.items())
+
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series["counts"]):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, extra=[("le", _format_number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    "exambuilder_http_requests_total",
+    "HTTP requests handled, by route and status code.",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    "exambuilder_http_request_duration_seconds",
+    "Wall-clock time to produce the response, by route.",
+    ("method", "route"),
+)
+PHASE_DURATION = registry.histogram(
+    "exambuilder_phase_duration_seconds",
+    "Time spent in named phases of a request or job, such as llm or quota.",
+    ("phase",),
+)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as phase ``name``.
+
+    The duration always feeds the phase histogram; inside a request it is also reported in ``Server-Timing``.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        PHASE_DURATION.observe(elapsed, phase=name)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def format_server_timing(spans, total_seconds):
+    totals = {}
+    for name, elapsed in spans:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """Collect spans for each request, add a ``Server-Timing`` header, and record request metrics."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _request_spans.set([])
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - started
+            spans = _request_spans.get()
+        finally:
+            _request_spans.reset(token)
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "unmatched"
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        HTTP_REQUEST_DURATION.observe(elapsed, method=request.method, route=route)
+        response["Server-Timing"] = format_server_timing(spans, elapsed)
+        return response
+
+
+def metrics_view(request):
+    """Expose the registry in Prometheus text format.
+
+    When ``METRICS_AUTH_TOKEN`` is set a matching bearer token is required; without one the endpoint only
+    answers in DEBUG.
+    """
+    expected_token = getattr(settings, "METRICS_AUTH_TOKEN", "")
+    if expected_token:
+        if request.headers.get("Authorization", "") != f"Bearer {expected_token}":
+            return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    elif not settings.DEBUG:
+        raise Http404()
+
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -2,6 +2,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 from datetime import timedelta
 import dj_database_url
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -75,6 +76,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "exambuilder.metrics.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",   
     "corsheaders.middleware.CorsMiddleware",        
@@ -196,6 +198,62 @@ STRIPE_CHECKOUT_MODE = os.getenv('STRIPE_CHECKOUT_MODE', 'payment')
 STRIPE_SUCCESS_URL = os.getenv('STRIPE_SUCCESS_URL', f'{FRONTEND_URL}/account?checkout=success')
 STRIPE_CANCEL_URL = os.getenv('STRIPE_CANCEL_URL', f'{FRONTEND_URL}/account?checkout=cancelled')
 
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 60 * 60)))
+# Kept short: a waiting duplicate holds a web worker, so after this it gets 409 with Retry-After instead.
+IDEMPOTENCY_WAIT_TIMEOUT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT_SECONDS', '2'))
+# An in-progress key older than this is treated as abandoned by a dead worker and can be claimed again.
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '300'))
+
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN', '')
+
+# Split question generation into concurrent completions of at most this many questions; 0 keeps a single call.
+QUESTION_GENERATION_SHARD_SIZE = int(os.getenv('QUESTION_GENERATION_SHARD_SIZE', '0'))
+QUESTION_GENERATION_MAX_CONCURRENCY = int(os.getenv('QUESTION_GENERATION_MAX_CONCURRENCY', '4'))
+# Serve validated AI questions generated for other users in the same scope before asking the model for more.
+# Off by default: turning it on changes which questions students see, so enable it per deployment.
+SHARED_QUESTION_POOL_ENABLED = env_to_bool('SHARED_QUESTION_POOL_ENABLED', default=False)
+# Shingle similarity at which a question counts as a near-duplicate of one already served; 0 matches exact text only.
+QUESTION_NEAR_DUPLICATE_THRESHOLD = float(os.getenv('QUESTION_NEAR_DUPLICATE_THRESHOLD', '0.5'))
+# Seconds between checks of a fallback bank file for changes; edited banks are reloaded without a restart.
+FALLBACK_BANK_RELOAD_SECONDS = float(os.getenv('FALLBACK_BANK_RELOAD_SECONDS', '5'))
+
+# LLM provider (examquestions/services/llm_provider.py). 'local' answers deterministically without calling OpenAI.
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+# HTTP/2 is only used when the optional h2 package is installed.
+LLM_HTTP2 = env_to_bool('LLM_HTTP2', default=True)
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '10'))
+LLM_KEEPALIVE_SECONDS = float(os.getenv('LLM_KEEPALIVE_SECONDS', '60'))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv('LLM_CONNECT_TIMEOUT_SECONDS', '5'))
+LLM_READ_TIMEOUT_SECONDS = float(os.getenv('LLM_READ_TIMEOUT_SECONDS', '60'))
+LLM_POOL_TIMEOUT_SECONDS = float(os.getenv('LLM_POOL_TIMEOUT_SECONDS', '10'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv('LLM_RETRY_BACKOFF_SECONDS', '0.5'))
+# Pause calls to a model after this many consecutive transient failures; 0 disables the breaker.
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', '5'))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+# Identical requests for these purposes are answered from the Django cache; 0 seconds disables the cache.
+LLM_RESPONSE_CACHE_SECONDS = int(os.getenv('LLM_RESPONSE_CACHE_SECONDS', '0'))
+LLM_RESPONSE_CACHE_PURPOSES = [
+    purpose.strip() for purpose in os.getenv('LLM_RESPONSE_CACHE_PURPOSES', 'mark,batch_mark').split(',') if purpose.strip()
+]
+# Model routes as a JSON list of {"name", "models", "services", "purposes", "max_marks"}; empty uses DEFAULT_ROUTES
+# in examquestions/services/model_routing.py. A model over either limit is passed over while a healthier one exists.
+LLM_MODEL_ROUTES = json.loads(os.getenv('LLM_MODEL_ROUTES', '[]'))
+LLM_ROUTE_MAX_ERROR_RATE = float(os.getenv('LLM_ROUTE_MAX_ERROR_RATE', '0.5'))
+LLM_ROUTE_MAX_P95_SECONDS = float(os.getenv('LLM_ROUTE_MAX_P95_SECONDS', '20'))
+# LLMCall telemetry rows are buffered and bulk inserted when a request finishes or this many are waiting.
+LLM_TELEMETRY_FLUSH_SIZE = int(os.getenv('LLM_TELEMETRY_FLUSH_SIZE', '50'))
+# Single answers to questions worth up to PREMARK_MAX_MARKS are marked locally when the match is unambiguous.
+# Off until `premark_benchmark --with-llm` has confirmed agreement with the model.
+PREMARK_ENABLED = env_to_bool('PREMARK_ENABLED', default=False)
+PREMARK_MAX_MARKS = int(os.getenv('PREMARK_MAX_MARKS', '3'))
+# 'record' appends every upstream response to LLM_CASSETTE_PATH; 'replay' answers from it without calling the backend.
+LLM_CASSETTE_MODE = os.getenv('LLM_CASSETTE_MODE', '')
+LLM_CASSETTE_PATH = os.getenv('LLM_CASSETTE_PATH', str(BASE_DIR / 'llm_cassette.jsonl.gz'))
+# 'recorded' replays with the original latency; 'none' answers immediately.
+LLM_CASSETTE_REPLAY_LATENCY = os.getenv('LLM_CASSETTE_REPLAY_LATENCY', 'none')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('api/', include('examquestions.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
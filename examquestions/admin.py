@@ -1,12 +1,19 @@
 from django.contrib import admin
 from .models import (
     QuestionSession,
+    SessionQuestion,
+    AnswerResult,
     BiologyTopic,
     BiologySubTopic,
     BiologySubCategory,
     GCSEScienceTopic,
     GCSEScienceSubTopic,
     GCSEScienceSubCategory,
+    Job,
+    SharedQuestion,
+    IdempotencyRecord,
+    LLMCall,
+    LLMCallRollup,
 )
 
 
@@ -18,6 +25,20 @@ class FeedbackAdmin(admin.ModelAdmin):
     ordering = ("-created_at",)
 
 
+@admin.register(SessionQuestion)
+class SessionQuestionAdmin(admin.ModelAdmin):
+    list_display = ("session", "position", "marks", "question")
+    search_fields = ("question",)
+    raw_id_fields = ("session",)
+
+
+@admin.register(AnswerResult)
+class AnswerResultAdmin(admin.ModelAdmin):
+    list_display = ("session", "position", "user", "scope_title", "score", "out_of", "marked_by", "created_at")
+    list_filter = ("qualification", "exam_board", "marked_by")
+    raw_id_fields = ("session", "question", "user")
+
+
 @admin.register(BiologyTopic)
 class BiologyTopicAdmin(admin.ModelAdmin):
     list_display = ("topic",)
@@ -55,4 +76,42 @@ class GCSEScienceSubTopicAdmin(admin.ModelAdmin):
 class GCSEScienceSubCategoryAdmin(admin.ModelAdmin):
     list_display = ("title", "subtopic")
     search_fields = ("title",)
-    list_filter = ("subtopic__topic__subject", "subtopic__topic__tier", "subtopic__topic__exam_board")
\ No newline at end of file
+    list_filter = ("subtopic__topic__subject", "subtopic__topic__tier", "subtopic__topic__exam_board")
+
+
+@admin.register(SharedQuestion)
+class SharedQuestionAdmin(admin.ModelAdmin):
+    list_display = ("exam_board", "scope_key", "served_count", "created_at", "normalized_question")
+    list_filter = ("exam_board",)
+    search_fields = ("scope_key", "normalized_question")
+    readonly_fields = ("created_at",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "kind", "status", "result_status_code", "attempts", "worker_id", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    search_fields = ("user__email", "worker_id")
+    readonly_fields = ("created_at", "started_at", "finished_at")
+
+
+@admin.register(IdempotencyRecord)
+class IdempotencyRecordAdmin(admin.ModelAdmin):
+    list_display = ("user", "endpoint", "key", "status", "response_status_code", "created_at", "expires_at")
+    list_filter = ("endpoint", "status")
+    search_fields = ("user__email", "key")
+    readonly_fields = ("created_at",)
+
+
+@admin.register(LLMCall)
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "service", "purpose", "model", "item_count", "prompt_tokens", "completion_tokens", "latency_ms", "cost_usd", "outcome")
+    list_filter = ("service", "purpose", "model", "outcome")
+    readonly_fields = ("created_at",)
+
+
+@admin.register(LLMCallRollup)
+class LLMCallRollupAdmin(admin.ModelAdmin):
+    list_display = ("date", "service", "purpose", "model", "calls", "errors", "items", "prompt_tokens", "completion_tokens", "cost_usd", "latency_p50_ms", "latency_p95_ms")
+    list_filter = ("service", "purpose", "model")
+    date_hierarchy = "date"
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from examquestions.services.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+
+def add_fake_openai_arguments(parser):
+    defaults = FakeOpenAIConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="Mean time to first token in milliseconds.")
+    parser.add_argument("--latency-jitter-ms", type=float, default=defaults.latency_jitter_ms, help="Standard deviation of the time to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second, help="Simulated decode rate for completion tokens.")
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens_mean, help="Median completion length in tokens (log-normal).")
+    parser.add_argument("--completion-tokens-sigma", type=float, default=defaults.completion_tokens_sigma, help="Log-normal sigma for completion length.")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Fraction of calls answered with a 500. Defaults to 0.")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible latency and token draws.")
+
+
+def fake_openai_config_from_options(options):
+    return FakeOpenAIConfig(
+        latency_ms=options["latency_ms"],
+        latency_jitter_ms=options["latency_jitter_ms"],
+        tokens_per_second=options["tokens_per_second"],
+        completion_tokens_mean=options["completion_tokens"],
+        completion_tokens_sigma=options["completion_tokens_sigma"],
+        error_rate=options["error_rate"],
+        seed=options.get("seed"),
+    )
+
+
+class Command(BaseCommand):
+    help = "Run a local OpenAI-compatible stand-in that returns canned JSON after a simulated delay."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Interface to bind. Defaults to 127.0.0.1.")
+        parser.add_argument("--port", type=int, default=8765, help="Port to listen on. Defaults to 8765.")
+        add_fake_openai_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = FakeOpenAIServer((options["host"], options["port"]), fake_openai_config_from_options(options))
+        self.stdout.write(f"Fake OpenAI listening on {server.base_url}")
+        self.stdout.write(f"Start the app with OPENAI_BASE_URL={server.base_url} to use it.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,43 @@
+from pathlib import Path
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from examquestions import views
+from examquestions.services.fallback_banks import fallback_banks
+
+
+def _configured_bank_paths():
+    paths = list(views.FALLBACK_QUESTION_PATHS.values())
+    for subject_paths in views.GCSE_FALLBACK_PATHS_BY_BOARD.values():
+        paths.extend(subject_paths.values())
+    return sorted({str(path) for path in paths})
+
+
+class Command(BaseCommand):
+    help = "Load every configured fallback bank and report its load time, memory and the cost of a change check."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=1000, help="Unchanged-file checks to time per bank.")
+
+    def handle(self, *args, **options):
+        if options["checks"] < 1:
+            raise CommandError("--checks must be at least 1.")
+        total_memory = 0
+        for path in _configured_bank_paths():
+            loaded = fallback_banks.refresh(path)
+            if loaded is None:
+                self.stdout.write(f"{path}: not loaded, see the log")
+                continue
+            started = time.perf_counter()
+            for _ in range(options["checks"]):
+                fallback_banks.refresh(path)
+            check_us = (time.perf_counter() - started) / options["checks"] * 1_000_000
+            items = sum(len(section) for section in loaded.bank.values())
+            total_memory += loaded.memory_bytes
+            self.stdout.write(
+                f"{Path(path).name}: {len(loaded.bank)} sections, {items} items, "
+                f"sha256 {loaded.sha256[:12]}, load {loaded.load_seconds * 1000:.1f} ms, "
+                f"memory {loaded.memory_bytes / 1_000_000:.2f} MB, unchanged check {check_us:.1f} us"
+            )
+        self.stdout.write(f"Total bank memory: {total_memory / 1_000_000:.2f} MB")
@@ -0,0 +1,81 @@
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from examquestions import views
+from examquestions.models import (
+    BiologySubCategory,
+    BiologySubTopic,
+    BiologyTopic,
+    GCSEScienceSubCategory,
+    GCSEScienceSubTopic,
+    GCSEScienceTopic,
+)
+from examquestions.services.scope_index import bank_scope_keys
+
+
+def _curriculum_scopes():
+    """``(bank path, scope title, scope key, topic title)`` for every topic, subtopic and subcategory."""
+    def alevel_scope(topic, subtopic=None, subcategory=None):
+        path = views.FALLBACK_QUESTION_PATHS.get(topic.exam_board)
+        return (path, *views.build_scope_metadata(topic, subtopic, subcategory), topic.topic)
+
+    def gcse_scope(topic, subtopic=None, subcategory=None):
+        path = views.resolve_gcse_fallback_bank_path(topic.exam_board, topic.subject)
+        return (path, *views.build_gcse_scope_metadata(topic, subtopic, subcategory, topic.tier), topic.topic)
+
+    for scope, topic_model, subtopic_model, subcategory_model in (
+        (alevel_scope, BiologyTopic, BiologySubTopic, BiologySubCategory),
+        (gcse_scope, GCSEScienceTopic, GCSEScienceSubTopic, GCSEScienceSubCategory),
+    ):
+        for topic in topic_model.objects.all():
+            yield scope(topic)
+        for subtopic in subtopic_model.objects.select_related("topic"):
+            yield scope(subtopic.topic, subtopic)
+        for subcategory in subcategory_model.objects.select_related("subtopic__topic"):
+            yield scope(subcategory.subtopic.topic, subcategory.subtopic, subcategory)
+
+
+class Command(BaseCommand):
+    help = "Index every curriculum scope against the fallback banks and list fuzzy matches and unmapped scopes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--show", type=int, default=50, help="Scopes to list per section. Defaults to 50.")
+
+    def handle(self, *args, **options):
+        outcomes = Counter()
+        fuzzy, unmapped = [], []
+        seen_fuzzy = set()
+        for path, scope_title, scope_key, topic_title in _curriculum_scopes():
+            if path is None:
+                outcomes["no bank"] += 1
+                continue
+            bank = views.load_fallback_bank_from_path(str(path))
+            entry = bank_scope_keys(bank, scope_key, scope_title, topic_title)
+            if entry.scope_match.key is not None:
+                outcomes[entry.scope_match.method] += 1
+            elif entry.topic_match.key is not None:
+                outcomes["topic section"] += 1
+            else:
+                outcomes["unmapped"] += 1
+                unmapped.append((scope_key, scope_title, Path(path).name))
+            for match, title in ((entry.scope_match, scope_title), (entry.topic_match, topic_title)):
+                if match.method == "fuzzy" and (title, match.key) not in seen_fuzzy:
+                    seen_fuzzy.add((title, match.key))
+                    fuzzy.append((scope_key, title, match.key, Path(path).name))
+
+        total = sum(outcomes.values())
+        counts = "  ".join(
+            f"{label}: {outcomes[label]}"
+            for label in ("exact", "normalized", "fuzzy", "topic section", "unmapped", "no bank")
+        )
+        self.stdout.write(f"Scopes: {total}  {counts}")
+        if fuzzy:
+            self.stdout.write("Fuzzy matches, worth checking:")
+            for scope_key, title, bank_key, bank_name in fuzzy[: options["show"]]:
+                self.stdout.write(f"  {scope_key} {title!r} -> {bank_key!r} ({bank_name})")
+        if unmapped:
+            self.stdout.write("Unmapped scopes (A-level has no fallback; GCSE uses the generic pool):")
+            for scope_key, title, bank_name in unmapped[: options["show"]]:
+                self.stdout.write(f"  {scope_key} {title!r} ({bank_name})")
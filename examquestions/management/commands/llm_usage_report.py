@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from examquestions.services.llm_telemetry import prune_llm_calls, rollup_llm_calls, summarize_llm_calls
+
+
+class Command(BaseCommand):
+    help = "Report OpenAI calls, tokens per question, cost and latency percentiles, and optionally roll up and prune raw rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="How many days of raw calls to report on. Defaults to 7.",
+        )
+        parser.add_argument(
+            "--rollup",
+            action="store_true",
+            help="Write daily LLMCallRollup rows for each complete day in the window.",
+        )
+        parser.add_argument(
+            "--prune-after-days",
+            type=int,
+            help="Delete raw LLMCall rows older than this many days. Requires --rollup.",
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        prune_after_days = options.get("prune_after_days")
+        if days <= 0:
+            raise CommandError("--days must be positive.")
+        if prune_after_days is not None and not options["rollup"]:
+            raise CommandError("--prune-after-days only runs together with --rollup so no data is lost.")
+
+        if options["rollup"]:
+            today = timezone.localdate()
+            for offset in range(days, 0, -1):
+                day = today - timedelta(days=offset)
+                groups = rollup_llm_calls(day)
+                if groups:
+                    self.stdout.write(f"Rolled up {groups} group(s) for {day}")
+            if prune_after_days is not None:
+                deleted = prune_llm_calls(prune_after_days)
+                self.stdout.write(f"Pruned {deleted} raw call(s) older than {prune_after_days} day(s)")
+
+        summaries = summarize_llm_calls(timezone.now() - timedelta(days=days))
+        if not summaries:
+            self.stdout.write(f"No LLM calls recorded in the last {days} day(s).")
+            return
+
+        self.stdout.write(
+            f"{'service':<8} {'purpose':<11} {'model':<14} {'calls':>6} {'errs':>5} {'items':>6} "
+            f"{'tok/item':>9} {'prompt':>9} {'cached':>7} {'complete':>9} {'cost $':>9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}"
+        )
+        for summary in summaries:
+            self.stdout.write(
+                f"{summary['service']:<8} {summary['purpose']:<11} {summary['model']:<14} {summary['calls']:>6} "
+                f"{summary['errors']:>5} {summary['items']:>6} {summary['tokens_per_item']:>9} "
+                f"{summary['prompt_tokens']:>9} {summary['cached_ratio']:>7.1%} {summary['completion_tokens']:>9} {summary['cost_usd']:>9.4f} "
+                f"{summary['latency_p50_ms']:>7} {summary['latency_p95_ms']:>7} {summary['latency_p99_ms']:>7}"
+            )
@@ -0,0 +1,209 @@
+from datetime import datetime, timezone as dt_timezone
+import json
+import os
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import requests
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import CustomUser
+from examquestions.management.commands.fake_openai_server import (
+    add_fake_openai_arguments,
+    fake_openai_config_from_options,
+)
+from examquestions.models import BiologyTopic, ExamBoard
+from examquestions.services.fake_openai import start_fake_openai_server
+from examquestions.services.llm_cassette import REPLAY_LATENCIES
+from examquestions.services.load_benchmark import DEFAULT_MIX, BenchmarkTarget, parse_mix, run_benchmark
+
+
+BENCHMARK_USER_EMAIL = "loadbench@example.com"
+SERVER_START_TIMEOUT_SECONDS = 30
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class Command(BaseCommand):
+    help = "Load-test the question API against a local fake OpenAI server or a recorded cassette and append p50/p95/p99 and RPS per endpoint to a results file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to drive load for. Defaults to 30.")
+        parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of single-worker warmup excluded from results. Defaults to 3.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Number of closed-loop client threads. Defaults to 8.")
+        parser.add_argument(
+            "--mix",
+            help=f"Endpoint weights, e.g. 'generate=2,mark=4'. Defaults to {','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())}.",
+        )
+        parser.add_argument("--base-url", help="Benchmark an already running app instead of starting one (it must already point at a fake OpenAI).")
+        parser.add_argument("--server", choices=["runserver", "gunicorn"], default="gunicorn", help="How to start the app. Defaults to gunicorn, as in the Procfile.")
+        parser.add_argument("--gunicorn-workers", type=int, default=2, help="gunicorn worker processes. Defaults to 2.")
+        parser.add_argument("--gunicorn-threads", type=int, default=4, help="gunicorn threads per worker. Defaults to 4.")
+        parser.add_argument("--label", default="", help="Free-text label stored with the run, e.g. a branch name.")
+        parser.add_argument(
+            "--output",
+            default="loadbench_results.jsonl",
+            help="JSON Lines file to append the run to. Relative paths are resolved from BASE_DIR.",
+        )
+        parser.add_argument("--cassette", help="Replay LLM responses from this cassette instead of starting the fake OpenAI server.")
+        parser.add_argument(
+            "--cassette-latency",
+            choices=REPLAY_LATENCIES,
+            default="recorded",
+            help="Replay with the recorded latency, or none to measure only the app's own overhead. Defaults to recorded.",
+        )
+        add_fake_openai_arguments(parser)
+
+    def handle(self, *args, **options):
+        if os.getenv("DYNO"):
+            raise CommandError("Refusing to run the load benchmark on Heroku; it writes benchmark users and sessions to the database.")
+
+        try:
+            mix = parse_mix(options.get("mix"))
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        fake_config = fake_openai_config_from_options(options)
+        fake_server = None
+        app_process = None
+        base_url = options.get("base_url")
+        cassette = options.get("cassette")
+        if cassette and not Path(cassette).exists():
+            raise CommandError(f"Cassette {cassette} does not exist; record one with LLM_CASSETTE_MODE=record.")
+
+        try:
+            if not base_url and cassette:
+                base_url, app_process = self._start_app(
+                    options,
+                    {
+                        "LLM_CASSETTE_MODE": "replay",
+                        "LLM_CASSETTE_PATH": str(Path(cassette).resolve()),
+                        "LLM_CASSETTE_REPLAY_LATENCY": options["cassette_latency"],
+                    },
+                )
+                self.stdout.write(f"App on {base_url}, replaying {cassette}")
+            elif not base_url:
+                fake_server = start_fake_openai_server(fake_config)
+                base_url, app_process = self._start_app(options, {"OPENAI_BASE_URL": fake_server.base_url})
+                self.stdout.write(f"App on {base_url}, fake OpenAI on {fake_server.base_url}")
+
+            target = self._prepare_target(base_url)
+            summary = run_benchmark(
+                target,
+                mix,
+                duration_seconds=options["duration"],
+                concurrency=options["concurrency"],
+                seed=options.get("seed"),
+                warmup_seconds=options["warmup"],
+            )
+        finally:
+            if app_process is not None:
+                app_process.terminate()
+                app_process.wait(timeout=10)
+            if fake_server is not None:
+                fake_server.shutdown()
+                fake_server.server_close()
+
+        result = {
+            "label": options["label"],
+            "git_commit": _git_commit(),
+            "finished_at": datetime.now(dt_timezone.utc).isoformat(),
+            "base_url": base_url,
+            "server": None if options.get("base_url") else options["server"],
+            "duration_seconds": options["duration"],
+            "concurrency": options["concurrency"],
+            "mix": mix,
+            "fake_openai": None if options.get("base_url") or cassette else vars(fake_config),
+            "cassette": {"path": cassette, "latency": options["cassette_latency"]} if cassette else None,
+            **summary,
+        }
+        output_path = Path(options["output"])
+        if not output_path.is_absolute():
+            output_path = Path(settings.BASE_DIR) / output_path
+        with output_path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(result) + "\n")
+
+        self._write_table(summary)
+        self.stdout.write(self.style.SUCCESS(f"Appended results to {output_path}"))
+
+    def _start_app(self, options, llm_env):
+        port = _free_port()
+        env = os.environ.copy()
+        env.update(llm_env)
+        env.setdefault("OPENAI_API_KEY", "loadbench")
+
+        if options["server"] == "gunicorn":
+            command = [
+                sys.executable, "-m", "gunicorn", "exambuilder.wsgi",
+                "--bind", f"127.0.0.1:{port}",
+                "--workers", str(options["gunicorn_workers"]),
+                "--threads", str(options["gunicorn_threads"]),
+            ]
+        else:
+            command = [sys.executable, "manage.py", "runserver", f"127.0.0.1:{port}", "--noreload"]
+
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"The app exited during startup with code {process.returncode}.")
+            try:
+                requests.get(f"{base_url}/api/biology-topics/", timeout=1)
+                return base_url, process
+            except requests.RequestException:
+                time.sleep(0.2)
+
+        process.terminate()
+        raise CommandError(f"The app did not start listening within {SERVER_START_TIMEOUT_SECONDS} seconds.")
+
+    def _prepare_target(self, base_url):
+        user, _ = CustomUser.objects.get_or_create(
+            email=BENCHMARK_USER_EMAIL,
+            defaults={"username": "loadbench", "email_verified": True},
+        )
+        if not user.has_alevel_paid_access:
+            user.has_alevel_paid_access = True
+            user.save(update_fields=["has_alevel_paid_access"])
+
+        topic = BiologyTopic.objects.filter(exam_board=ExamBoard.AQA).order_by("id").first()
+        if topic is None:
+            topic = BiologyTopic.objects.create(topic="Biological molecules", exam_board=ExamBoard.AQA)
+
+        return BenchmarkTarget(
+            base_url=base_url,
+            access_token=str(RefreshToken.for_user(user).access_token),
+            topic_id=topic.id,
+        )
+
+    def _write_table(self, summary):
+        header = f"{'endpoint':<10} {'reqs':>6} {'errs':>5} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8}"
+        self.stdout.write(header)
+        rows = list(summary["endpoints"].items()) + [("TOTAL", summary["total"])]
+        for name, stats in rows:
+            self.stdout.write(
+                f"{name:<10} {stats['requests']:>6} {stats['errors']:>5} {stats['rps']:>7} "
+                f"{stats['p50_ms'] or 0:>8} {stats['p95_ms'] or 0:>8} {stats['p99_ms'] or 0:>8}"
+            )
@@ -0,0 +1,98 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from examquestions import views
+from examquestions.management.commands.premark_benchmark import _fallback_banks
+from examquestions.services.near_duplicates import NearDuplicateIndex, question_sketch
+from examquestions.services.premarker import iter_bank_items
+from examquestions.services.question_text import normalized_item_question
+
+# Rewrites an LLM makes when it repeats a question in different words.
+PARAPHRASES = [
+    ("state ", "give "),
+    ("give ", "state "),
+    ("describe ", "outline "),
+    ("explain ", "explain briefly "),
+    ("what is meant by ", "define "),
+    (" the ", " a "),
+    ("?", "."),
+    ("name ", "identify "),
+]
+
+
+def _paraphrase(question, rng):
+    for old, new in rng.sample(PARAPHRASES, len(PARAPHRASES)):
+        if old in question:
+            question = question.replace(old, new, 1)
+            break
+    if rng.random() < 0.3:
+        question += " in your answer"
+    return question
+
+
+def _sections():
+    """Distinct normalised questions per top-level bank section, the unit a scope draws its fallbacks from."""
+    sections = []
+    for bank in _fallback_banks().values():
+        for section in bank.values():
+            questions = {normalized_item_question(item) for item in iter_bank_items(section)}
+            questions.discard("")
+            if len(questions) > 1:
+                sections.append(sorted(questions))
+    return sections
+
+
+class Command(BaseCommand):
+    help = "Tune the near-duplicate threshold on the fallback banks: false positives, paraphrase recall and lookup time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8", help="Comma-separated thresholds to report.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the paraphrases. Defaults to 0.")
+        parser.add_argument("--show", type=int, default=5, help="False-positive pairs to print per threshold.")
+
+    def handle(self, *args, **options):
+        try:
+            thresholds = [float(value) for value in options["thresholds"].split(",") if value.strip()]
+        except ValueError as exc:
+            raise CommandError("--thresholds must be comma-separated numbers.") from exc
+        sections = _sections()
+        rng = random.Random(options["seed"])
+        paraphrases = [(question, _paraphrase(question, rng)) for questions in sections for question in questions]
+        pairs = sum(len(questions) * (len(questions) - 1) // 2 for questions in sections)
+        self.stdout.write(f"{len(sections)} bank sections, {len(paraphrases)} questions, {pairs} distinct pairs")
+
+        for threshold in thresholds:
+            # Adding each section's questions in turn to an index, any hit is a distinct question wrongly flagged.
+            false_positives = []
+            for questions in sections:
+                index = NearDuplicateIndex(threshold=threshold)
+                for question in questions:
+                    match = index.find(question)
+                    if match is not None:
+                        false_positives.append((match, question))
+                    index.add(question)
+            caught = sum(
+                NearDuplicateIndex([question], threshold=threshold).find(paraphrase) is not None
+                for question, paraphrase in paraphrases
+            )
+            self.stdout.write(
+                f"threshold {threshold:.2f}: {len(false_positives)} false positive(s), "
+                f"paraphrase recall {caught / len(paraphrases):.1%}"
+            )
+            for first, second in false_positives[: options["show"]]:
+                self.stdout.write(f"    {first!r} ~ {second!r}")
+
+        largest = max(sections, key=len)
+        index = NearDuplicateIndex(largest)
+        probes = [_paraphrase(question, rng) + " now" for question in largest]
+        question_sketch.cache_clear()
+        started = time.perf_counter()
+        for probe in probes:
+            index.find(probe)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Lookup against a {len(largest)}-question index: {elapsed / len(probes) * 1_000_000:.0f} us per candidate, "
+            "including its sketch"
+        )
@@ -0,0 +1,68 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from examquestions import views
+from examquestions.services.ai import evaluate_response_with_openai
+from examquestions.services.aiGCSE import evaluate_response_with_openai as evaluate_gcse_response_with_openai
+from examquestions.services.premarker import build_benchmark_corpus, run_benchmark
+
+
+def _fallback_banks():
+    banks = {}
+    for board, path in views.FALLBACK_QUESTION_PATHS.items():
+        banks[f"alevel:{board}"] = views.load_fallback_bank_from_path(str(path))
+    for board, paths in views.GCSE_FALLBACK_PATHS_BY_BOARD.items():
+        for subject, path in paths.items():
+            banks[f"gcse:{board}:{subject}"] = views.load_fallback_bank_from_path(str(path))
+    return banks
+
+
+def _llm_mark(case):
+    service, board, *rest = case["bank"].split(":")
+    if service == "gcse":
+        result = evaluate_gcse_response_with_openai(
+            case["question"], case["mark_scheme"], case["answer"], board, rest[0], "HIGHER"
+        )
+    else:
+        result = evaluate_response_with_openai(case["question"], case["mark_scheme"], case["answer"], board)
+    return result.get("score")
+
+
+class Command(BaseCommand):
+    help = "Pre-mark synthetic answers to the short fallback-bank questions and report escalations and agreement."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=200, help="Questions to sample (four answers each). 0 uses all.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for sampling questions. Defaults to 0.")
+        parser.add_argument(
+            "--with-llm",
+            action="store_true",
+            help="Also mark every confidently pre-marked case with the model and report agreement. Makes LLM calls.",
+        )
+        parser.add_argument("--output", help="Write the summary and the corpus to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options["limit"] < 0:
+            raise CommandError("--limit must not be negative.")
+        cases = build_benchmark_corpus(_fallback_banks(), random.Random(options["seed"]), options["limit"])
+        if not cases:
+            raise CommandError("No questions within PREMARK_MAX_MARKS were found in the fallback banks.")
+
+        summary = run_benchmark(cases, _llm_mark if options["with_llm"] else None)
+        escalation_rate = summary["escalated"] / summary["cases"]
+        self.stdout.write(f"Cases: {summary['cases']}  escalated: {summary['escalated']} ({escalation_rate:.1%})")
+        for kind, counts in sorted(summary["by_kind"].items()):
+            self.stdout.write(f"  {kind:<10} {counts['cases']:>5} cases  {counts['escalated']:>5} escalated")
+        if summary["labelled"]:
+            agreement = summary["label_agreement"] / summary["labelled"]
+            self.stdout.write(f"Agreement with expected marks: {summary['label_agreement']}/{summary['labelled']} ({agreement:.1%})")
+        if summary["llm_compared"]:
+            agreement = summary["llm_agreement"] / summary["llm_compared"]
+            self.stdout.write(f"Agreement with the model: {summary['llm_agreement']}/{summary['llm_compared']} ({agreement:.1%})")
+
+        if options.get("output"):
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump({"summary": summary, "cases": cases}, handle, indent=2)
+            self.stdout.write(f"Wrote {len(cases)} case(s) to {options['output']}")
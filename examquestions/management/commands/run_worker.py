@@ -0,0 +1,48 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from examquestions.services.idempotency import purge_expired_idempotency_records
+from examquestions.services.jobs import fail_stale_jobs, run_next_job
+from examquestions.services.llm_telemetry import flush_llm_calls
+
+
+class Command(BaseCommand):
+    help = "Run queued generation and marking jobs from the Job table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run every currently queued job and exit instead of polling.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the queue is empty. Defaults to 1.",
+        )
+        parser.add_argument(
+            "--worker-id",
+            default=f"{socket.gethostname()}:{os.getpid()}",
+            help="Identifier stored on claimed jobs. Defaults to host:pid.",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = options["worker_id"]
+
+        while True:
+            fail_stale_jobs()
+            job = run_next_job(worker_id=worker_id)
+            # No request_finished here, so write the job's buffered LLM telemetry ourselves.
+            flush_llm_calls()
+            if job is not None:
+                self.stdout.write(f"Job {job.id} ({job.kind}) finished with status {job.status}")
+                continue
+
+            purge_expired_idempotency_records()
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from examquestions import views
+from examquestions.services.premarker import iter_bank_items
+from examquestions.services.question_text import normalized_item_question, question_text_from_item
+
+
+def _per_pattern_check(question_item):
+    # The validator as it was before the combined scanner: one search per pattern.
+    normalized_question = normalized_item_question(question_item)
+    if not normalized_question:
+        return False
+    if any(pattern.search(normalized_question) for pattern in views.UNSEEN_RESOURCE_PATTERNS):
+        return False
+    if any(pattern.search(normalized_question) for pattern in views.METHOD_EVALUATION_PATTERNS):
+        detail_matches = sum(bool(pattern.search(normalized_question)) for pattern in views.PROCEDURAL_DETAIL_PATTERNS)
+        if detail_matches < 2:
+            return False
+    return True
+
+
+def _time_per_item(check, items, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            check(item)
+    return (time.perf_counter() - started) / (len(items) * repeat) * 1_000_000
+
+
+class Command(BaseCommand):
+    help = "Compare the combined self-contained question scanner with per-pattern searches over every fallback bank."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Passes over each bank. Defaults to 5.")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        paths = sorted(views.FALLBACK_QUESTIONS_DIR.glob("*.json"))
+        if not paths:
+            raise CommandError(f"No fallback banks found in {views.FALLBACK_QUESTIONS_DIR}.")
+
+        totals = {"items": 0, "rejected": 0, "mismatches": 0, "per_pattern": 0.0, "combined": 0.0}
+        for path in paths:
+            bank = views.load_fallback_bank_from_path(str(path))
+            items = list(iter_bank_items(bank))
+            if not items:
+                continue
+            mismatches = [item for item in items if _per_pattern_check(item) != views.is_self_contained_ai_question(item)]
+            rejected = sum(not views.is_self_contained_ai_question(item) for item in items)
+            per_pattern = _time_per_item(_per_pattern_check, items, options["repeat"])
+            combined = _time_per_item(views.is_self_contained_ai_question, items, options["repeat"])
+            self.stdout.write(
+                f"{path.name}: {len(items)} items, {rejected} rejected, {len(mismatches)} mismatches, "
+                f"{per_pattern:.1f} us per-pattern, {combined:.1f} us combined"
+            )
+            for item in mismatches[:3]:
+                self.stdout.write(f"    mismatch: {question_text_from_item(item)!r}")
+            totals["items"] += len(items)
+            totals["rejected"] += rejected
+            totals["mismatches"] += len(mismatches)
+            totals["per_pattern"] += per_pattern * len(items)
+            totals["combined"] += combined * len(items)
+
+        if not totals["items"]:
+            raise CommandError("The fallback banks contain no question items.")
+        per_pattern = totals["per_pattern"] / totals["items"]
+        combined = totals["combined"] / totals["items"]
+        self.stdout.write(
+            f"All banks: {totals['items']} items, {totals['rejected']} rejected, {totals['mismatches']} mismatches, "
+            f"{per_pattern:.1f} us per-pattern, {combined:.1f} us combined ({per_pattern / combined:.1f}x)"
+        )
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examquestions', '0014_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=16)),
+                ('purpose', models.CharField(max_length=32)),
+                ('model', models.CharField(max_length=64)),
+                ('item_count', models.PositiveIntegerField(default=1)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('latency_ms', models.PositiveIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('outcome', models.CharField(choices=[('ok', 'OK'), ('error', 'Error')], default='ok', max_length=8)),
+                ('error_type', models.CharField(blank=True, max_length=128)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LLMCallRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('service', models.CharField(max_length=16)),
+                ('purpose', models.CharField(max_length=32)),
+                ('model', models.CharField(max_length=64)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+                ('latency_p50_ms', models.PositiveIntegerField(default=0)),
+                ('latency_p95_ms', models.PositiveIntegerField(default=0)),
+                ('latency_p99_ms', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', 'service', 'purpose'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'service', 'purpose', 'model'), name='uniq_llm_rollup_per_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examquestions', '0015_llm_call_telemetry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='llmcall',
+            name='cached_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='llmcallrollup',
+            name='cached_tokens',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
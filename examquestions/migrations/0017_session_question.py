@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examquestions', '0016_llm_call_cached_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('question', models.TextField()),
+                ('marks', models.PositiveSmallIntegerField(default=0)),
+                ('mark_scheme', models.JSONField(default=list)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='examquestions.questionsession')),
+            ],
+            options={
+                'ordering': ['session', 'position'],
+                'constraints': [models.UniqueConstraint(fields=('session', 'position'), name='uniq_session_question_position')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examquestions', '0017_session_question'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('qualification', models.CharField(choices=[('ALEVEL_BIOLOGY', 'A-level Biology'), ('GCSE_SCIENCE', 'GCSE Science')], max_length=32)),
+                ('exam_board', models.CharField(max_length=50)),
+                ('scope_key', models.CharField(max_length=255)),
+                ('scope_title', models.CharField(blank=True, max_length=255)),
+                ('score', models.FloatField(default=0)),
+                ('out_of', models.PositiveSmallIntegerField(default=0)),
+                ('marked_by', models.CharField(choices=[('model', 'Model'), ('local', 'Local pre-marker')], default='model', max_length=8)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='results', to='examquestions.sessionquestion')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_results', to='examquestions.questionsession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_results', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['session', 'position'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='answer_result_user_idx'), models.Index(fields=['user', 'scope_key', 'created_at'], name='answer_result_user_scope_idx'), models.Index(fields=['scope_key', 'created_at'], name='answer_result_scope_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examquestions', '0018_answer_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exam_board', models.CharField(choices=[('OCR', 'OCR'), ('AQA', 'AQA'), ('EDEXCEL', 'Edexcel')], max_length=8)),
+                ('scope_key', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('normalized_question', models.TextField()),
+                ('question_item', models.JSONField()),
+                ('served_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['served_count', 'created_at'],
+                'indexes': [models.Index(fields=['exam_board', 'scope_key', 'served_count'], name='shared_question_scope_idx')],
+                'constraints': [models.UniqueConstraint(fields=('exam_board', 'scope_key', 'fingerprint'), name='uniq_shared_question_per_scope')],
+            },
+        ),
+    ]
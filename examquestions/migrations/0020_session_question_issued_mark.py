@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examquestions', '0019_shared_question'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionquestion',
+            name='marked_by',
+            field=models.CharField(blank=True, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='sessionquestion',
+            name='score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='answerresult',
+            name='marked_by',
+            field=models.CharField(choices=[('model', 'Model'), ('local', 'Local pre-marker'), ('client', 'Reported by client')], default='model', max_length=8),
+        ),
+    ]
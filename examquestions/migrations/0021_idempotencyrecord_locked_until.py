@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('examquestions', '0020_session_question_issued_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
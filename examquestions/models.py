@@ -1,5 +1,6 @@
 # models.py
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from accounts.models import CustomUser
 
@@ -265,6 +266,58 @@ class QuestionSession(models.Model):
                 raise ValidationError("Selected GCSE subcategory does not belong to the chosen GCSE subtopic.")
 
 
+class SessionQuestion(models.Model):
+    session = models.ForeignKey(QuestionSession, on_delete=models.CASCADE, related_name="questions")
+    position = models.PositiveSmallIntegerField()
+    question = models.TextField()
+    marks = models.PositiveSmallIntegerField(default=0)
+    mark_scheme = models.JSONField(default=list)
+    # The last mark issued for this question by mark-answer; submit records these rather than the client's copy.
+    score = models.FloatField(blank=True, null=True)
+    marked_by = models.CharField(max_length=8, blank=True)
+
+    class Meta:
+        ordering = ["session", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["session", "position"], name="uniq_session_question_position"),
+        ]
+
+    def __str__(self):
+        return f"Session {self.session_id} | Q{self.position + 1} | {self.marks} mark(s)"
+
+
+class AnswerResult(models.Model):
+    class MarkedBy(models.TextChoices):
+        MODEL = "model", "Model"
+        LOCAL = "local", "Local pre-marker"
+        # Submitted for a question this server never marked, so the score is the client's own.
+        CLIENT = "client", "Reported by client"
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="answer_results")
+    session = models.ForeignKey(QuestionSession, on_delete=models.CASCADE, related_name="answer_results")
+    question = models.ForeignKey(SessionQuestion, on_delete=models.SET_NULL, null=True, blank=True, related_name="results")
+    position = models.PositiveSmallIntegerField()
+    qualification = models.CharField(max_length=32, choices=QualificationPath.choices)
+    exam_board = models.CharField(max_length=50)
+    scope_key = models.CharField(max_length=255)
+    scope_title = models.CharField(max_length=255, blank=True)
+    score = models.FloatField(default=0)
+    out_of = models.PositiveSmallIntegerField(default=0)
+    marked_by = models.CharField(max_length=8, choices=MarkedBy.choices, default=MarkedBy.MODEL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["session", "position"]
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="answer_result_user_idx"),
+            models.Index(fields=["user", "scope_key", "created_at"], name="answer_result_user_scope_idx"),
+            models.Index(fields=["scope_key", "created_at"], name="answer_result_scope_idx"),
+        ]
+
+    def __str__(self):
+        return f"Session {self.session_id} | Q{self.position + 1} | {self.score}/{self.out_of}"
+
+
 class ServedQuestion(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="served_questions")
     exam_board = models.CharField(max_length=8, choices=ExamBoard.choices, db_index=True)
@@ -283,3 +336,148 @@ class ServedQuestion(models.Model):
 
     def __str__(self):
         return f"{self.user_id} | {self.exam_board} | {self.scope_key}"
+
+
+class SharedQuestion(models.Model):
+    """A validated AI question that any user generating for the same board and scope can be served."""
+
+    exam_board = models.CharField(max_length=8, choices=ExamBoard.choices)
+    scope_key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    normalized_question = models.TextField()
+    question_item = models.JSONField()
+    served_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["served_count", "created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["exam_board", "scope_key", "fingerprint"],
+                name="uniq_shared_question_per_scope",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["exam_board", "scope_key", "served_count"], name="shared_question_scope_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.exam_board} | {self.scope_key} | served {self.served_count}x"
+
+
+class Job(models.Model):
+    class Kind(models.TextChoices):
+        GENERATE_QUESTIONS = "generate_questions", "Generate questions"
+        MARK_ANSWER = "mark_answer", "Mark answer"
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="jobs")
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    result = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    result_status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    worker_id = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at", "id"], name="job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} | {self.user_id} | {self.status}"
+
+
+class IdempotencyRecord(models.Model):
+    class Status(models.TextChoices):
+        IN_PROGRESS = "in_progress", "In progress"
+        COMPLETED = "completed", "Completed"
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="idempotency_records")
+    endpoint = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    request_fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.IN_PROGRESS)
+    response_status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    # While in progress, the owner holds the key until this time; after it a retry assumes the owner died.
+    locked_until = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "endpoint", "key"],
+                name="uniq_idempotency_key_per_user_endpoint",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} | {self.endpoint} | {self.key} | {self.status}"
+
+
+class LLMCall(models.Model):
+    class Outcome(models.TextChoices):
+        OK = "ok", "OK"
+        ERROR = "error", "Error"
+
+    service = models.CharField(max_length=16)
+    purpose = models.CharField(max_length=32)
+    model = models.CharField(max_length=64)
+    item_count = models.PositiveIntegerField(default=1)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    outcome = models.CharField(max_length=8, choices=Outcome.choices, default=Outcome.OK)
+    error_type = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.service} | {self.purpose} | {self.model} | {self.latency_ms}ms"
+
+
+class LLMCallRollup(models.Model):
+    date = models.DateField()
+    service = models.CharField(max_length=16)
+    purpose = models.CharField(max_length=32)
+    model = models.CharField(max_length=64)
+    calls = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    cached_tokens = models.PositiveBigIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+    latency_p50_ms = models.PositiveIntegerField(default=0)
+    latency_p95_ms = models.PositiveIntegerField(default=0)
+    latency_p99_ms = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-date", "service", "purpose"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "service", "purpose", "model"],
+                name="uniq_llm_rollup_per_day",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} | {self.service} | {self.purpose} | {self.calls} calls"
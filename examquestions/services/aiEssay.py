@@ -1,37 +1,37 @@
-from functools import lru_cache
+from functools import lru_cache, partial
 import json
 
 from django.conf import settings
-from openai import OpenAI
+
+from examquestions.services.json_salvage import (
+    complete_batch_results,
+    salvage_batch_results,
+    salvage_questions,
+)
+from examquestions.services.llm_provider import create_json_chat_completion, parse_json_response_content
+from examquestions.services.model_routing import complete_with_fallback, is_confident_mark, select_model, select_route
+from examquestions.services.output_budget import (
+    OutputTruncated,
+    batch_marking_budget,
+    complete_with_retry_on_truncation,
+    marking_budget,
+    merge_batch_results,
+    split_in_half,
+)
 
 
 MODEL_NAME = "gpt-4.1-mini"
+LLM_SERVICE = "essay"
 AQA_EXAM_BOARD = "AQA"
 ESSAY_TOTAL_MARKS = 25
 ESSAY_QUESTION_COUNT = 1
+# Output token budgets. Essay feedback is longer and depends more on how much the student wrote.
+MARKING_BASE_TOKENS = 300
+MARKING_TOKENS_PER_MARK = 20
+BATCH_MARKING_TOKENS_PER_ANSWER = 300
+BATCH_MARKING_TOKENS_PER_MARK = 10
 
-
-@lru_cache(maxsize=1)
-def get_openai_client():
-    return OpenAI(api_key=settings.OPEN_AI_KEY)
-
-
-def _parse_json_response_content(response):
-    content = response.choices[0].message.content
-    if not content:
-        raise ValueError("OpenAI response content was empty.")
-    return json.loads(content.strip())
-
-
-def _create_json_chat_completion(messages, temperature, max_tokens):
-    client = get_openai_client()
-    return client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        response_format={"type": "json_object"},
-    )
+_create_json_chat_completion = partial(create_json_chat_completion, LLM_SERVICE)
 
 
 def _build_specification_reference(specification=None):
@@ -41,11 +41,17 @@ def _build_specification_reference(specification=None):
     return f"the {AQA_EXAM_BOARD} specification"
 
 
-def generate_questions(topic, number_of_questions, specification=None):
-    del topic
-    del number_of_questions
-    specification_reference = _build_specification_reference(specification)
-    prompt = f"""
+def _prompt_cache_key(purpose, specification=None):
+    return f"{LLM_SERVICE}:{purpose}:{str(specification or '').strip()}"
+
+
+# Static instructions go in the system message and only vary by specification, so repeated calls share a
+# byte-identical prefix. Per-call content goes in the user message. The prefix is below OpenAI's 1024-token
+# prompt-caching minimum, so it is not cached yet.
+@lru_cache(maxsize=8)
+def _generation_instructions(specification_reference):
+    return f"""You are a helpful assistant. Return valid JSON only.
+
 You are a qualified teacher creating AQA A-level Biology essay questions.
 
 Create exactly {ESSAY_QUESTION_COUNT} essay-style question for {specification_reference}.
@@ -87,39 +93,15 @@ Format:
 }}
 """
 
-    response = _create_json_chat_completion(
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant. Return valid JSON only."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.7,
-        max_tokens=1800,
-    )
-
-    try:
-        return _parse_json_response_content(response)
-    except json.JSONDecodeError as error:
-        content = response.choices[0].message.content or ""
-        print("Invalid JSON from OpenAI:", content)
-        raise error
 
+@lru_cache(maxsize=8)
+def _marking_instructions(specification_reference):
+    return f"""You are a strict but fair exam marker. Return only valid JSON.
 
-def evaluate_response_with_openai(question, mark_scheme, user_answer, specification=None):
-    specification_reference = _build_specification_reference(specification)
-
-    prompt = f"""
 You are a qualified {AQA_EXAM_BOARD} A-level Biology examiner marking a {ESSAY_TOTAL_MARKS}-mark essay.
 
 Mark the student's answer holistically using the standards from {specification_reference} and the provided indicative mark scheme.
-
-QUESTION:
-"{question}"
-
-INDICATIVE MARK SCHEME:
-{json.dumps(mark_scheme or [], indent=2)}
-
-STUDENT ANSWER:
-"{user_answer}"
+The user message contains the QUESTION, the INDICATIVE MARK SCHEME, and the STUDENT ANSWER.
 
 Marking guidance:
 - This is an AQA A-level Biology {ESSAY_TOTAL_MARKS}-mark essay.
@@ -142,52 +124,16 @@ Respond ONLY with strict valid JSON, no extra text:
 }}
 """
 
-    try:
-        response = _create_json_chat_completion(
-            messages=[
-                {"role": "system", "content": "You are a strict but fair exam marker. Return only valid JSON."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-            max_tokens=800,
-        )
-        parsed = _parse_json_response_content(response)
-        return {
-            "score": parsed.get("score", 0),
-            "out_of": parsed.get("out_of", ESSAY_TOTAL_MARKS),
-            "feedback": parsed.get("feedback", ""),
-            "strengths": parsed.get("strengths", []),
-            "improvements": parsed.get("improvements", []),
-        }
-    except Exception as error:
-        print("OpenAI error:", error)
-        print("Prompt content:\n", prompt)
-        raise error
-
 
-def evaluate_batch_responses_with_openai(answer_payloads, specification=None):
-    normalized_answers = []
-    for index, answer in enumerate(answer_payloads, start=1):
-        normalized_answers.append(
-            {
-                "index": index,
-                "question": str(answer.get("question", "")).strip(),
-                "mark_scheme": answer.get("mark_scheme") or [],
-                "user_answer": str(answer.get("user_answer", "")).strip(),
-            }
-        )
-
-    specification_reference = _build_specification_reference(specification)
+@lru_cache(maxsize=8)
+def _batch_marking_instructions(specification_reference):
+    return f"""You are a strict but fair exam marker. Return only valid JSON.
 
-    prompt = f"""
 You are a qualified {AQA_EXAM_BOARD} A-level Biology examiner marking {ESSAY_TOTAL_MARKS}-mark essays.
 
-Mark every student answer holistically using the provided indicative mark schemes and the standards from {specification_reference}.
+Mark every student answer in the user message holistically using the provided indicative mark schemes and the standards from {specification_reference}.
 Return the results in the same order as the input.
 
-Input answers:
-{json.dumps(normalized_answers, indent=2)}
-
 Marking guidance:
 - Treat each answer as an AQA A-level Biology {ESSAY_TOTAL_MARKS}-mark essay.
 - Use each mark scheme as indicative guidance rather than a rigid checklist.
@@ -212,16 +158,144 @@ Respond ONLY with strict valid JSON in this exact format:
 }}
 """
 
+
+def generate_questions(topic, number_of_questions, specification=None):
+    del topic
+    del number_of_questions
+    specification_reference = _build_specification_reference(specification)
+
+    response = _create_json_chat_completion(
+        messages=[
+            {"role": "system", "content": _generation_instructions(specification_reference)},
+            {"role": "user", "content": f"Write {ESSAY_QUESTION_COUNT} new essay question now."},
+        ],
+        temperature=0.7,
+        max_tokens=1800,
+        purpose="generate",
+        model=select_model(LLM_SERVICE, "generate", MODEL_NAME),
+        item_count=ESSAY_QUESTION_COUNT,
+        cache_key=_prompt_cache_key("generate", specification),
+    )
+
+    try:
+        return parse_json_response_content(response)
+    except json.JSONDecodeError as error:
+        content = response.choices[0].message.content or ""
+        print("Invalid JSON from OpenAI:", content)
+        questions = salvage_questions(content, expected=ESSAY_QUESTION_COUNT)
+        if questions:
+            return {"questions": questions}
+        raise error
+
+
+def evaluate_response_with_openai(question, mark_scheme, user_answer, specification=None):
+    specification_reference = _build_specification_reference(specification)
+
+    prompt = f"""QUESTION:
+"{question}"
+
+INDICATIVE MARK SCHEME:
+{json.dumps(mark_scheme or [], indent=2)}
+
+STUDENT ANSWER:
+"{user_answer}"
+"""
+
+    request = dict(
+        messages=[
+            {"role": "system", "content": _marking_instructions(specification_reference)},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.3,
+        max_tokens=marking_budget(
+            ESSAY_TOTAL_MARKS,
+            user_answer,
+            MARKING_BASE_TOKENS,
+            MARKING_TOKENS_PER_MARK,
+            floor=800,
+        ),
+        purpose="mark",
+        cache_key=_prompt_cache_key("mark", specification),
+    )
+
+    def send(model):
+        response = complete_with_retry_on_truncation(_create_json_chat_completion, {**request, "model": model})
+        return parse_json_response_content(response)
+
+    try:
+        route = select_route(LLM_SERVICE, "mark", MODEL_NAME, ESSAY_TOTAL_MARKS)
+        parsed = complete_with_fallback(route, send, accept=is_confident_mark)
+        return {
+            "score": parsed.get("score", 0),
+            "out_of": parsed.get("out_of", ESSAY_TOTAL_MARKS),
+            "feedback": parsed.get("feedback", ""),
+            "strengths": parsed.get("strengths", []),
+            "improvements": parsed.get("improvements", []),
+        }
+    except Exception as error:
+        print("OpenAI error:", error)
+        print("Prompt content:\n", prompt)
+        raise error
+
+
+def evaluate_batch_responses_with_openai(answer_payloads, specification=None):
+    normalized_answers = []
+    for index, answer in enumerate(answer_payloads, start=1):
+        normalized_answers.append(
+            {
+                "index": index,
+                "question": str(answer.get("question", "")).strip(),
+                "mark_scheme": answer.get("mark_scheme") or [],
+                "user_answer": str(answer.get("user_answer", "")).strip(),
+            }
+        )
+
+    specification_reference = _build_specification_reference(specification)
+    prompt = f"""Input answers:
+{json.dumps(normalized_answers, indent=2)}
+"""
+
     response = _create_json_chat_completion(
         messages=[
-            {"role": "system", "content": "You are a strict but fair exam marker. Return only valid JSON."},
+            {"role": "system", "content": _batch_marking_instructions(specification_reference)},
             {"role": "user", "content": prompt},
         ],
         temperature=0.2,
-        max_tokens=1600,
+        max_tokens=batch_marking_budget(
+            normalized_answers,
+            BATCH_MARKING_TOKENS_PER_ANSWER,
+            BATCH_MARKING_TOKENS_PER_MARK,
+            floor=1600,
+            marks_per_answer=ESSAY_TOTAL_MARKS,
+        ),
+        purpose="batch_mark",
+        model=select_model(LLM_SERVICE, "batch_mark", MODEL_NAME, ESSAY_TOTAL_MARKS),
+        item_count=len(normalized_answers),
+        cache_key=_prompt_cache_key("batch_mark", specification),
     )
 
-    parsed = _parse_json_response_content(response)
+    try:
+        parsed = parse_json_response_content(response)
+    except OutputTruncated:
+        if len(answer_payloads) < 2:
+            raise
+        first_half, second_half = split_in_half(list(answer_payloads))
+        return merge_batch_results(
+            evaluate_batch_responses_with_openai(first_half, specification=specification),
+            evaluate_batch_responses_with_openai(second_half, specification=specification),
+        )
+    except json.JSONDecodeError:
+        salvaged = salvage_batch_results(response.choices[0].message.content, len(normalized_answers))
+        if not salvaged["results"]:
+            raise
+        # Keep every result that survived and re-mark only the answers whose results were lost.
+        parsed = complete_batch_results(
+            salvaged,
+            len(normalized_answers),
+            lambda missing: evaluate_batch_responses_with_openai(
+                [answer_payloads[index - 1] for index in missing], specification=specification
+            ),
+        )
     results = parsed.get("results", [])
 
     if len(results) != len(normalized_answers):
@@ -254,9 +328,12 @@ def get_feedback_from_openai(prompt, specification=None):
         ],
         temperature=0.6,
         max_tokens=500,
+        purpose="feedback",
+        model=select_model(LLM_SERVICE, "feedback", MODEL_NAME),
+        cache_key=_prompt_cache_key("feedback", specification),
     )
 
-    parsed = _parse_json_response_content(response)
+    parsed = parse_json_response_content(response)
     return {
         "strengths": parsed.get("strengths", []),
         "improvements": parsed.get("improvements", []),
@@ -1,24 +1,46 @@
-from openai import OpenAI
 from django.conf import settings
-from functools import lru_cache
+from functools import lru_cache, partial
 import json
 
 from examquestions.models import GCSESubject
+from examquestions.services.fanout import create_chat_completions_concurrently, merge_sharded_questions, shard_counts
+from examquestions.services.json_salvage import (
+    complete_batch_results,
+    is_valid_question_item,
+    recover_truncated_questions,
+    salvage_batch_results,
+    salvage_questions,
+)
+from examquestions.services.llm_provider import (
+    create_json_chat_completion,
+    parse_json_response_content,
+    stream_json_chat_completion,
+)
+from examquestions.services.model_routing import complete_with_fallback, is_confident_mark, select_model, select_route
+from examquestions.services.output_budget import (
+    OutputTruncated,
+    batch_marking_budget,
+    complete_with_retry_on_truncation,
+    generation_budget,
+    marking_budget,
+    merge_batch_results,
+    question_marks,
+    split_in_half,
+)
+from examquestions.services.streaming import iter_json_array_items
 
 
 MODEL_NAME = "gpt-4.1-mini"
+LLM_SERVICE = "gcse"
+# Output token budgets, sized from the completion tokens these prompts actually use.
+QUESTION_OUTPUT_TOKENS = 250
+MARKING_BASE_TOKENS = 150
+MARKING_TOKENS_PER_MARK = 40
+BATCH_MARKING_TOKENS_PER_ANSWER = 80
+BATCH_MARKING_TOKENS_PER_MARK = 30
 
-
-@lru_cache(maxsize=1)
-def get_openai_client():
-    return OpenAI(api_key=settings.OPEN_AI_KEY)
-
-
-def _parse_json_response_content(response):
-    content = response.choices[0].message.content
-    if not content:
-        raise ValueError("OpenAI response content was empty.")
-    return json.loads(content.strip())
+_create_json_chat_completion = partial(create_json_chat_completion, LLM_SERVICE)
+_stream_json_chat_completion = partial(stream_json_chat_completion, LLM_SERVICE)
 
 
 def _format_mark_scheme_points(mark_scheme):
@@ -31,15 +53,8 @@ def _format_mark_scheme_points(mark_scheme):
     return formatted_points
 
 
-def _create_json_chat_completion(messages, temperature, max_tokens):
-    client = get_openai_client()
-    return client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        response_format={"type": "json_object"},
-    )
+def _prompt_cache_key(purpose, exam_board, subject, tier):
+    return f"{LLM_SERVICE}:{purpose}:{exam_board}:{subject}:{tier}"
 
 
 def _format_gcse_subject(subject):
@@ -57,13 +72,14 @@ def _format_gcse_tier(tier):
     return str(tier or "").strip().replace("_", " ").title()
 
 
-def generate_questions(topic, exam_board, number_of_questions, subject, tier):
-    subject_label = _format_gcse_subject(subject)
-    tier_label = _format_gcse_tier(tier)
-    prompt = f"""
-You are a qualified teacher creating exam questions for the {exam_board} exam board.
+# Static instructions go in the system message and only vary by board, subject and tier, so repeated calls share
+# a byte-identical prefix. Per-call content goes in the user message. The prefix is below OpenAI's 1024-token
+# prompt-caching minimum, so it is not cached yet.
+@lru_cache(maxsize=64)
+def _generation_instructions(exam_board, subject_label, tier_label):
+    return f"""You are a helpful assistant. Return valid JSON only.
 
-Create {number_of_questions} exam-style questions on the topic: "{topic}" for the {exam_board} GCSE {subject_label} specification at {tier_label} tier.
+You are a qualified teacher creating exam questions for the {exam_board} exam board, for the {exam_board} GCSE {subject_label} specification at {tier_label} tier.
 
 For each question:
 - Write the question clearly, and include the total number of marks at the end of the question in brackets like this: [3 marks]
@@ -92,41 +108,15 @@ Format:
 }}
 """
 
-    response = _create_json_chat_completion(
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant. Return valid JSON only."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.7,
-        max_tokens=1500,
-    )
-
-    try:
-        return _parse_json_response_content(response)
-    except json.JSONDecodeError as e:
-        content = response.choices[0].message.content or ""
-        print("Invalid JSON from OpenAI:", content)
-        raise e
-
 
-def evaluate_response_with_openai(question, mark_scheme, user_answer, exam_board, subject, tier):
-    subject_label = _format_gcse_subject(subject)
-    tier_label = _format_gcse_tier(tier)
-    mark_scheme_with_marks = _format_mark_scheme_points(mark_scheme)
+@lru_cache(maxsize=64)
+def _marking_instructions(exam_board, subject_label, tier_label):
+    return f"""You are a strict but fair exam marker. Return only valid JSON.
 
-    prompt = f"""
 You are a qualified {exam_board} GCSE {subject_label} examiner.
 
 Mark the student's answer using the official {exam_board} style and the provided mark scheme.
-
-QUESTION:
-"{question}"
-
-MARK SCHEME (each point shows expected content and its marks):
-{json.dumps(mark_scheme_with_marks, indent=2)}
-
-STUDENT ANSWER:
-"{user_answer}"
+The user message contains the QUESTION, the MARK SCHEME (each point shows expected content and its marks), and the STUDENT ANSWER.
 
 Marking guidance:
 - Award marks wherever there is reasonable evidence of understanding, even if the wording is not perfect.
@@ -145,46 +135,16 @@ Respond ONLY with strict valid JSON, no extra text:
 }}
 """
 
-    try:
-        response = _create_json_chat_completion(
-            messages=[
-                {"role": "system", "content": "You are a strict but fair exam marker. Return only valid JSON."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-            max_tokens=500,
-        )
-        return _parse_json_response_content(response)
-
-    except Exception as e:
-        print("OpenAI error:", e)
-        print("Prompt content:\n", prompt)
-        raise e
 
+@lru_cache(maxsize=64)
+def _batch_marking_instructions(exam_board, subject_label, tier_label):
+    return f"""You are a strict but fair exam marker. Return only valid JSON.
 
-def evaluate_batch_responses_with_openai(answer_payloads, exam_board, subject, tier):
-    subject_label = _format_gcse_subject(subject)
-    tier_label = _format_gcse_tier(tier)
-    normalized_answers = []
-    for index, answer in enumerate(answer_payloads, start=1):
-        normalized_answers.append(
-            {
-                "index": index,
-                "question": str(answer.get("question", "")).strip(),
-                "mark_scheme": _format_mark_scheme_points(answer.get("mark_scheme") or []),
-                "user_answer": str(answer.get("user_answer", "")).strip(),
-            }
-        )
-
-    prompt = f"""
 You are a qualified {exam_board} GCSE {subject_label} examiner.
 
-Mark every student answer using the provided mark scheme.
+Mark every student answer in the user message using the provided mark scheme.
 Return the results in the same order as the input.
 
-Input answers:
-{json.dumps(normalized_answers, indent=2)}
-
 Marking guidance:
 - Award marks wherever there is reasonable evidence of understanding, even if wording is imperfect.
 - Accept correct synonyms, equivalent terminology, or alternative valid phrasing.
@@ -209,16 +169,180 @@ Respond ONLY with strict valid JSON in this exact format:
 }}
 """
 
+
+def _generation_request(topic, exam_board, number_of_questions, subject, tier, shard=None):
+    subject_label = _format_gcse_subject(subject)
+    tier_label = _format_gcse_tier(tier)
+    prompt = f'Create {number_of_questions} exam-style questions on the topic: "{topic}".'
+    if shard:
+        shard_index, shard_total = shard
+        prompt += (
+            f" This is set {shard_index} of {shard_total} written in parallel for the same student,"
+            " so favour a different part of the topic and different command words from the other sets."
+        )
+    return {
+        "messages": [
+            {"role": "system", "content": _generation_instructions(exam_board, subject_label, tier_label)},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.7,
+        "max_tokens": generation_budget(number_of_questions, QUESTION_OUTPUT_TOKENS),
+        "purpose": "generate",
+        "model": select_model(LLM_SERVICE, "generate", MODEL_NAME),
+        "item_count": number_of_questions,
+        "cache_key": _prompt_cache_key("generate", exam_board, subject_label, tier_label),
+    }
+
+
+def _generate_questions_sharded(counts, topic, exam_board, subject, tier):
+    requests = [
+        _generation_request(topic, exam_board, count, subject, tier, shard=(index, len(counts)))
+        for index, count in enumerate(counts, start=1)
+    ]
+    results = create_chat_completions_concurrently(LLM_SERVICE, requests, settings.QUESTION_GENERATION_MAX_CONCURRENCY)
+    return merge_sharded_questions(results, parse_json_response_content)
+
+
+def generate_questions(topic, exam_board, number_of_questions, subject, tier):
+    counts = shard_counts(number_of_questions, settings.QUESTION_GENERATION_SHARD_SIZE)
+    if len(counts) > 1:
+        return _generate_questions_sharded(counts, topic, exam_board, subject, tier)
+
+    response = _create_json_chat_completion(**_generation_request(topic, exam_board, number_of_questions, subject, tier))
+
+    try:
+        return parse_json_response_content(response)
+    except OutputTruncated:
+        recovered = recover_truncated_questions(
+            response.choices[0].message.content,
+            number_of_questions,
+            lambda count: generate_questions(topic, exam_board, count, subject, tier),
+        )
+        if recovered is not None:
+            return recovered
+        if number_of_questions < 2:
+            raise
+        # Retry as two concurrent half-size requests, each with its own budget.
+        halves = shard_counts(number_of_questions, (number_of_questions + 1) // 2)
+        return _generate_questions_sharded(halves, topic, exam_board, subject, tier)
+    except json.JSONDecodeError as e:
+        content = response.choices[0].message.content or ""
+        print("Invalid JSON from OpenAI:", content)
+        questions = salvage_questions(content, expected=number_of_questions)
+        if questions:
+            return {"questions": questions}
+        raise e
+
+
+def stream_generate_questions(topic, exam_board, number_of_questions, subject, tier):
+    """Yield generated questions one at a time as the model finishes writing each of them."""
+    deltas = _stream_json_chat_completion(**_generation_request(topic, exam_board, number_of_questions, subject, tier))
+    yield from iter_json_array_items(deltas, "questions", is_valid_question_item)
+
+
+def evaluate_response_with_openai(question, mark_scheme, user_answer, exam_board, subject, tier):
+    subject_label = _format_gcse_subject(subject)
+    tier_label = _format_gcse_tier(tier)
+    mark_scheme_with_marks = _format_mark_scheme_points(mark_scheme)
+
+    prompt = f"""QUESTION:
+"{question}"
+
+MARK SCHEME (each point shows expected content and its marks):
+{json.dumps(mark_scheme_with_marks, indent=2)}
+
+STUDENT ANSWER:
+"{user_answer}"
+"""
+
+    marks = question_marks(question, mark_scheme)
+    request = dict(
+        messages=[
+            {"role": "system", "content": _marking_instructions(exam_board, subject_label, tier_label)},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.3,
+        max_tokens=marking_budget(
+            marks,
+            user_answer,
+            MARKING_BASE_TOKENS,
+            MARKING_TOKENS_PER_MARK,
+        ),
+        purpose="mark",
+        cache_key=_prompt_cache_key("mark", exam_board, subject_label, tier_label),
+    )
+
+    def send(model):
+        response = complete_with_retry_on_truncation(_create_json_chat_completion, {**request, "model": model})
+        return parse_json_response_content(response)
+
+    try:
+        return complete_with_fallback(select_route(LLM_SERVICE, "mark", MODEL_NAME, marks), send, accept=is_confident_mark)
+
+    except Exception as e:
+        print("OpenAI error:", e)
+        print("Prompt content:\n", prompt)
+        raise e
+
+
+def evaluate_batch_responses_with_openai(answer_payloads, exam_board, subject, tier):
+    subject_label = _format_gcse_subject(subject)
+    tier_label = _format_gcse_tier(tier)
+    normalized_answers = []
+    for index, answer in enumerate(answer_payloads, start=1):
+        normalized_answers.append(
+            {
+                "index": index,
+                "question": str(answer.get("question", "")).strip(),
+                "mark_scheme": _format_mark_scheme_points(answer.get("mark_scheme") or []),
+                "user_answer": str(answer.get("user_answer", "")).strip(),
+            }
+        )
+
+    prompt = f"""Input answers:
+{json.dumps(normalized_answers, indent=2)}
+"""
+
     response = _create_json_chat_completion(
         messages=[
-            {"role": "system", "content": "You are a strict but fair exam marker. Return only valid JSON."},
+            {"role": "system", "content": _batch_marking_instructions(exam_board, subject_label, tier_label)},
             {"role": "user", "content": prompt},
         ],
         temperature=0.2,
-        max_tokens=1400,
+        max_tokens=batch_marking_budget(normalized_answers, BATCH_MARKING_TOKENS_PER_ANSWER, BATCH_MARKING_TOKENS_PER_MARK),
+        purpose="batch_mark",
+        model=select_model(
+            LLM_SERVICE,
+            "batch_mark",
+            MODEL_NAME,
+            max((question_marks(answer["question"], answer["mark_scheme"]) for answer in normalized_answers), default=None),
+        ),
+        item_count=len(normalized_answers),
+        cache_key=_prompt_cache_key("batch_mark", exam_board, subject_label, tier_label),
     )
 
-    parsed = _parse_json_response_content(response)
+    try:
+        parsed = parse_json_response_content(response)
+    except OutputTruncated:
+        if len(answer_payloads) < 2:
+            raise
+        first_half, second_half = split_in_half(list(answer_payloads))
+        return merge_batch_results(
+            evaluate_batch_responses_with_openai(first_half, exam_board, subject, tier),
+            evaluate_batch_responses_with_openai(second_half, exam_board, subject, tier),
+        )
+    except json.JSONDecodeError:
+        salvaged = salvage_batch_results(response.choices[0].message.content, len(normalized_answers))
+        if not salvaged["results"]:
+            raise
+        # Keep every result that survived and re-mark only the answers whose results were lost.
+        parsed = complete_batch_results(
+            salvaged,
+            len(normalized_answers),
+            lambda missing: evaluate_batch_responses_with_openai(
+                [answer_payloads[index - 1] for index in missing], exam_board, subject, tier
+            ),
+        )
     results = parsed.get("results", [])
 
     if len(results) != len(normalized_answers):
@@ -250,9 +374,12 @@ def get_feedback_from_openai(prompt):
         ],
         temperature=0.6,
         max_tokens=500,
+        purpose="feedback",
+        model=select_model(LLM_SERVICE, "feedback", MODEL_NAME),
+        cache_key=f"{LLM_SERVICE}:feedback",
     )
 
-    parsed = _parse_json_response_content(response)
+    parsed = parse_json_response_content(response)
     return {
         "strengths": parsed.get("strengths", []),
         "improvements": parsed.get("improvements", []),
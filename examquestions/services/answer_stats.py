@@ -0,0 +1,43 @@
+"""Per-answer statistics computed in SQL from ``AnswerResult`` rows.
+
+Both queries group and sum in the database, using the ``(user, scope_key, created_at)`` and
+``(scope_key, created_at)`` indexes, so no session feedback needs to be parsed or re-marked.
+"""
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import Cast
+
+from examquestions.models import AnswerResult
+
+
+def _with_facility(queryset):
+    # Facility is the share of available marks scored, the usual exam-board measure of how easy a question is.
+    return (
+        queryset.annotate(
+            answers=Count("id"),
+            scored=Sum("score"),
+            available=Sum("out_of"),
+        )
+        .filter(available__gt=0)
+        .annotate(facility=F("scored") / Cast(F("available"), FloatField()))
+    )
+
+
+def weak_areas(user, since=None, limit=5, min_answers=1):
+    """The user's scopes with the lowest share of marks scored, weakest first."""
+    results = AnswerResult.objects.filter(user=user)
+    if since is not None:
+        results = results.filter(created_at__gte=since)
+    grouped = _with_facility(results.values("scope_key", "scope_title", "qualification", "exam_board"))
+    return list(grouped.filter(answers__gte=min_answers).order_by("facility", "-answers")[:limit])
+
+
+def question_difficulty(scope_key, min_answers=5, limit=10):
+    """Questions in ``scope_key`` answered at least ``min_answers`` times by anyone, hardest first.
+
+    Only marks this server issued count; scores reported by clients are left out of the cross-user figures.
+    """
+    results = AnswerResult.objects.filter(scope_key=scope_key, question__isnull=False).exclude(
+        marked_by=AnswerResult.MarkedBy.CLIENT
+    )
+    grouped = _with_facility(results.values(text=F("question__question")))
+    return list(grouped.filter(answers__gte=min_answers).order_by("facility", "-answers")[:limit])
@@ -0,0 +1,248 @@
+"""A local OpenAI-compatible stand-in used by the load benchmark.
+
+It answers ``POST /v1/chat/completions`` with canned JSON shaped like the prompts in ``ai.py``, ``aiGCSE.py``
+and ``aiEssay.py`` expect, after a simulated delay of time-to-first-token plus completion tokens at a fixed
+decode rate. Requests with ``stream=True`` get the same content as server-sent chunks paced at that rate. Point
+the app at it with ``OPENAI_BASE_URL=http://127.0.0.1:<port>/v1``. ``llm_provider.LocalBackend`` reuses the canned
+content in-process.
+"""
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+
+@dataclass
+class FakeOpenAIConfig:
+    latency_ms: float = 400.0
+    latency_jitter_ms: float = 150.0
+    tokens_per_second: float = 80.0
+    completion_tokens_mean: int = 350
+    completion_tokens_sigma: float = 0.35
+    error_rate: float = 0.0
+    seed: int | None = None
+
+
+_question_counter = itertools.count(1)
+_QUESTION_COUNT_PATTERN = re.compile(r"Create (\d+)")
+_MARKS_PATTERN = re.compile(r"\[(\d+) marks?\]")
+
+
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+# Roughly one token per streamed delta, as the real API sends.
+STREAM_CHUNK_CHARACTERS = 4
+
+
+def _approximate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _canned_question(essay, rng, number):
+    if essay:
+        return {
+            "question": f"Benchmark essay {number}: the importance of interactions between organisms. [25 marks]",
+            "total_marks": 25,
+            "mark_scheme": [
+                "Reward breadth of topics drawn from across the specification.",
+                "Reward accurate, detailed A-level biology linked to the title.",
+            ],
+        }
+
+    total_marks = rng.randint(2, 6)
+    return {
+        "question": f"Benchmark question {number}: explain how enzymes lower activation energy. [{total_marks} marks]",
+        "total_marks": total_marks,
+        "mark_scheme": [f"Creditworthy point {index} (1 mark)" for index in range(1, total_marks + 1)],
+    }
+
+
+def _feedback_points():
+    return {
+        "strengths": ["Clear use of key terms", "Logical structure", "Relevant examples"],
+        "improvements": ["Add more detail", "Link points to the question", "Check units and precision"],
+    }
+
+
+def build_canned_content(messages, rng, numbers=_question_counter):
+    """Return the JSON body a real model would give for the prompt in ``messages``; questions are numbered from ``numbers``."""
+    system_text = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    user_text = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+    # Static instructions may sit in either message, so detect the expected shape from the whole prompt.
+    prompt_text = f"{system_text} {user_text}"
+    essay = "essay" in prompt_text.lower()
+
+    if '"questions"' in prompt_text:
+        match = _QUESTION_COUNT_PATTERN.search(user_text)
+        count = int(match.group(1)) if match else 1
+        return {"questions": [_canned_question(essay, rng, next(numbers)) for _ in range(count)]}
+
+    if '"results"' in prompt_text:
+        # The prompt's format example contributes one "index" key; every submitted answer adds another.
+        count = max(prompt_text.count('"index":') - 1, 1)
+        results = []
+        for index in range(1, count + 1):
+            out_of = 25 if essay else 4
+            results.append({"index": index, "score": rng.randint(0, out_of), "out_of": out_of, "feedback": "Benchmark feedback."})
+        return {"results": results, **_feedback_points()}
+
+    if '"score"' in prompt_text:
+        marks_match = _MARKS_PATTERN.search(user_text)
+        out_of = int(marks_match.group(1)) if marks_match else (25 if essay else 3)
+        body = {"score": rng.randint(0, out_of), "out_of": out_of, "feedback": "Benchmark feedback."}
+        if essay:
+            body.update(_feedback_points())
+        return body
+
+    if "strengths" in system_text:
+        return _feedback_points()
+
+    return {}
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, FakeOpenAIRequestHandler)
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.rng_lock = threading.Lock()
+        self.seen_prefixes = set()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def sample(self, func):
+        with self.rng_lock:
+            return func(self.rng)
+
+    def cached_prefix_tokens(self, messages):
+        """Mimic upstream prompt caching: a repeated system prefix of 1024+ tokens is cached in 128-token steps."""
+        prefix = "".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+        prefix_tokens = _approximate_tokens(prefix) if prefix else 0
+        if prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        with self.rng_lock:
+            seen = prefix in self.seen_prefixes
+            self.seen_prefixes.add(prefix)
+        return (prefix_tokens // PROMPT_CACHE_INCREMENT) * PROMPT_CACHE_INCREMENT if seen else 0
+
+
+class FakeOpenAIRequestHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status_code, body):
+        encoded = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        request_body = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.config
+
+        if config.error_rate and self.server.sample(lambda rng: rng.random()) < config.error_rate:
+            self._send_json(500, {"error": {"message": "Simulated upstream failure.", "type": "server_error"}})
+            return
+
+        messages = request_body.get("messages") or []
+        content = json.dumps(self.server.sample(lambda rng: build_canned_content(messages, rng)))
+        prompt_tokens = sum(_approximate_tokens(str(m.get("content", ""))) for m in messages)
+        cached_tokens = self.server.cached_prefix_tokens(messages)
+        completion_tokens = self.server.sample(
+            lambda rng: max(
+                _approximate_tokens(content),
+                int(rng.lognormvariate(0, config.completion_tokens_sigma) * config.completion_tokens_mean),
+            )
+        )
+        completion_tokens = min(completion_tokens, int(request_body.get("max_tokens") or completion_tokens))
+        latency_ms = self.server.sample(lambda rng: max(0.0, rng.gauss(config.latency_ms, config.latency_jitter_ms)))
+        decode_seconds = completion_tokens / max(config.tokens_per_second, 1e-6)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        completion_id = f"chatcmpl-fake-{next(_question_counter)}"
+        model = request_body.get("model", "fake-model")
+
+        if request_body.get("stream"):
+            time.sleep(latency_ms / 1000)
+            include_usage = bool((request_body.get("stream_options") or {}).get("include_usage"))
+            self._send_stream(completion_id, model, content, decode_seconds, usage if include_usage else None)
+            return
+
+        time.sleep(latency_ms / 1000 + decode_seconds)
+        self._send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _send_stream(self, completion_id, model, content, decode_seconds, usage):
+        """Send ``content`` as server-sent chunk events spread evenly over ``decode_seconds``."""
+        pieces = [content[index:index + STREAM_CHUNK_CHARACTERS] for index in range(0, len(content), STREAM_CHUNK_CHARACTERS)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send_chunk(choices, **extra):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for piece in pieces:
+            time.sleep(decode_seconds / max(len(pieces), 1))
+            send_chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        send_chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            send_chunk([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_fake_openai_server(config=None, host="127.0.0.1", port=0):
+    """Start the stand-in on a daemon thread and return the server; call ``shutdown()`` to stop it."""
+    server = FakeOpenAIServer((host, port), config or FakeOpenAIConfig())
+    thread = threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True)
+    thread.start()
+    return server
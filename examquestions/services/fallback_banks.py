@@ -0,0 +1,178 @@
+"""Load fallback question banks and reload them when their files change, without restarting the worker.
+
+Each bank is kept with the file's modification time, size and SHA-256. At most every
+``FALLBACK_BANK_RELOAD_SECONDS`` a request stats the file. If the file changed and its content hash differs, it is
+parsed and validated, and only then swapped in, replacing the whole bank dict in one assignment. Requests that
+already hold the old dict keep using it. A missing, unparseable or invalid file is logged and counted, and the
+previous version (``{}`` if none ever loaded) keeps being served until a good file replaces it. The same bad content
+is not parsed again.
+
+Derived data such as generic pools and the scope index is keyed by the bank dict, so a swap gives a new bank fresh
+derived data. ``bank_replaced`` is sent with the old bank so holders can drop what they derived from it.
+"""
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+from pathlib import Path
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.dispatch import Signal
+
+from exambuilder.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_BANK_LOADS = registry.counter(
+    "exambuilder_fallback_bank_loads_total",
+    "Fallback bank loads by bank file and outcome (loaded, reloaded, unchanged or failed).",
+    ("bank", "outcome"),
+)
+FALLBACK_BANK_LOAD_DURATION = registry.histogram(
+    "exambuilder_fallback_bank_load_seconds",
+    "Time to read, parse and validate a fallback bank file, by bank file.",
+    ("bank",),
+)
+
+# Sent with ``path``, ``old_bank`` and ``new_bank`` after a changed file has been swapped in.
+bank_replaced = Signal()
+
+
+@dataclass(frozen=True)
+class LoadedBank:
+    bank: dict
+    mtime_ns: int
+    size: int
+    sha256: str
+    load_seconds: float
+    memory_bytes: int
+    loaded_at: float
+
+
+def validate_bank(bank):
+    """Raise ``ValueError`` unless ``bank`` maps section titles to lists of question items."""
+    if not isinstance(bank, dict) or not bank:
+        raise ValueError("a fallback bank must be a non-empty JSON object of sections")
+    for title, items in bank.items():
+        if not isinstance(items, list):
+            raise ValueError(f"section {title!r} is not a list")
+        for position, item in enumerate(items):
+            if not isinstance(item, dict) or not str(item.get("question") or "").strip():
+                raise ValueError(f"section {title!r} item {position} has no question")
+            if not isinstance(item.get("mark_scheme"), (list, str)):
+                raise ValueError(f"section {title!r} item {position} has no mark_scheme")
+
+
+def deep_sizeof(value):
+    """Approximate memory held by parsed JSON: containers, keys and values."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(item) for key, item in value.items())
+    elif isinstance(value, list):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
+
+
+class FallbackBankManager:
+    def __init__(self):
+        self._loaded = {}
+        # path -> SHA-256 of content that failed, so it is not parsed again on every check.
+        self._rejected = {}
+        self._next_check = {}
+        self._locks = {}
+        self._clear_lock = threading.Lock()
+
+    def get(self, path_value):
+        """The current bank at ``path_value``; ``{}`` when the file has never loaded successfully."""
+        path = str(path_value)
+        if time.monotonic() < self._next_check.get(path, 0):
+            loaded = self._loaded.get(path)
+        else:
+            loaded = self.refresh(path)
+            self._next_check[path] = time.monotonic() + settings.FALLBACK_BANK_RELOAD_SECONDS
+        return loaded.bank if loaded is not None else {}
+
+    def refresh(self, path_value):
+        """Check the file now and reload it if it changed; returns the ``LoadedBank`` being served, or ``None``."""
+        path = str(path_value)
+        # One lock per file: reloading one bank does not hold up requests for the others.
+        with self._locks.setdefault(path, threading.Lock()):
+            return self._refresh(path)
+
+    def status(self):
+        """``{path: LoadedBank}`` for every bank loaded so far."""
+        return dict(self._loaded)
+
+    def clear(self):
+        with self._clear_lock:
+            self._loaded.clear()
+            self._rejected.clear()
+            self._next_check.clear()
+
+    def _refresh(self, path):
+        current = self._loaded.get(path)
+        name = Path(path).name
+        started = time.perf_counter()
+        try:
+            stat = Path(path).stat()
+            version = (stat.st_mtime_ns, stat.st_size)
+            if current is not None and version == (current.mtime_ns, current.size):
+                return current
+            content = Path(path).read_bytes()
+        except OSError as exc:
+            if current is None:
+                logger.warning("Fallback file NOT FOUND at %s: %s", path, exc)
+            else:
+                logger.warning("Fallback file %s cannot be read, still serving the version loaded before: %s", path, exc)
+            FALLBACK_BANK_LOADS.inc(bank=name, outcome="failed")
+            return current
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        if current is not None and sha256 == current.sha256:
+            # Touched or rewritten with the same content: keep the bank and its derived data.
+            self._loaded[path] = LoadedBank(
+                current.bank, *version, sha256, current.load_seconds, current.memory_bytes, current.loaded_at
+            )
+            FALLBACK_BANK_LOADS.inc(bank=name, outcome="unchanged")
+            return self._loaded[path]
+        if self._rejected.get(path) == sha256:
+            return current
+
+        try:
+            bank = json.loads(content.decode("utf-8"))
+            validate_bank(bank)
+        except ValueError as exc:
+            # JSON and Unicode decode errors are ValueErrors too.
+            self._rejected[path] = sha256
+            FALLBACK_BANK_LOADS.inc(bank=name, outcome="failed")
+            if current is None:
+                logger.error("Fallback file %s is invalid and has no earlier version to serve: %s", path, exc)
+            else:
+                logger.error("Fallback file %s is invalid, still serving the version loaded before: %s", path, exc)
+            return current
+
+        load_seconds = time.perf_counter() - started
+        loaded = LoadedBank(bank, *version, sha256, load_seconds, deep_sizeof(bank), time.time())
+        self._loaded[path] = loaded
+        self._rejected.pop(path, None)
+        FALLBACK_BANK_LOAD_DURATION.observe(load_seconds, bank=name)
+        outcome = "loaded" if current is None else "reloaded"
+        FALLBACK_BANK_LOADS.inc(bank=name, outcome=outcome)
+        logger.info(
+            "Fallback bank %s | file=%s | sha256=%s | load_ms=%.1f | memory_mb=%.2f",
+            outcome,
+            path,
+            sha256[:12],
+            load_seconds * 1000,
+            loaded.memory_bytes / 1_000_000,
+        )
+        if current is not None:
+            bank_replaced.send(sender=FallbackBankManager, path=path, old_bank=current.bank, new_bank=bank)
+        return loaded
+
+
+fallback_banks = FallbackBankManager()
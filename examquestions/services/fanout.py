@@ -0,0 +1,84 @@
+"""Concurrent fan-out of one generation request into several smaller completions.
+
+Output tokens dominate completion latency, so asking for 10 questions in one call takes roughly twice as long as
+two calls for 5 each made side by side. Only the provider calls run on worker threads: telemetry is deferred and
+recorded on the calling thread so pool threads never open database connections of their own.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import logging
+
+from exambuilder.metrics import span
+from examquestions.services.json_salvage import salvage_questions
+from examquestions.services.llm_provider import ChatRequest, get_llm_provider
+from examquestions.services.llm_telemetry import record_llm_call
+
+
+logger = logging.getLogger(__name__)
+
+
+def shard_counts(total, shard_size):
+    """Split ``total`` into near-equal shards of at most ``shard_size``; a non-positive size means one shard."""
+    if shard_size <= 0 or total <= shard_size:
+        return [total]
+    shard_total = -(-total // shard_size)
+    base, remainder = divmod(total, shard_total)
+    return [base + 1 if index < remainder else base for index in range(shard_total)]
+
+
+def _outcome(func):
+    try:
+        return func(), None
+    except Exception as exc:
+        return None, exc
+
+
+def create_chat_completions_concurrently(service, requests, max_concurrency):
+    """Send each request dict as its own chat completion, at most ``max_concurrency`` at a time.
+
+    Each request holds ``model``, ``messages``, ``temperature``, ``max_tokens``, ``purpose``, ``item_count`` and an
+    optional ``cache_key``. Returns ``(response, error)`` pairs in request order; one telemetry row is recorded per shard.
+    """
+    chat_requests = [ChatRequest(service, deferred_telemetry=[], **request) for request in requests]
+    provider = get_llm_provider()
+
+    with span("llm"), ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(requests)))) as executor:
+        # Each shard runs in a copy of the caller's context so spans it opens still reach the request's Server-Timing.
+        futures = [
+            executor.submit(contextvars.copy_context().run, _outcome, lambda request=request: provider.send(request))
+            for request in chat_requests
+        ]
+        results = [future.result() for future in futures]
+
+    for request in chat_requests:
+        for elapsed, response, error in request.deferred_telemetry:
+            record_llm_call(service, request.purpose, request.model, request.item_count, elapsed, response, error)
+    return results
+
+
+def merge_sharded_questions(results, parse_response):
+    """Concatenate the ``questions`` arrays of successful shards.
+
+    Complete questions are salvaged from truncated or malformed shards, and failed shards are skipped so the caller
+    can top up from its fallback bank; if every shard failed the first error is raised. Duplicates across shards
+    are left for ``collect_valid_ai_questions`` to drop.
+    """
+    questions = []
+    errors = []
+    for response, error in results:
+        if error is None:
+            try:
+                questions.extend(parse_response(response).get("questions", []))
+                continue
+            except ValueError as exc:
+                salvaged = salvage_questions(response.choices[0].message.content)
+                if salvaged:
+                    questions.extend(salvaged)
+                    continue
+                error = exc
+        logger.warning("Question generation shard failed: %s", error)
+        errors.append(error)
+
+    if errors and len(errors) == len(results):
+        raise errors[0]
+    return {"questions": questions}
@@ -0,0 +1,233 @@
+from datetime import timedelta
+from functools import wraps
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.response import Response
+
+from examquestions.models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL_SECONDS = 0.25
+# Sent with the 409 for a key that is still in progress; a generation usually finishes well within this.
+RETRY_AFTER_SECONDS = 5
+
+# Waiters in the same process are woken as soon as the owner finishes; other processes fall back to polling.
+_inflight_events = {}
+_inflight_lock = threading.Lock()
+
+
+def request_fingerprint(endpoint, data):
+    canonical = json.dumps({"endpoint": endpoint, "data": data}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _request_data(request):
+    if hasattr(request.data, "dict"):
+        return request.data.dict()
+    return request.data
+
+
+def claim_idempotency_key(user, endpoint, key, fingerprint):
+    """Return (record, owner). The owner runs the request; everyone else waits for its stored response."""
+    now = timezone.now()
+    IdempotencyRecord.objects.filter(user=user, endpoint=endpoint, key=key).filter(
+        Q(expires_at__lte=now) | Q(status=IdempotencyRecord.Status.IN_PROGRESS, locked_until__lte=now)
+    ).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                user=user,
+                endpoint=endpoint,
+                key=key,
+                request_fingerprint=fingerprint,
+                locked_until=now + timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS),
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+            )
+    except IntegrityError:
+        record = IdempotencyRecord.objects.filter(user=user, endpoint=endpoint, key=key).first()
+        return record, False
+
+    with _inflight_lock:
+        _inflight_events[record.pk] = threading.Event()
+    return record, True
+
+
+def _release(record_id):
+    with _inflight_lock:
+        event = _inflight_events.pop(record_id, None)
+    if event is not None:
+        event.set()
+
+
+def wait_for_idempotent_result(record, timeout=None):
+    """Block until the in-flight request for ``record`` finishes.
+
+    Returns the completed record, the still in-progress record if ``timeout`` elapsed, or None when the
+    owner gave up (its record is deleted on errors so the key can be retried).
+    """
+    if timeout is None:
+        timeout = settings.IDEMPOTENCY_WAIT_TIMEOUT_SECONDS
+    deadline = time.monotonic() + timeout
+    while True:
+        current = IdempotencyRecord.objects.filter(pk=record.pk).first()
+        if current is None or current.status == IdempotencyRecord.Status.COMPLETED:
+            return current
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return current
+
+        with _inflight_lock:
+            event = _inflight_events.get(record.pk)
+        if event is not None:
+            event.wait(min(POLL_INTERVAL_SECONDS, remaining))
+        else:
+            time.sleep(min(POLL_INTERVAL_SECONDS, remaining))
+
+
+def _replay(record, event_stream=False):
+    if event_stream and isinstance(record.response_body, str):
+        response = HttpResponse(record.response_body, status=record.response_status_code, content_type="text/event-stream")
+    else:
+        response = Response(record.response_body, status=record.response_status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(endpoint, event_stream=False):
+    """Replay the first response for a repeated ``Idempotency-Key`` header instead of re-running the view.
+
+    Apply beneath ``@api_view`` so the wrapped function receives an authenticated DRF request. Requests
+    without the header are passed straight through. With ``event_stream``, a streamed response is stored when it
+    ends, or when the client disconnects after a question was sent, and replayed as one ``text/event-stream`` body.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = (request.META.get(IDEMPOTENCY_HEADER) or "").strip()
+            if not key:
+                return view_func(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters."}, status=400)
+
+            fingerprint = request_fingerprint(endpoint, _request_data(request))
+            # A second pass covers an owner that failed while we waited: its record is gone, so we take over.
+            for _ in range(2):
+                record, owner = claim_idempotency_key(request.user, endpoint, key, fingerprint)
+                if owner:
+                    return _run_as_owner(record, event_stream, view_func, request, *args, **kwargs)
+                if record is None:
+                    continue
+                if record.request_fingerprint != fingerprint:
+                    return Response(
+                        {"error": "Idempotency-Key has already been used with a different request body."},
+                        status=422,
+                    )
+
+                record = wait_for_idempotent_result(record)
+                if record is None:
+                    continue
+                if record.status == IdempotencyRecord.Status.COMPLETED:
+                    return _replay(record, event_stream)
+                break
+
+            response = Response(
+                {"error": "A request with this Idempotency-Key is still being processed. Retry shortly."},
+                status=409,
+            )
+            response["Retry-After"] = str(RETRY_AFTER_SECONDS)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _run_as_owner(record, event_stream, view_func, request, *args, **kwargs):
+    record_id = record.pk
+    try:
+        response = view_func(request, *args, **kwargs)
+    except Exception:
+        record.delete()
+        _release(record_id)
+        raise
+
+    if event_stream and response.streaming:
+        # The key stays in progress until the last event has been sent.
+        response.streaming_content = _store_event_stream(record, response.status_code, response.streaming_content)
+        return response
+
+    try:
+        _store_response(record, response.status_code, getattr(response, "data", None))
+    finally:
+        _release(record_id)
+    return response
+
+
+def _store_response(record, status_code, body):
+    if status_code >= 500:
+        # Server errors are not cached so a retry with the same key gets a fresh attempt.
+        record.delete()
+    else:
+        # update() rather than save(): if the lease lapsed and a retry replaced this record, it matches no row.
+        IdempotencyRecord.objects.filter(pk=record.pk, status=IdempotencyRecord.Status.IN_PROGRESS).update(
+            status=IdempotencyRecord.Status.COMPLETED,
+            response_status_code=status_code,
+            response_body=body,
+            locked_until=None,
+        )
+
+
+def _stream_error_status(chunk):
+    """The ``status`` of a closing ``error`` event, or ``None`` when ``chunk`` is not one."""
+    event_line, _, data_line = chunk.decode("utf-8").partition("\n")
+    if event_line != "event: error":
+        return None
+    return json.loads(data_line.strip().removeprefix("data: ")).get("status")
+
+
+def _interrupted_stream_event():
+    body = {
+        "error": "The original request was interrupted after some questions were sent. Those questions have been "
+        "charged and saved to your history; send a new request with a new Idempotency-Key for more.",
+        "status": 409,
+    }
+    return f"event: error\ndata: {json.dumps(body)}\n\n".encode("utf-8")
+
+
+def _store_event_stream(record, status_code, chunks):
+    record_id = record.pk
+    sent = []
+    finished = False
+    try:
+        for chunk in chunks:
+            sent.append(chunk)
+            yield chunk
+        finished = True
+    finally:
+        try:
+            # Quota is charged as the first question is sent, so only a stream that sent none can safely run again.
+            charged = any(chunk.startswith(b"event: question") for chunk in sent)
+            failed = not finished or (sent and (_stream_error_status(sent[-1]) or 0) >= 500)
+            if failed and not charged:
+                record.delete()
+            else:
+                if not finished:
+                    # Disconnected part way: a retry replays what was sent, then a terminal error instead of charging again.
+                    sent.append(_interrupted_stream_event())
+                _store_response(record, status_code, b"".join(sent).decode("utf-8"))
+        finally:
+            _release(record_id)
+
+
+def purge_expired_idempotency_records():
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
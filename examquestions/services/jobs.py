@@ -0,0 +1,95 @@
+from datetime import timedelta
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from examquestions.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Handlers take (user, payload) and return (response_body, status_code), the same contract as the sync views.
+JOB_HANDLERS = {
+    Job.Kind.GENERATE_QUESTIONS: "examquestions.views.run_generate_exam_questions",
+    Job.Kind.MARK_ANSWER: "examquestions.views.run_mark_user_answer",
+}
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+
+
+def enqueue_job(user, kind, payload):
+    return Job.objects.create(user=user, kind=kind, payload=payload)
+
+
+def claim_next_job(worker_id=""):
+    # SELECT ... FOR UPDATE SKIP LOCKED on Postgres; SQLite has no row locks and Django drops the clause there.
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.Status.QUEUED)
+            .order_by("created_at", "id")
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = Job.Status.RUNNING
+        job.attempts += 1
+        job.worker_id = worker_id
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "attempts", "worker_id", "started_at"])
+    return job
+
+
+def run_job(job):
+    try:
+        handler = import_string(JOB_HANDLERS[job.kind])
+        body, status_code = handler(job.user, job.payload)
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        job.status = Job.Status.FAILED
+        job.error = str(exc)
+    else:
+        job.result = body
+        job.result_status_code = status_code
+        job.status = Job.Status.SUCCEEDED if status_code < 400 else Job.Status.FAILED
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "result_status_code", "error", "finished_at"])
+    return job
+
+
+def run_next_job(worker_id=""):
+    job = claim_next_job(worker_id=worker_id)
+    if job is None:
+        return None
+    return run_job(job)
+
+
+def fail_stale_jobs(timeout=STALE_JOB_TIMEOUT):
+    """Fail jobs stuck in RUNNING, for example after a worker crash.
+
+    They are not retried: the handler may already have committed a session or charged the free quota before the
+    worker died, so running it again could do both twice. The client sees the failure when it polls and can resubmit.
+    """
+    cutoff = timezone.now() - timeout
+    return Job.objects.filter(status=Job.Status.RUNNING, started_at__lt=cutoff).update(
+        status=Job.Status.FAILED,
+        error="Job was interrupted and may have partly run, so it was not retried.",
+        finished_at=timezone.now(),
+    )
+
+
+def serialize_job(job):
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": job.result,
+        "status_code": job.result_status_code,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,217 @@
+"""Recover complete, well-formed items from truncated or slightly malformed JSON completions.
+
+``parse_json_response_content`` is all-or-nothing: one broken question object throws away the nine good ones.
+The scanner here walks the top-level ``questions`` or ``results`` array object by object, keeps every element that
+decodes on its own and passes a schema check, and skips past the broken ones. Recovery is counted on ``/metrics``
+so the recovered/dropped ratio can be watched per kind.
+"""
+from dataclasses import dataclass, field
+import json
+import logging
+import numbers
+import re
+
+from exambuilder.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+JSON_SALVAGE_ATTEMPTS = registry.counter(
+    "exambuilder_llm_json_salvage_total",
+    "Unparseable completions passed to the salvage parser, by kind and whether any items were recovered.",
+    ("kind", "outcome"),
+)
+JSON_SALVAGE_ITEMS = registry.counter(
+    "exambuilder_llm_json_salvage_items_total",
+    "Items in unparseable completions, by kind and status (recovered or dropped).",
+    ("kind", "status"),
+)
+
+# Models sometimes emit raw newlines or tabs inside strings; accept them rather than drop the item.
+_decoder = json.JSONDecoder(strict=False)
+
+
+@dataclass
+class SalvageResult:
+    items: list = field(default_factory=list)
+    # Array positions of ``items``, so a caller that already consumed a prefix can skip it.
+    positions: list = field(default_factory=list)
+    dropped: int = 0
+    complete: bool = False
+
+
+def is_valid_question_item(item):
+    if not isinstance(item, dict):
+        return False
+    if not isinstance(item.get("question"), str) or not item["question"].strip():
+        return False
+    mark_scheme = item.get("mark_scheme")
+    if not isinstance(mark_scheme, list) or not mark_scheme:
+        return False
+    total_marks = item.get("total_marks", 1)
+    return isinstance(total_marks, numbers.Number) and not isinstance(total_marks, bool) and total_marks > 0
+
+
+def is_valid_result_item(item):
+    if not isinstance(item, dict) or not isinstance(item.get("index"), int):
+        return False
+    return all(
+        isinstance(item.get(name), numbers.Number) and not isinstance(item.get(name), bool)
+        for name in ("score", "out_of")
+    )
+
+
+def _skip_separators(text, position):
+    while position < len(text) and (text[position].isspace() or text[position] == ","):
+        position += 1
+    return position
+
+
+def _object_end(text, start):
+    """Index just past the ``}`` matching the ``{`` at ``start``, or ``None`` if the text ends first."""
+    depth = 0
+    in_string = False
+    escaped = False
+    for position in range(start, len(text)):
+        character = text[position]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif character == "\\":
+                escaped = True
+            elif character == '"':
+                in_string = False
+        elif character == '"':
+            in_string = True
+        elif character in "{[":
+            depth += 1
+        elif character in "}]":
+            depth -= 1
+            if depth == 0:
+                return position + 1
+    return None
+
+
+def scan_json_array(content, key, is_valid_item):
+    """Walk the ``key`` array in ``content`` and return a ``SalvageResult`` of its valid elements."""
+    result = SalvageResult()
+    text = str(content or "")
+    match = re.search(rf'"{re.escape(key)}"\s*:\s*\[', text)
+    if match is None:
+        return result
+
+    position = match.end()
+    array_position = 0
+    while True:
+        position = _skip_separators(text, position)
+        if position >= len(text):
+            return result
+        if text[position] == "]":
+            result.complete = True
+            return result
+        if text[position] != "{":
+            # Stray text between elements: resume at the next object unless the array closes first.
+            next_object = text.find("{", position)
+            array_close = text.find("]", position)
+            if next_object == -1 or (array_close != -1 and array_close < next_object):
+                result.complete = array_close != -1
+                return result
+            position = next_object
+            continue
+
+        try:
+            item, end = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            end = _object_end(text, position)
+            result.dropped += 1
+            if end is None:
+                return result
+        else:
+            if is_valid_item(item):
+                result.items.append(item)
+                result.positions.append(array_position)
+            else:
+                result.dropped += 1
+        position = end
+        array_position += 1
+
+
+def scan_json_string_list(content, key):
+    """Best-effort read of a top-level list of strings such as ``strengths``; ``[]`` if it cannot be decoded."""
+    text = str(content or "")
+    match = re.search(rf'"{re.escape(key)}"\s*:\s*(?=\[)', text)
+    if match is None:
+        return []
+    try:
+        value, _ = _decoder.raw_decode(text, match.end())
+    except json.JSONDecodeError:
+        return []
+    return [item for item in value if isinstance(item, str)] if isinstance(value, list) else []
+
+
+def salvage_json_array(content, key, kind, is_valid_item, expected=None):
+    """Scan an unparseable completion for ``key`` items and record how many were recovered or dropped.
+
+    ``expected`` is the number of items asked for; when given, items lost to truncation count as dropped too.
+    """
+    result = scan_json_array(content, key, is_valid_item)
+    recovered = len(result.items)
+    dropped = result.dropped
+    if expected is not None:
+        dropped = max(dropped, expected - recovered)
+
+    JSON_SALVAGE_ATTEMPTS.inc(kind=kind, outcome="recovered" if recovered else "failed")
+    JSON_SALVAGE_ITEMS.inc(recovered, kind=kind, status="recovered")
+    JSON_SALVAGE_ITEMS.inc(dropped, kind=kind, status="dropped")
+    logger.warning("Salvaged %s of %s %s items from an unparseable completion", recovered, recovered + dropped, kind)
+    return result
+
+
+def salvage_questions(content, expected=None):
+    return salvage_json_array(content, "questions", "questions", is_valid_question_item, expected).items
+
+
+def recover_truncated_questions(content, number_of_questions, generate_remaining):
+    """Keep the complete questions from a truncated generation and ask ``generate_remaining(count)`` for the rest.
+
+    Returns ``None`` when nothing could be recovered, leaving the caller to retry the request another way.
+    """
+    questions = salvage_questions(content, expected=number_of_questions)
+    if not questions:
+        return None
+    remaining = number_of_questions - len(questions)
+    if remaining > 0:
+        try:
+            questions += generate_remaining(remaining).get("questions", [])
+        except Exception:
+            # The caller tops up from its fallback bank, so a failed follow-up still returns what was saved.
+            logger.exception("Follow-up generation for %s truncated questions failed", remaining)
+    return {"questions": questions}
+
+
+def salvage_batch_results(content, expected):
+    result = salvage_json_array(content, "results", "results", is_valid_result_item, expected)
+    return {
+        "results": result.items,
+        "strengths": scan_json_string_list(content, "strengths"),
+        "improvements": scan_json_string_list(content, "improvements"),
+    }
+
+
+def complete_batch_results(parsed, answer_count, mark_missing):
+    """Fill gaps in salvaged batch results by re-marking only the missing answers.
+
+    ``mark_missing(indices)`` receives the 1-based indices still unmarked and returns a batch result for those
+    answers in the same order.
+    """
+    by_index = {result["index"]: result for result in parsed.get("results", []) if 1 <= result["index"] <= answer_count}
+    missing = [index for index in range(1, answer_count + 1) if index not in by_index]
+    if missing:
+        remarked = mark_missing(missing)
+        for original_index, result in zip(missing, remarked.get("results", [])):
+            by_index[original_index] = {**result, "index": original_index}
+        for key in ("strengths", "improvements"):
+            if not parsed.get(key):
+                parsed[key] = remarked.get(key, [])
+    parsed["results"] = [by_index[index] for index in sorted(by_index)]
+    return parsed
@@ -0,0 +1,159 @@
+"""Record LLM responses to a cassette file and replay them later without a network.
+
+In record mode ``RecordingMiddleware`` sits innermost in the provider chain and appends every successful upstream
+response to the cassette. Each entry holds a fingerprint of the request, the response and the latency observed. In
+replay mode ``CassetteBackend`` takes the place of the backend and answers from the cassette, either after the
+recorded latency or immediately, so changes to the request path can be measured without OpenAI's variance.
+
+A cassette is JSON Lines, gzip-compressed when the path ends in ``.gz``. Requests recorded more than once replay
+their responses in order, and the last one repeats.
+"""
+from collections import defaultdict
+import gzip
+import hashlib
+import json
+import logging
+from pathlib import Path
+import threading
+import time
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pydantic import BaseModel
+
+
+logger = logging.getLogger(__name__)
+
+REPLAY_LATENCIES = ("recorded", "none")
+
+
+class CassetteMiss(LookupError):
+    """A replayed request has no recording in the cassette."""
+
+
+def request_fingerprint(request):
+    # prompt_cache_key only routes upstream caching, so changing it does not invalidate recordings.
+    kwargs = {key: value for key, value in request.api_kwargs().items() if key != "prompt_cache_key"}
+    canonical = json.dumps(kwargs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _open(path, mode):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return path.open(mode, encoding="utf-8")
+
+
+def _dump(model):
+    return model.model_dump(mode="json", exclude_none=True)
+
+
+class Cassette:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._replayed = defaultdict(int)
+
+    def _load(self):
+        entries = defaultdict(list)
+        if self.path.exists():
+            with _open(self.path, "r") as handle:
+                for line in handle:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry["fingerprint"]].append(entry)
+        return entries
+
+    def append(self, request, latency_seconds, response=None, chunks=None):
+        entry = {
+            "fingerprint": request_fingerprint(request),
+            "service": request.service,
+            "purpose": request.purpose,
+            "model": request.model,
+            "latency_ms": round(latency_seconds * 1000, 1),
+        }
+        if chunks is not None:
+            entry["chunks"] = chunks
+        else:
+            entry["response"] = response
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with _open(self.path, "a") as handle:
+                handle.write(line)
+            if self._entries is not None:
+                self._entries[entry["fingerprint"]].append(entry)
+
+    def next_entry(self, request):
+        fingerprint = request_fingerprint(request)
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            recordings = self._entries.get(fingerprint)
+            if not recordings:
+                raise CassetteMiss(
+                    f"No recording of this {request.service} {request.purpose} request in {self.path} "
+                    f"(fingerprint {fingerprint[:12]}). Record it with LLM_CASSETTE_MODE=record."
+                )
+            position = min(self._replayed[fingerprint], len(recordings) - 1)
+            self._replayed[fingerprint] += 1
+            return recordings[position]
+
+
+class RecordingMiddleware:
+    """Append each successful upstream response to ``cassette``. Place it innermost so retries are not recorded."""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def __call__(self, request, call_next):
+        started = time.perf_counter()
+        response = call_next(request)
+        if request.stream:
+            return self._record_stream(request, response, started)
+        if isinstance(response, BaseModel):
+            self.cassette.append(request, time.perf_counter() - started, response=_dump(response))
+        else:
+            logger.warning("Not recording a %s response of type %s", request.purpose, type(response).__name__)
+        return response
+
+    def _record_stream(self, request, stream, started):
+        chunks = []
+        completed = False
+        try:
+            for chunk in stream:
+                chunks.append(_dump(chunk))
+                yield chunk
+            completed = True
+        finally:
+            stream.close()
+            # A stream the caller abandoned part-way would replay as a truncated completion.
+            if completed:
+                self.cassette.append(request, time.perf_counter() - started, chunks=chunks)
+
+
+class CassetteBackend:
+    """Answer requests from ``cassette``; ``latency="recorded"`` waits as long as the original call took."""
+
+    def __init__(self, cassette, latency="none", sleep=time.sleep):
+        if latency not in REPLAY_LATENCIES:
+            raise ValueError(f"Unknown replay latency {latency!r}; expected one of {', '.join(REPLAY_LATENCIES)}.")
+        self.cassette = cassette
+        self.latency = latency
+        self.sleep = sleep
+
+    def __call__(self, request):
+        entry = self.cassette.next_entry(request)
+        delay = entry["latency_ms"] / 1000 if self.latency == "recorded" else 0
+        if "chunks" in entry:
+            return self._stream(entry["chunks"], delay)
+        if delay:
+            self.sleep(delay)
+        return ChatCompletion.model_validate(entry["response"])
+
+    def _stream(self, chunks, delay):
+        for chunk in chunks:
+            if delay:
+                # Spread the recorded duration evenly over the chunks, as the fake server paces its streams.
+                self.sleep(delay / len(chunks))
+            yield ChatCompletionChunk.model_validate(chunk)
@@ -0,0 +1,461 @@
+"""One client, one connection pool and one middleware chain for every LLM call.
+
+``ai.py``, ``aiGCSE.py`` and ``aiEssay.py`` describe each call as a ``ChatRequest``. ``get_llm_provider()`` passes
+it through the configured middlewares (response cache, telemetry, model health, circuit breaker, retry) to a
+backend. The backend is either the OpenAI API over a shared keep-alive pool, or ``LocalBackend``, which answers
+deterministically and without a network for tests, local development and benchmarks of the app's own overhead.
+``LLM_CASSETTE_MODE`` records upstream responses to a cassette or replays them in place of the backend (see
+``llm_cassette``).
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+import hashlib
+import importlib.util
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+import httpx
+import openai
+from openai import DefaultHttpxClient, OpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from exambuilder.metrics import registry
+from examquestions.services.fake_openai import STREAM_CHUNK_CHARACTERS, build_canned_content
+from examquestions.services.llm_cassette import Cassette, CassetteBackend, RecordingMiddleware
+from examquestions.services.llm_telemetry import track_llm_call
+from examquestions.services.output_budget import CHARACTERS_PER_TOKEN, is_truncated, raise_if_truncated
+
+
+logger = logging.getLogger(__name__)
+
+# Transient upstream failures: worth retrying, and counted by the circuit breaker.
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+MAX_RETRY_DELAY_SECONDS = 20.0
+
+LLM_RETRIES = registry.counter(
+    "exambuilder_llm_retries_total",
+    "LLM calls retried after a transient upstream error, by service and purpose.",
+    ("service", "purpose"),
+)
+LLM_BREAKER_REJECTIONS = registry.counter(
+    "exambuilder_llm_breaker_rejections_total",
+    "LLM calls refused without being sent because the circuit breaker was open, by model.",
+    ("model",),
+)
+LLM_RESPONSE_CACHE = registry.counter(
+    "exambuilder_llm_response_cache_total",
+    "LLM response cache lookups, by purpose and outcome (hit or miss).",
+    ("purpose", "outcome"),
+)
+
+
+class ProviderUnavailable(RuntimeError):
+    """The circuit breaker is open, so the call was refused without contacting the model."""
+
+
+@dataclass(frozen=True)
+class ChatRequest:
+    service: str
+    model: str
+    messages: list
+    temperature: float
+    max_tokens: int
+    purpose: str
+    item_count: int = 1
+    cache_key: str | None = None
+    stream: bool = False
+    # When set, telemetry is appended here as (latency, response, error) instead of being written, so calls made
+    # on worker threads can be recorded by the thread that owns the database connection.
+    deferred_telemetry: list | None = field(default=None, compare=False)
+
+    def api_kwargs(self):
+        kwargs = {
+            "model": self.model,
+            "messages": self.messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "response_format": {"type": "json_object"},
+        }
+        if self.cache_key:
+            kwargs["prompt_cache_key"] = self.cache_key
+        if self.stream:
+            kwargs.update(stream=True, stream_options={"include_usage": True})
+        return kwargs
+
+
+def _http2_enabled():
+    if not settings.LLM_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("LLM_HTTP2 is on but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def _timeout():
+    return httpx.Timeout(
+        settings.LLM_READ_TIMEOUT_SECONDS,
+        connect=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+        pool=settings.LLM_POOL_TIMEOUT_SECONDS,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_http_client():
+    return DefaultHttpxClient(
+        http2=_http2_enabled(),
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+        ),
+        timeout=_timeout(),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_openai_client():
+    # Retries happen in RetryMiddleware, where they are counted and seen by the circuit breaker.
+    return OpenAI(api_key=settings.OPEN_AI_KEY, http_client=get_http_client(), timeout=_timeout(), max_retries=0)
+
+
+class OpenAIBackend:
+    def __call__(self, request):
+        return get_openai_client().chat.completions.create(**request.api_kwargs())
+
+
+def _approximate_tokens(text):
+    return max(1, len(text) // CHARACTERS_PER_TOKEN)
+
+
+class LocalBackend:
+    """Answers like ``fake_openai`` with no network or delay; the same request always gets the same completion.
+
+    Output beyond ``max_tokens`` is cut off with ``finish_reason="length"``, as the real API does.
+    """
+
+    def __call__(self, request):
+        fingerprint = json.dumps([request.model, request.messages], sort_keys=True, default=str)
+        digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+        rng = random.Random(digest)
+        # Number questions from a per-prompt start so shards of one request do not produce identical questions.
+        numbers = itertools.count(rng.randrange(1, 1_000_000))
+        content = json.dumps(build_canned_content(request.messages, rng, numbers))
+        finish_reason = "stop"
+        if _approximate_tokens(content) > request.max_tokens:
+            content = content[:request.max_tokens * CHARACTERS_PER_TOKEN]
+            finish_reason = "length"
+
+        prompt_tokens = sum(_approximate_tokens(str(message.get("content", ""))) for message in request.messages)
+        completion_tokens = _approximate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        envelope = {"id": f"chatcmpl-local-{digest[:12]}", "created": 0, "model": request.model}
+
+        if request.stream:
+            return self._stream(envelope, content, finish_reason, usage)
+        return ChatCompletion.model_validate(
+            {
+                **envelope,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+        )
+
+    def _stream(self, envelope, content, finish_reason, usage):
+        def chunk(choices, **extra):
+            return ChatCompletionChunk.model_validate({**envelope, "object": "chat.completion.chunk", "choices": choices, **extra})
+
+        for start in range(0, len(content), STREAM_CHUNK_CHARACTERS):
+            piece = content[start:start + STREAM_CHUNK_CHARACTERS]
+            yield chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        yield chunk([], usage=usage)
+
+
+class ResponseCacheMiddleware:
+    """Answer repeated identical requests for ``purposes`` from the Django cache.
+
+    Leave ``generate`` out of ``purposes``: users asking again expect new questions.
+    """
+
+    def __init__(self, timeout_seconds, purposes):
+        self.timeout_seconds = timeout_seconds
+        self.purposes = frozenset(purposes)
+
+    def _key(self, request):
+        canonical = json.dumps(request.api_kwargs(), sort_keys=True, default=str)
+        return "llm-response:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def __call__(self, request, call_next):
+        if request.stream or self.timeout_seconds <= 0 or request.purpose not in self.purposes:
+            return call_next(request)
+
+        key = self._key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            LLM_RESPONSE_CACHE.inc(purpose=request.purpose, outcome="hit")
+            return ChatCompletion.model_validate_json(cached)
+
+        LLM_RESPONSE_CACHE.inc(purpose=request.purpose, outcome="miss")
+        response = call_next(request)
+        if isinstance(response, ChatCompletion) and not is_truncated(response):
+            cache.set(key, response.model_dump_json(), self.timeout_seconds)
+        return response
+
+
+class TelemetryMiddleware:
+    """Record tokens, latency and outcome for each call; streams are recorded once they finish or are closed."""
+
+    def __call__(self, request, call_next):
+        if request.stream:
+            return self._stream(request, call_next)
+        if request.deferred_telemetry is not None:
+            return self._deferred(request, call_next)
+        with track_llm_call(request.service, request.purpose, request.model, request.item_count) as call:
+            call.response = call_next(request)
+        return call.response
+
+    def _deferred(self, request, call_next):
+        started = time.perf_counter()
+        try:
+            response = call_next(request)
+        except Exception as exc:
+            request.deferred_telemetry.append((time.perf_counter() - started, None, exc))
+            raise
+        request.deferred_telemetry.append((time.perf_counter() - started, response, None))
+        return response
+
+    def _stream(self, request, call_next):
+        with track_llm_call(request.service, request.purpose, request.model, request.item_count) as call:
+            stream = call_next(request)
+            try:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        call.response = chunk
+                    yield chunk
+            finally:
+                stream.close()
+
+
+class ModelHealth:
+    """Outcome and latency of the last ``window`` calls to each model, read by ``model_routing``."""
+
+    def __init__(self, window=50):
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def record(self, model, latency_seconds, failed):
+        with self._lock:
+            self._calls.setdefault(model, deque(maxlen=self.window)).append((latency_seconds, failed))
+
+    def snapshot(self, model):
+        """Return ``(calls, error_rate, p95_latency_seconds)`` over the window; latency only counts successes."""
+        with self._lock:
+            calls = list(self._calls.get(model, ()))
+        if not calls:
+            return 0, 0.0, 0.0
+        latencies = sorted(latency for latency, failed in calls if not failed)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0
+        return len(calls), sum(1 for _, failed in calls if failed) / len(calls), p95
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+
+model_health = ModelHealth()
+
+
+class ModelHealthMiddleware:
+    """Feed ``health`` with every call's outcome, including calls the circuit breaker refused."""
+
+    def __init__(self, health):
+        self.health = health
+
+    def __call__(self, request, call_next):
+        if request.stream:
+            # A stream's latency covers the whole answer, which would make a healthy model look slow.
+            return call_next(request)
+        started = time.perf_counter()
+        try:
+            response = call_next(request)
+        except Exception:
+            self.health.record(request.model, time.perf_counter() - started, failed=True)
+            raise
+        self.health.record(request.model, time.perf_counter() - started, failed=False)
+        return response
+
+
+class CircuitBreakerMiddleware:
+    """Refuse calls to a model for ``reset_seconds`` after ``failure_threshold`` consecutive transient failures.
+
+    After the pause one probe call is let through; its outcome closes the breaker or opens it again. A threshold of
+    0 disables the breaker. Only ``RETRYABLE_ERRORS`` count, so a bad request cannot trip it.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._opened_at = {}
+        self._probing = set()
+
+    def _admit(self, model):
+        with self._lock:
+            opened_at = self._opened_at.get(model)
+            if opened_at is None:
+                return
+            if self.clock() - opened_at >= self.reset_seconds and model not in self._probing:
+                self._probing.add(model)
+                return
+        LLM_BREAKER_REJECTIONS.inc(model=model)
+        raise ProviderUnavailable(f"Calls to {model} are paused after repeated upstream failures.")
+
+    def _record(self, model, failed):
+        with self._lock:
+            self._probing.discard(model)
+            if not failed:
+                self._failures.pop(model, None)
+                self._opened_at.pop(model, None)
+                return
+            self._failures[model] = self._failures.get(model, 0) + 1
+            if model in self._opened_at or self._failures[model] >= self.failure_threshold:
+                if model not in self._opened_at:
+                    logger.warning("Opening the LLM circuit breaker for %s after %s failures", model, self._failures[model])
+                self._opened_at[model] = self.clock()
+
+    def __call__(self, request, call_next):
+        if self.failure_threshold <= 0:
+            return call_next(request)
+        self._admit(request.model)
+        try:
+            response = call_next(request)
+        except RETRYABLE_ERRORS:
+            self._record(request.model, failed=True)
+            raise
+        except Exception:
+            # Not an upstream health signal, but a probe must still release its slot.
+            with self._lock:
+                self._probing.discard(request.model)
+            raise
+        self._record(request.model, failed=False)
+        return response
+
+
+class RetryMiddleware:
+    """Retry ``RETRYABLE_ERRORS`` with exponential backoff and full jitter, honouring ``Retry-After`` when sent."""
+
+    def __init__(self, max_retries, backoff_seconds, sleep=time.sleep):
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.sleep = sleep
+
+    def _delay(self, attempt, exc):
+        response = getattr(exc, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = random.uniform(0, self.backoff_seconds * 2 ** attempt)
+        return min(delay, MAX_RETRY_DELAY_SECONDS)
+
+    def __call__(self, request, call_next):
+        for attempt in itertools.count():
+            try:
+                return call_next(request)
+            except RETRYABLE_ERRORS as exc:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._delay(attempt, exc)
+                logger.warning("%s %s call failed with %s; retrying in %.2fs", request.service, request.purpose, type(exc).__name__, delay)
+                LLM_RETRIES.inc(service=request.service, purpose=request.purpose)
+                self.sleep(delay)
+
+
+class LLMProvider:
+    """Send ``ChatRequest``s through ``middlewares``, outermost first, to ``backend``.
+
+    A middleware is a callable ``(request, call_next)``; ``call_next(request)`` runs the rest of the chain. For a
+    streaming request the result is an iterator of completion chunks rather than a completion.
+    """
+
+    def __init__(self, backend, middlewares=()):
+        self.backend = backend
+        self.middlewares = list(middlewares)
+
+    def send(self, request):
+        def dispatch(index, current):
+            if index == len(self.middlewares):
+                return self.backend(current)
+            return self.middlewares[index](current, lambda next_request: dispatch(index + 1, next_request))
+
+        return dispatch(0, request)
+
+
+BACKENDS = {"openai": OpenAIBackend, "local": LocalBackend}
+CASSETTE_MODES = ("", "record", "replay")
+
+
+@lru_cache(maxsize=1)
+def get_llm_provider():
+    if settings.LLM_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {settings.LLM_BACKEND!r}; expected one of {', '.join(BACKENDS)}.")
+    if settings.LLM_CASSETTE_MODE not in CASSETTE_MODES:
+        raise ValueError(f"Unknown LLM_CASSETTE_MODE {settings.LLM_CASSETTE_MODE!r}; expected record, replay or empty.")
+
+    backend = BACKENDS[settings.LLM_BACKEND]()
+    middlewares = [
+        ResponseCacheMiddleware(settings.LLM_RESPONSE_CACHE_SECONDS, settings.LLM_RESPONSE_CACHE_PURPOSES),
+        TelemetryMiddleware(),
+        ModelHealthMiddleware(model_health),
+        CircuitBreakerMiddleware(settings.LLM_BREAKER_FAILURE_THRESHOLD, settings.LLM_BREAKER_RESET_SECONDS),
+        RetryMiddleware(settings.LLM_MAX_RETRIES, settings.LLM_RETRY_BACKOFF_SECONDS),
+    ]
+    if settings.LLM_CASSETTE_MODE == "record":
+        middlewares.append(RecordingMiddleware(Cassette(settings.LLM_CASSETTE_PATH)))
+    elif settings.LLM_CASSETTE_MODE == "replay":
+        backend = CassetteBackend(Cassette(settings.LLM_CASSETTE_PATH), settings.LLM_CASSETTE_REPLAY_LATENCY)
+    return LLMProvider(backend, middlewares)
+
+
+def create_json_chat_completion(service, model, messages, temperature, max_tokens, purpose, item_count=1, cache_key=None):
+    return get_llm_provider().send(
+        ChatRequest(service, model, messages, temperature, max_tokens, purpose, item_count, cache_key)
+    )
+
+
+def stream_json_chat_completion(service, model, messages, temperature, max_tokens, purpose, item_count=1, cache_key=None):
+    """Yield the content deltas of a streamed completion; usage is recorded once the stream finishes or is closed."""
+    stream = get_llm_provider().send(
+        ChatRequest(service, model, messages, temperature, max_tokens, purpose, item_count, cache_key, stream=True)
+    )
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
+
+def parse_json_response_content(response):
+    raise_if_truncated(response)
+    content = response.choices[0].message.content
+    if not content:
+        raise ValueError("OpenAI response content was empty.")
+    return json.loads(content.strip())
@@ -0,0 +1,207 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from exambuilder.metrics import registry, span
+from examquestions.models import LLMCall, LLMCallRollup
+
+
+logger = logging.getLogger(__name__)
+
+# USD per million (prompt, cached prompt, completion) tokens. Unknown models are recorded with zero cost.
+MODEL_PRICING_PER_MILLION_TOKENS = {
+    "gpt-4.1": (Decimal("2.00"), Decimal("0.50"), Decimal("8.00")),
+    "gpt-4.1-mini": (Decimal("0.40"), Decimal("0.10"), Decimal("1.60")),
+    "gpt-4.1-nano": (Decimal("0.10"), Decimal("0.025"), Decimal("0.40")),
+}
+
+LLM_CALLS = registry.counter(
+    "exambuilder_llm_calls_total",
+    "OpenAI chat completions, by service, purpose and outcome.",
+    ("service", "purpose", "outcome"),
+)
+LLM_TOKENS = registry.counter(
+    "exambuilder_llm_tokens_total",
+    "OpenAI tokens consumed, by service, purpose and kind (prompt, cached_prompt or completion).",
+    ("service", "purpose", "kind"),
+)
+
+
+class TrackedCall:
+    def __init__(self):
+        self.response = None
+
+
+def _usage_count(usage, name):
+    value = getattr(usage, name, 0)
+    return value if isinstance(value, int) else 0
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    prompt_price, cached_price, completion_price = MODEL_PRICING_PER_MILLION_TOKENS.get(model, (Decimal(0),) * 3)
+    uncached_tokens = max(prompt_tokens - cached_tokens, 0)
+    total = prompt_price * uncached_tokens + cached_price * cached_tokens + completion_price * completion_tokens
+    return total / Decimal(1_000_000)
+
+
+def record_llm_call(service, purpose, model, item_count, latency_seconds, response=None, error=None):
+    usage = getattr(response, "usage", None)
+    prompt_tokens = _usage_count(usage, "prompt_tokens")
+    completion_tokens = _usage_count(usage, "completion_tokens")
+    cached_tokens = _usage_count(getattr(usage, "prompt_tokens_details", None), "cached_tokens")
+    outcome = LLMCall.Outcome.ERROR if error is not None else LLMCall.Outcome.OK
+
+    LLM_CALLS.inc(service=service, purpose=purpose, outcome=outcome)
+    LLM_TOKENS.inc(prompt_tokens, service=service, purpose=purpose, kind="prompt")
+    LLM_TOKENS.inc(cached_tokens, service=service, purpose=purpose, kind="cached_prompt")
+    LLM_TOKENS.inc(completion_tokens, service=service, purpose=purpose, kind="completion")
+
+    call = LLMCall(
+        service=service,
+        purpose=purpose,
+        model=model,
+        item_count=max(int(item_count or 1), 1),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cached_tokens=cached_tokens,
+        latency_ms=int(latency_seconds * 1000),
+        cost_usd=estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+        outcome=outcome,
+        error_type=type(error).__name__ if error is not None else "",
+    )
+    call_buffer.add(call)
+    return call
+
+
+class LLMCallBuffer:
+    """Unsaved ``LLMCall`` rows, written with one bulk insert instead of one INSERT per call.
+
+    The buffer is flushed when it holds ``LLM_TELEMETRY_FLUSH_SIZE`` rows, when a request finishes and by
+    ``run_worker`` after each job, so LLM calls and fan-out shards never wait on a telemetry write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = []
+
+    def add(self, call):
+        with self._lock:
+            self._calls.append(call)
+            full = len(self._calls) >= settings.LLM_TELEMETRY_FLUSH_SIZE
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            calls, self._calls = self._calls, []
+        if not calls:
+            return 0
+        try:
+            # A savepoint keeps a failed insert from poisoning a caller's open transaction.
+            with transaction.atomic():
+                LLMCall.objects.bulk_create(calls)
+        except Exception:
+            logger.exception("Could not record %s LLM call telemetry rows", len(calls))
+            return 0
+        return len(calls)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+
+call_buffer = LLMCallBuffer()
+
+
+@receiver(request_finished, dispatch_uid="flush_llm_call_telemetry")
+def flush_llm_calls(**kwargs):
+    return call_buffer.flush()
+
+
+@contextmanager
+def track_llm_call(service, purpose, model, item_count=1):
+    """Time an OpenAI call and record its usage. Assign the API response to ``call.response`` inside the block."""
+    call = TrackedCall()
+    started = time.perf_counter()
+    error = None
+    try:
+        with span("llm"):
+            yield call
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        record_llm_call(service, purpose, model, item_count, time.perf_counter() - started, call.response, error)
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+
+def _group_calls(queryset):
+    groups = defaultdict(list)
+    for row in queryset.values("service", "purpose", "model", "item_count", "prompt_tokens", "completion_tokens", "cached_tokens", "latency_ms", "cost_usd", "outcome"):
+        groups[(row["service"], row["purpose"], row["model"])].append(row)
+    return groups
+
+
+def _aggregate(rows):
+    latencies = sorted(row["latency_ms"] for row in rows if row["outcome"] == LLMCall.Outcome.OK)
+    return {
+        "calls": len(rows),
+        "errors": sum(1 for row in rows if row["outcome"] == LLMCall.Outcome.ERROR),
+        "items": sum(row["item_count"] for row in rows),
+        "prompt_tokens": sum(row["prompt_tokens"] for row in rows),
+        "completion_tokens": sum(row["completion_tokens"] for row in rows),
+        "cached_tokens": sum(row["cached_tokens"] for row in rows),
+        "cost_usd": sum((row["cost_usd"] for row in rows), Decimal(0)),
+        "latency_p50_ms": _percentile(latencies, 0.50),
+        "latency_p95_ms": _percentile(latencies, 0.95),
+        "latency_p99_ms": _percentile(latencies, 0.99),
+    }
+
+
+def summarize_llm_calls(since):
+    """Aggregate raw calls since ``since`` per (service, purpose, model), including tokens per item."""
+    summaries = []
+    for (service, purpose, model), rows in sorted(_group_calls(LLMCall.objects.filter(created_at__gte=since)).items()):
+        summary = {"service": service, "purpose": purpose, "model": model, **_aggregate(rows)}
+        total_tokens = summary["prompt_tokens"] + summary["completion_tokens"]
+        summary["tokens_per_item"] = round(total_tokens / summary["items"], 1) if summary["items"] else 0
+        summary["cached_ratio"] = round(summary["cached_tokens"] / summary["prompt_tokens"], 3) if summary["prompt_tokens"] else 0
+        summaries.append(summary)
+    return summaries
+
+
+def rollup_llm_calls(day):
+    """Write one ``LLMCallRollup`` per (service, purpose, model) for ``day``; safe to re-run."""
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    groups = _group_calls(LLMCall.objects.filter(created_at__gte=start, created_at__lt=start + timedelta(days=1)))
+    for (service, purpose, model), rows in groups.items():
+        LLMCallRollup.objects.update_or_create(
+            date=day,
+            service=service,
+            purpose=purpose,
+            model=model,
+            defaults=_aggregate(rows),
+        )
+    return len(groups)
+
+
+def prune_llm_calls(older_than_days):
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = LLMCall.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
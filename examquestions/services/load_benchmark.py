@@ -0,0 +1,201 @@
+"""Closed-loop load generator for the question API, driven by the ``load_benchmark`` command.
+
+Each worker thread picks an endpoint from a weighted mix, calls it over HTTP, and records the latency. Questions
+and sessions returned by ``generate`` feed later ``mark`` and ``submit`` calls so the traffic looks like real use.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+import math
+import random
+import threading
+import time
+
+import requests
+
+
+DEFAULT_MIX = {"generate": 2, "mark": 4, "submit": 1, "history": 2, "catalog": 3}
+REQUEST_TIMEOUT_SECONDS = 120
+
+FALLBACK_QUESTION = {
+    "question": "Explain how enzymes lower the activation energy of a reaction. [3 marks]",
+    "total_marks": 3,
+    "mark_scheme": [
+        "Enzyme forms an enzyme-substrate complex (1 mark)",
+        "Active site puts strain on substrate bonds (1 mark)",
+        "Provides an alternative reaction pathway (1 mark)",
+    ],
+}
+
+
+def parse_mix(raw_mix):
+    """Parse ``"generate=2,mark=4"`` into a weight dict, rejecting unknown endpoints."""
+    if not raw_mix:
+        return dict(DEFAULT_MIX)
+
+    mix = {}
+    for part in raw_mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown endpoint '{name}'. Choose from: {', '.join(DEFAULT_MIX)}.")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank: the smallest value with at least ``fraction`` of the samples at or below it.
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+@dataclass
+class BenchmarkTarget:
+    base_url: str
+    access_token: str
+    topic_id: int
+    exam_board: str = "AQA"
+    questions_per_generate: int = 3
+
+
+@dataclass
+class BenchmarkState:
+    questions: deque = field(default_factory=lambda: deque(maxlen=200))
+    session_ids: deque = field(default_factory=lambda: deque(maxlen=200))
+    samples: list = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, endpoint, status_code, elapsed_seconds):
+        with self.lock:
+            self.samples.append((endpoint, status_code, elapsed_seconds))
+
+    def remember_generation(self, body):
+        with self.lock:
+            if body.get("session_id"):
+                self.session_ids.append(body["session_id"])
+            self.questions.extend(q for q in body.get("questions") or [] if isinstance(q, dict))
+
+    def pick(self, items, rng):
+        with self.lock:
+            return rng.choice(items) if items else None
+
+
+class BenchmarkWorker:
+    def __init__(self, target, state, mix, rng):
+        self.target = target
+        self.state = state
+        self.mix_names = list(mix)
+        self.mix_weights = list(mix.values())
+        self.rng = rng
+        self.http = requests.Session()
+        self.http.headers["Authorization"] = f"Bearer {target.access_token}"
+
+    def _url(self, path):
+        return f"{self.target.base_url.rstrip('/')}{path}"
+
+    def _generate_payload(self):
+        return {
+            "qualification": "ALEVEL_BIOLOGY",
+            "exam_board": self.target.exam_board,
+            "topic_id": self.target.topic_id,
+            "number_of_questions": self.target.questions_per_generate,
+        }
+
+    def call(self, endpoint):
+        if endpoint == "generate":
+            return self.http.post(self._url("/api/generate-questions/"), json=self._generate_payload(), timeout=REQUEST_TIMEOUT_SECONDS)
+        if endpoint == "mark":
+            question = self.state.pick(self.state.questions, self.rng) or FALLBACK_QUESTION
+            payload = {
+                "qualification": "ALEVEL_BIOLOGY",
+                "exam_board": self.target.exam_board,
+                "question": question.get("question"),
+                "mark_scheme": question.get("mark_scheme"),
+                "user_answer": "The enzyme binds the substrate at its active site, forming a complex that lowers activation energy.",
+            }
+            return self.http.post(self._url("/api/mark-answer/"), json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
+        if endpoint == "submit":
+            payload = {
+                "session_id": self.state.pick(self.state.session_ids, self.rng),
+                "answers": [{"score": self.rng.randint(0, 3)} for _ in range(self.target.questions_per_generate)],
+            }
+            return self.http.post(self._url("/api/submit-question-session/"), json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
+        if endpoint == "history":
+            return self.http.get(self._url("/api/user-sessions/"), timeout=REQUEST_TIMEOUT_SECONDS)
+        return self.http.get(self._url("/api/biology-topics/"), params={"exam_board": self.target.exam_board}, timeout=REQUEST_TIMEOUT_SECONDS)
+
+    def run_until(self, deadline):
+        while time.monotonic() < deadline:
+            endpoint = self.rng.choices(self.mix_names, weights=self.mix_weights)[0]
+            if endpoint == "submit" and not self.state.session_ids:
+                endpoint = "generate"
+
+            started = time.perf_counter()
+            try:
+                response = self.call(endpoint)
+                status_code = response.status_code
+            except requests.RequestException:
+                response = None
+                status_code = 0
+            self.state.record(endpoint, status_code, time.perf_counter() - started)
+
+            if endpoint == "generate" and response is not None and response.status_code == 200:
+                self.state.remember_generation(response.json())
+
+
+def run_benchmark(target, mix, duration_seconds, concurrency, seed=None, warmup_seconds=0.0):
+    """Drive ``concurrency`` closed-loop workers for ``duration_seconds`` and return the summary dict."""
+    state = BenchmarkState()
+    seed_source = random.Random(seed)
+
+    if warmup_seconds:
+        BenchmarkWorker(target, state, mix, random.Random(seed_source.random())).run_until(time.monotonic() + warmup_seconds)
+        state.samples.clear()
+
+    deadline = time.monotonic() + duration_seconds
+    workers = [BenchmarkWorker(target, state, mix, random.Random(seed_source.random())) for _ in range(concurrency)]
+    threads = [threading.Thread(target=worker.run_until, args=(deadline,), daemon=True) for worker in workers]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    return summarize_samples(state.samples, elapsed)
+
+
+def _summarize(latencies, error_count, elapsed_seconds):
+    latencies_ms = sorted(value * 1000 for value in latencies)
+    return {
+        "requests": len(latencies_ms),
+        "errors": error_count,
+        "rps": round(len(latencies_ms) / elapsed_seconds, 2) if elapsed_seconds else 0.0,
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 1) if latencies_ms else None,
+        "p50_ms": round(percentile(latencies_ms, 0.50), 1) if latencies_ms else None,
+        "p95_ms": round(percentile(latencies_ms, 0.95), 1) if latencies_ms else None,
+        "p99_ms": round(percentile(latencies_ms, 0.99), 1) if latencies_ms else None,
+        "max_ms": round(latencies_ms[-1], 1) if latencies_ms else None,
+    }
+
+
+def summarize_samples(samples, elapsed_seconds):
+    """Group ``(endpoint, status_code, seconds)`` samples into per-endpoint and overall latency stats."""
+    by_endpoint = {}
+    for endpoint, status_code, seconds in samples:
+        latencies, errors = by_endpoint.setdefault(endpoint, ([], [0]))
+        latencies.append(seconds)
+        if status_code == 0 or status_code >= 400:
+            errors[0] += 1
+
+    endpoints = {
+        endpoint: _summarize(latencies, errors[0], elapsed_seconds)
+        for endpoint, (latencies, errors) in sorted(by_endpoint.items())
+    }
+    total_errors = sum(summary["errors"] for summary in endpoints.values())
+    return {
+        "elapsed_seconds": round(elapsed_seconds, 2),
+        "endpoints": endpoints,
+        "total": _summarize([seconds for _, _, seconds in samples], total_errors, elapsed_seconds),
+    }
@@ -0,0 +1,142 @@
+"""Choose the model for each LLM call from its service, purpose and marks, and from how each model is behaving.
+
+Routes are matched in order; each lists its models cheapest first. A model whose recent error rate or p95 latency is
+over the limits in settings is passed over while a healthier one is available. Single-answer marking also falls
+back to the next model when a call fails, returns invalid JSON or gives a result that fails ``is_confident_mark``.
+Calls that match no route use the service's own ``MODEL_NAME``.
+"""
+from dataclasses import dataclass
+import logging
+import numbers
+
+from django.conf import settings
+
+from exambuilder.metrics import registry
+from examquestions.services.llm_provider import RETRYABLE_ERRORS, ProviderUnavailable, model_health
+
+
+logger = logging.getLogger(__name__)
+
+# Only single-answer A-level and GCSE marking is routed by default, and it starts on the services' own model.
+# is_confident_mark checks the shape of a mark, not whether it is right, so cheaper models such as gpt-4.1-nano
+# are opt-in through LLM_MODEL_ROUTES. Essay and batch marking stay on MODEL_NAME.
+DEFAULT_ROUTES = [
+    {"name": "marking", "services": ["alevel", "gcse"], "purposes": ["mark"], "models": ["gpt-4.1-mini", "gpt-4.1"]},
+]
+# Failures worth another attempt on a different model; anything else is a bug in the request and is raised.
+FALLBACK_ERRORS = (ValueError, ProviderUnavailable) + RETRYABLE_ERRORS
+# Health is only judged once a model has this many calls in its window.
+MIN_CALLS_FOR_HEALTH = 5
+
+LLM_ROUTE_CALLS = registry.counter(
+    "exambuilder_llm_route_calls_total",
+    "Routed LLM calls, by route, model and outcome (ok, invalid, low_confidence or error).",
+    ("route", "model", "outcome"),
+)
+LLM_ROUTE_SKIPS = registry.counter(
+    "exambuilder_llm_route_skips_total",
+    "Models passed over because their recent error rate or latency was over the limit, by route and model.",
+    ("route", "model"),
+)
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    models: tuple
+    services: tuple = ()
+    purposes: tuple = ()
+    max_marks: int | None = None
+
+    def matches(self, service, purpose, marks):
+        if self.services and service not in self.services:
+            return False
+        if self.purposes and purpose not in self.purposes:
+            return False
+        return self.max_marks is None or (marks is not None and marks <= self.max_marks)
+
+
+def configured_routes():
+    return [
+        Route(
+            name=route["name"],
+            models=tuple(route["models"]),
+            services=tuple(route.get("services", ())),
+            purposes=tuple(route.get("purposes", ())),
+            max_marks=route.get("max_marks"),
+        )
+        for route in settings.LLM_MODEL_ROUTES or DEFAULT_ROUTES
+    ]
+
+
+def select_route(service, purpose, default_model, marks=None):
+    for route in configured_routes():
+        if route.matches(service, purpose, marks):
+            return route
+    return Route("default", (default_model,))
+
+
+def is_healthy(model):
+    calls, error_rate, p95_latency = model_health.snapshot(model)
+    if calls < MIN_CALLS_FOR_HEALTH:
+        return True
+    return error_rate <= settings.LLM_ROUTE_MAX_ERROR_RATE and p95_latency <= settings.LLM_ROUTE_MAX_P95_SECONDS
+
+
+def candidate_models(route):
+    """The route's models, healthy ones first in route order; if none is healthy, all of them in order."""
+    healthy = []
+    for model in route.models:
+        if is_healthy(model):
+            healthy.append(model)
+        else:
+            LLM_ROUTE_SKIPS.inc(route=route.name, model=model)
+    if not healthy:
+        return list(route.models)
+    return healthy + [model for model in route.models if model not in healthy]
+
+
+def select_model(service, purpose, default_model, marks=None):
+    """The model to use for a call with no output fallback, such as generation and batch marking."""
+    route = select_route(service, purpose, default_model, marks)
+    model = candidate_models(route)[0]
+    LLM_ROUTE_CALLS.inc(route=route.name, model=model, outcome="ok")
+    return model
+
+
+def is_confident_mark(result):
+    """Whether ``result`` is a well-formed mark: a score within ``0..out_of`` and non-empty feedback."""
+    if not isinstance(result, dict):
+        return False
+    score, out_of = result.get("score"), result.get("out_of")
+    if not all(isinstance(value, numbers.Number) and not isinstance(value, bool) for value in (score, out_of)):
+        return False
+    feedback = result.get("feedback")
+    return 0 <= score <= out_of and out_of > 0 and isinstance(feedback, str) and bool(feedback.strip())
+
+
+def complete_with_fallback(route, send, accept=None):
+    """Return ``send(model)`` for the first candidate model whose result is valid and passes ``accept``.
+
+    ``send`` makes the call and parses it, raising ``ValueError`` for invalid output. The last model's result is
+    returned even if ``accept`` rejects it, and its errors are raised.
+    """
+    models = candidate_models(route)
+    for position, model in enumerate(models):
+        final = position == len(models) - 1
+        try:
+            result = send(model)
+        except FALLBACK_ERRORS as exc:
+            outcome = "invalid" if isinstance(exc, ValueError) else "error"
+            LLM_ROUTE_CALLS.inc(route=route.name, model=model, outcome=outcome)
+            if final:
+                raise
+            logger.warning("Route %s: %s gave %s output (%s); falling back", route.name, model, outcome, exc)
+            continue
+
+        if accept is not None and not accept(result) and not final:
+            LLM_ROUTE_CALLS.inc(route=route.name, model=model, outcome="low_confidence")
+            logger.warning("Route %s: %s gave a low-confidence result; falling back", route.name, model)
+            continue
+        LLM_ROUTE_CALLS.inc(route=route.name, model=model, outcome="ok")
+        return result
@@ -0,0 +1,112 @@
+"""Output token budgets sized to the work asked of the model, and recovery when a completion still hits its budget.
+
+A fixed ``max_tokens`` either truncates large requests into invalid JSON or reserves far more than small ones need.
+Budgets here grow with question count, marks and answer length, and stay below ``MAX_OUTPUT_TOKENS``.
+"""
+import logging
+import re
+
+
+logger = logging.getLogger(__name__)
+
+MAX_OUTPUT_TOKENS = 8000
+CHARACTERS_PER_TOKEN = 4
+# The fixed budget single-answer marking used before budgets were sized; short answers never get less.
+MARKING_FLOOR_TOKENS = 500
+
+_MARKS_PATTERN = re.compile(r"\[(\d+)\s+marks?\]\s*$", re.IGNORECASE)
+
+
+class OutputTruncated(ValueError):
+    """The completion stopped at ``max_tokens`` before the JSON was finished."""
+
+    def __init__(self):
+        super().__init__("OpenAI response was cut off by the max_tokens limit before the JSON was complete.")
+
+
+def is_truncated(response):
+    choices = getattr(response, "choices", None) or []
+    return bool(choices) and getattr(choices[0], "finish_reason", None) == "length"
+
+
+def raise_if_truncated(response):
+    if is_truncated(response):
+        raise OutputTruncated()
+
+
+def _bounded(tokens, floor):
+    return int(min(max(tokens, floor), MAX_OUTPUT_TOKENS))
+
+
+def _approximate_tokens(text):
+    return len(str(text or "")) // CHARACTERS_PER_TOKEN
+
+
+def question_marks(question, mark_scheme=None):
+    """Marks for a question: the trailing ``[N marks]`` tag, else one per mark-scheme point, else 1."""
+    match = _MARKS_PATTERN.search(str(question or "").strip())
+    if match:
+        return int(match.group(1))
+    return max(len(mark_scheme or []), 1)
+
+
+def generation_budget(number_of_questions, tokens_per_question, overhead=100, floor=400):
+    return _bounded(overhead + tokens_per_question * max(int(number_of_questions or 1), 1), floor)
+
+
+def marking_budget(marks, user_answer, base, tokens_per_mark, floor=MARKING_FLOOR_TOKENS):
+    # Feedback grows with the marks to explain and, more slowly, with how much the student wrote.
+    return _bounded(base + tokens_per_mark * marks + _approximate_tokens(user_answer) // 4, floor)
+
+
+def batch_marking_budget(answers, base_per_answer, tokens_per_mark, overhead=200, floor=400, marks_per_answer=None):
+    """Budget for a batch of ``{"question", "mark_scheme", "user_answer"}`` dicts plus the shared feedback lists.
+
+    Marks are read from each question unless ``marks_per_answer`` fixes them, as for 25-mark essays.
+    """
+    per_answer = sum(
+        base_per_answer
+        + tokens_per_mark * (marks_per_answer or question_marks(answer.get("question"), answer.get("mark_scheme")))
+        + _approximate_tokens(answer.get("user_answer")) // 4
+        for answer in answers
+    )
+    return _bounded(overhead + per_answer, floor)
+
+
+def complete_with_retry_on_truncation(create_completion, request):
+    """Call ``create_completion(**request)``; if it stops at ``max_tokens``, retry once with double the budget."""
+    response = create_completion(**request)
+    if is_truncated(response) and request["max_tokens"] < MAX_OUTPUT_TOKENS:
+        larger_budget = min(request["max_tokens"] * 2, MAX_OUTPUT_TOKENS)
+        logger.warning("%s completion hit max_tokens=%s; retrying with %s", request.get("purpose"), request["max_tokens"], larger_budget)
+        response = create_completion(**{**request, "max_tokens": larger_budget})
+    return response
+
+
+def split_in_half(items):
+    middle = (len(items) + 1) // 2
+    return items[:middle], items[middle:]
+
+
+def _first_unique(items, limit):
+    unique_items = []
+    for item in items:
+        if item not in unique_items:
+            unique_items.append(item)
+    return unique_items[:limit]
+
+
+def merge_batch_results(first, second):
+    """Join two batch-marking results, renumbering the second half and keeping three of each feedback list."""
+    offset = len(first.get("results", []))
+    merged = dict(first)
+    merged["results"] = list(first.get("results", [])) + [
+        {**result, "index": offset + position}
+        for position, result in enumerate(second.get("results", []), start=1)
+    ]
+    for key in ("strengths", "improvements"):
+        # Alternate between halves so both contribute to the whole-submission feedback.
+        interleaved = [item for pair in zip(first.get(key, []), second.get(key, [])) for item in pair]
+        interleaved += first.get(key, [])[len(second.get(key, [])):] + second.get(key, [])[len(first.get(key, [])):]
+        merged[key] = _first_unique(interleaved, 3)
+    return merged
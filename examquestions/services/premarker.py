@@ -0,0 +1,305 @@
+"""Mark short recall answers locally when the match against the mark scheme is unambiguous.
+
+Most fallback-bank questions are worth 1-3 marks and have one short phrase per mark, such as ``"Carbon (C) (1 mark)"``.
+The answer and each point are tokenised, stemmed and mapped through a small synonym table, and a point is covered
+when enough of its keywords appear in the answer. Points may list alternatives (``a/b``, ``a or b``, ``a (b)``).
+
+Only two outcomes are confident enough to return without an LLM: every point clearly covered (full marks), or an
+answer with no content at all (zero). Anything else, including partial matches, negations, long answers and answers
+that also use the opposite of a scheme keyword ("increases then decreases"), is escalated to the model, which is
+better at crediting paraphrases and spotting contradictions.
+"""
+from dataclasses import dataclass
+import re
+import unicodedata
+
+from django.conf import settings
+
+from exambuilder.metrics import registry
+from examquestions.services.output_budget import question_marks
+
+
+PREMARK_OUTCOMES = registry.counter(
+    "exambuilder_premark_total",
+    "Single answers seen by the local pre-marker, by outcome (marked or escalated) and reason.",
+    ("outcome", "reason"),
+)
+
+# A point is covered when at least this share of one alternative's keywords are in the answer.
+COVERAGE_TO_AWARD = 0.75
+MAX_ANSWER_WORDS = 40
+
+_MARK_ANNOTATION = re.compile(r"\(\s*(?:\d+\s*marks?|any\s+\w+)\s*\)", re.IGNORECASE)
+_EXAMPLES = re.compile(r"\b(?:e\.?\s?g\.?|for example|such as)\b.*$", re.IGNORECASE)
+_PARENTHESES = re.compile(r"\(([^()]*)\)")
+_ALTERNATIVE_SEPARATORS = re.compile(r"\s+/\s+|\s+or\s+", re.IGNORECASE)
+# "glycoproteins/glycolipids" offers a choice of word within its phrase; "1/4" is a fraction.
+_WORD_CHOICE = re.compile(r"[^\W\d_][\w-]*(?:/[^\W\d_][\w-]*)+")
+_TOKEN = re.compile(r"\d+/\d+|[a-z0-9+\-']+")
+MAX_PHRASE_VARIANTS = 16
+
+STOPWORDS = frozenset(
+    """
+    a an the of to in on at by for from with into onto as and or but if then than that this these those it its is are
+    was were be been being has have had do does did can could may might will would should must so such which who whom
+    whose what when where why how there their they them he she we you your our i each any some more most
+    very also both either about over under between through during per via using used use allow allows allowing
+    """.split()
+)
+NEGATIONS = frozenset({"not", "no", "never", "cannot", "can't", "doesn't", "don't", "isn't", "aren't", "won't", "without"})
+NON_ANSWERS = frozenset({"idk", "dunno", "unsure", "know", "pass", "skip", "n/a", "na", "?"})
+
+_SUFFIXES = (
+    "ational", "ations", "ation", "tions", "tion", "ingly", "ement", "ments", "ment", "ness", "ings", "ing", "edly",
+    "ies", "ied", "ers", "er", "ed", "es", "is", "ly", "s", "e", "y",
+)
+
+# Words in each group count as the same keyword.
+SYNONYM_GROUPS = [
+    ("increase", "rise", "raise", "higher", "greater"),
+    ("decrease", "fall", "lower", "less", "reduce", "drop", "fewer"),
+    ("hydrolyse", "hydrolysis", "breakdown", "break", "split"),
+    ("bond", "link"),
+    ("join", "combine", "bind", "attach"),
+    ("large", "larger", "big", "bigger"),
+    ("small", "smaller", "tiny"),
+    ("fast", "quick", "rapid"),
+    ("make", "produce", "form", "create", "generate", "synthesise"),
+    ("carry", "transport", "move"),
+]
+# Synonym groups that contradict each other. An answer that uses the opposite of a mark-scheme keyword, as in
+# "it increases then decreases" against "increases (1 mark)", is escalated rather than credited for the keyword.
+OPPOSING_GROUPS = [
+    ("increase", "decrease"),
+    ("large", "small"),
+    ("fast", "slow"),
+]
+
+
+def stem(word):
+    """A deliberately small suffix stripper; keeps short words and chemical symbols intact."""
+    if len(word) <= 3 or any(character.isdigit() for character in word):
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            base = word[: -len(suffix)]
+            if suffix in ("ies", "ied"):
+                base += "i"
+            return base
+    return word
+
+
+_SYNONYM_OF = {stem(word): stem(group[0]) for group in SYNONYM_GROUPS for word in group}
+
+
+def keywords(text):
+    normalized = unicodedata.normalize("NFKC", str(text or "")).lower()
+    stems = []
+    for token in _TOKEN.findall(normalized.replace("\u2019", "'")):
+        token = token.strip("'").rstrip("-")
+        if not token or token in STOPWORDS:
+            continue
+        stemmed = stem(token)
+        stems.append(_SYNONYM_OF.get(stemmed, stemmed))
+    return stems
+
+
+_OPPOSITE_WORD = {}
+for _first, _second in OPPOSING_GROUPS:
+    _OPPOSITE_WORD[keywords(_first)[0]] = _second
+    _OPPOSITE_WORD[keywords(_second)[0]] = _first
+
+
+def opposing_words(scheme_words):
+    """Words opposite to keywords of the mark scheme, leaving out opposites the scheme uses itself."""
+    opposites = [_OPPOSITE_WORD[word] for word in scheme_words if word in _OPPOSITE_WORD]
+    return [word for word in dict.fromkeys(opposites) if keywords(word)[0] not in scheme_words]
+
+
+def _phrase_variants(phrase):
+    variants = [phrase]
+    for choice in _WORD_CHOICE.findall(phrase):
+        variants = [variant.replace(choice, word, 1) for variant in variants for word in choice.split("/")]
+        if len(variants) > MAX_PHRASE_VARIANTS:
+            return [phrase.replace("/", " ")]
+    return variants
+
+
+def point_alternatives(point):
+    """Keyword sets that each earn ``point``: ``"Carbon (C) (1 mark)"`` gives ``[{"carbon"}, {"c"}]``."""
+    text = _MARK_ANNOTATION.sub("", str(point or ""))
+    text = _EXAMPLES.sub("", text)
+    bracketed = _PARENTHESES.findall(text)
+    outside = _PARENTHESES.sub(" ", text)
+    alternatives = []
+    for option in _ALTERNATIVE_SEPARATORS.split(outside) + bracketed:
+        for variant in _phrase_variants(option):
+            words = set(keywords(variant))
+            if words and words not in alternatives:
+                alternatives.append(words)
+    return alternatives
+
+
+def _raw_words(text):
+    return _TOKEN.findall(unicodedata.normalize("NFKC", str(text or "")).lower().replace("\u2019", "'"))
+
+
+def _covers(alternative, answer_words, other_points_words):
+    # Words shared with other points cannot earn this one: "gill lamellae" must not be credited by "gill filaments
+    # (primary lamellae)".
+    distinctive = alternative - other_points_words
+    return bool(distinctive & answer_words) and len(alternative & answer_words) / len(alternative) >= COVERAGE_TO_AWARD
+
+
+@dataclass
+class PremarkDecision:
+    score: int | None
+    out_of: int
+    reason: str
+    covered: list
+
+    @property
+    def confident(self):
+        return self.score is not None
+
+    def as_result(self):
+        if self.score == self.out_of:
+            feedback = "Full marks: your answer covers every point in the mark scheme."
+        else:
+            feedback = "No marks: the answer does not address the question. Review the mark scheme points."
+        return {"score": self.score, "out_of": self.out_of, "feedback": feedback, "marked_by": "local"}
+
+
+def premark(question, mark_scheme, user_answer):
+    """Return a ``PremarkDecision``; ``score`` is ``None`` when the answer must go to the model."""
+    if isinstance(mark_scheme, str):
+        mark_scheme = [mark_scheme]
+    points = [point for point in (mark_scheme or []) if str(point).strip()]
+    marks = question_marks(question, points)
+
+    def escalate(reason, covered=()):
+        return PremarkDecision(None, marks, reason, list(covered))
+
+    if not points or marks > settings.PREMARK_MAX_MARKS:
+        return escalate("too_many_marks" if points else "no_mark_scheme")
+    if len(points) != marks:
+        # "Any two from four" schemes need judgement about which points to credit.
+        return escalate("points_not_one_per_mark")
+
+    point_options = [point_alternatives(point) for point in points]
+    if not all(point_options):
+        return escalate("unparsed_point")
+
+    raw_words = set(_raw_words(user_answer))
+    answer_words = set(keywords(user_answer))
+    scheme_words = set().union(*(keywords(point) for point in points))
+    if not (answer_words - NON_ANSWERS - NEGATIONS) and not answer_words & scheme_words:
+        return PremarkDecision(0, marks, "blank", [])
+    if len(_raw_words(user_answer)) > MAX_ANSWER_WORDS:
+        return escalate("long_answer")
+    if raw_words & NEGATIONS - set().union(*(_raw_words(point) for point in points)):
+        # "It is not a polymer" must not earn a "polymer" point.
+        return escalate("negation")
+    if answer_words & {keywords(word)[0] for word in opposing_words(scheme_words)}:
+        return escalate("opposing")
+
+    covered = []
+    for index, (point, alternatives) in enumerate(zip(points, point_options)):
+        other_points_words = set().union(*(keywords(other) for position, other in enumerate(points) if position != index))
+        if not any(_covers(alternative, answer_words, other_points_words) for alternative in alternatives):
+            return escalate("partial_match", covered)
+        covered.append(point)
+    return PremarkDecision(marks, marks, "full_match", covered)
+
+
+def premark_or_evaluate(question, mark_scheme, user_answer, evaluate):
+    """Mark locally when confident, otherwise return ``evaluate()``; both outcomes are counted on ``/metrics``."""
+    if not settings.PREMARK_ENABLED:
+        return evaluate()
+    decision = premark(question, mark_scheme, user_answer)
+    if decision.confident:
+        PREMARK_OUTCOMES.inc(outcome="marked", reason=decision.reason)
+        return decision.as_result()
+    PREMARK_OUTCOMES.inc(outcome="escalated", reason=decision.reason)
+    return evaluate()
+
+
+def iter_bank_items(bank):
+    """Yield every question item (a dict with ``question`` and ``mark_scheme``) in a nested fallback bank."""
+    if isinstance(bank, dict):
+        if "question" in bank and "mark_scheme" in bank:
+            yield bank
+            return
+        for value in bank.values():
+            yield from iter_bank_items(value)
+    elif isinstance(bank, list):
+        for value in bank:
+            yield from iter_bank_items(value)
+
+
+def build_benchmark_corpus(banks, rng, limit=None):
+    """Synthetic answers for the short questions in ``banks``, a mapping of bank label to loaded bank.
+
+    Each question gives four cases: the mark scheme itself (expected full marks), its first point only (partial),
+    another question's model answer (0) and "I don't know" (0). Schemes with a keyword such as "increases" also
+    get the model answer followed by its opposite ("then decreases"). ``expected`` is ``None`` for partial and
+    opposing answers, where only the model can say what the right mark is.
+    """
+    items = []
+    for label, bank in banks.items():
+        for item in iter_bank_items(bank):
+            points = [point for point in item["mark_scheme"] if str(point).strip()]
+            marks = question_marks(item["question"], points)
+            if points and marks <= settings.PREMARK_MAX_MARKS:
+                items.append((label, item["question"], points, marks))
+    rng.shuffle(items)
+    if limit:
+        items = items[:limit]
+
+    cases = []
+    def model_answer(points):
+        return "; ".join(_MARK_ANNOTATION.sub("", str(point)).strip() for point in points)
+
+    for index, (label, question, points, marks) in enumerate(items):
+        cases.append((label, question, points, "full", model_answer(points), marks))
+        if len(points) > 1:
+            cases.append((label, question, points, "partial", model_answer(points[:1]), None))
+        opposites = opposing_words(keywords(" ".join(map(str, points))))
+        if opposites:
+            cases.append((label, question, points, "opposing", f"{model_answer(points)}, then {opposites[0]}", None))
+        # The next question with a different scheme; banks repeat some questions across boards.
+        others = (items[(index + offset) % len(items)][2] for offset in range(1, len(items)))
+        other_points = next((other for other in others if other != points), None)
+        if other_points is not None:
+            cases.append((label, question, points, "off_topic", model_answer(other_points), 0))
+        cases.append((label, question, points, "blank", "I don't know", 0))
+    return [
+        {"bank": label, "question": question, "mark_scheme": points, "kind": kind, "answer": answer, "expected": expected}
+        for label, question, points, kind, answer, expected in cases
+    ]
+
+
+def run_benchmark(cases, llm_mark=None):
+    """Pre-mark every case and summarise escalations and agreement.
+
+    ``llm_mark(case)`` returns the model's score; when given, it is called for every confidently pre-marked case so
+    the local marks can be compared with the model's.
+    """
+    summary = {"cases": len(cases), "escalated": 0, "labelled": 0, "label_agreement": 0, "llm_compared": 0, "llm_agreement": 0}
+    by_kind = {}
+    for case in cases:
+        decision = premark(case["question"], case["mark_scheme"], case["answer"])
+        kind = by_kind.setdefault(case["kind"], {"cases": 0, "escalated": 0})
+        kind["cases"] += 1
+        if not decision.confident:
+            summary["escalated"] += 1
+            kind["escalated"] += 1
+            continue
+        if case["expected"] is not None:
+            summary["labelled"] += 1
+            summary["label_agreement"] += decision.score == case["expected"]
+        if llm_mark is not None:
+            summary["llm_compared"] += 1
+            summary["llm_agreement"] += decision.score == llm_mark(case)
+    summary["by_kind"] = by_kind
+    return summary
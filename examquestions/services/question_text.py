@@ -0,0 +1,50 @@
+"""Normalised question text and its fingerprint, computed once per distinct question text.
+
+A generation request normalises the same questions several times: for the self-contained check, for duplicate
+checks against served history, for the fallback top-up (every item in the bank section) and when recording served
+and pooled questions. ``question_key`` memoises by the question's raw text, so each distinct text is normalised and
+hashed once per process. Bank items are not normalised again after the first request that reads them, and a
+reloaded bank only adds the questions whose text changed.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+import hashlib
+import re
+
+
+# Larger than every fallback bank put together, so bank items stay cached.
+QUESTION_KEY_CACHE_SIZE = 16384
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_MARKS = re.compile(r"\s*\[\d+\s+marks?\]\s*$")
+
+
+@dataclass(frozen=True)
+class QuestionKey:
+    normalized: str
+    fingerprint: str
+
+
+def question_text_from_item(question_item):
+    return str(question_item.get("question", "")).strip()
+
+
+@lru_cache(maxsize=QUESTION_KEY_CACHE_SIZE)
+def question_key(question_text):
+    """The normalised form of ``question_text`` and a SHA-256 fingerprint of it."""
+    normalized = str(question_text or "").strip().lower()
+    normalized = _WHITESPACE.sub(" ", normalized)
+    normalized = _TRAILING_MARKS.sub("", normalized).strip()
+    return QuestionKey(normalized, hashlib.sha256(normalized.encode("utf-8")).hexdigest())
+
+
+def normalize_question_text(question_text):
+    return question_key(question_text).normalized
+
+
+def item_question_key(question_item):
+    return question_key(question_text_from_item(question_item))
+
+
+def normalized_item_question(question_item):
+    return item_question_key(question_item).normalized
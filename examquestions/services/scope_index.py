@@ -0,0 +1,105 @@
+"""Map curriculum scopes to the fallback-bank sections that hold their questions.
+
+Fallback banks are keyed by section titles such as "3.1.1 Monomers and Polymers" or "B1 Cell level systems", which
+do not always match the curriculum's titles exactly. A title is matched to a section exactly, then after
+normalising case, punctuation, "&" and leading specification numbers, then by fuzzy similarity of the normalised
+titles. Each scope's match, and its topic's, is stored in an index keyed by scope key ("topic:12",
+"gcse-subtopic:4:HIGHER") and bank, so a request costs one dict lookup. ``python manage.py fallback_scope_coverage``
+builds the index for the whole curriculum and lists scopes that match no section.
+"""
+from dataclasses import dataclass
+import difflib
+import re
+
+
+# Fuzzy matches need this SequenceMatcher ratio between normalised titles. High enough that "Atomic structure" does
+# not match "Atomic structure and the periodic table".
+FUZZY_MATCH_CUTOFF = 0.85
+
+_SPECIFICATION_NUMBER = re.compile(r"^(?:[a-z]{0,2}\d+(?:\.\d+)*[a-z]?[.:)]?\s+)+")
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+# id(bank) -> (bank, {normalised title: section title}); dropped by ``forget_bank_scopes`` when a bank is reloaded.
+_BANK_TITLES = {}
+# (scope key, id(bank)) -> (bank, ScopeBankKeys)
+_SCOPE_INDEX = {}
+
+
+@dataclass(frozen=True)
+class BankKeyMatch:
+    key: str | None = None
+    method: str | None = None
+
+
+@dataclass(frozen=True)
+class ScopeBankKeys:
+    scope_title: str
+    topic_title: str
+    scope_match: BankKeyMatch
+    topic_match: BankKeyMatch
+
+    @property
+    def keys(self):
+        """Bank sections to try, the scope's own first."""
+        return [match.key for match in (self.scope_match, self.topic_match) if match.key is not None]
+
+
+def normalize_scope_title(title):
+    normalized = str(title or "").strip().lower().replace("&", " and ")
+    normalized = _SPECIFICATION_NUMBER.sub("", normalized)
+    return _NON_ALPHANUMERIC.sub(" ", normalized).strip()
+
+
+def _bank_titles(bank):
+    cached = _BANK_TITLES.get(id(bank))
+    if cached is not None and cached[0] is bank:
+        return cached[1]
+    titles = {}
+    for key, value in bank.items():
+        if isinstance(value, list) and value:
+            titles.setdefault(normalize_scope_title(key), key)
+    _BANK_TITLES[id(bank)] = (bank, titles)
+    return titles
+
+
+def match_bank_key(bank, title):
+    """The bank section for ``title``, and how it was matched."""
+    value = bank.get(title)
+    if isinstance(value, list) and value:
+        return BankKeyMatch(title, "exact")
+    normalized = normalize_scope_title(title)
+    if not normalized:
+        return BankKeyMatch()
+    titles = _bank_titles(bank)
+    if normalized in titles:
+        return BankKeyMatch(titles[normalized], "normalized")
+    close = difflib.get_close_matches(normalized, list(titles), n=1, cutoff=FUZZY_MATCH_CUTOFF)
+    if close:
+        return BankKeyMatch(titles[close[0]], "fuzzy")
+    return BankKeyMatch()
+
+
+def bank_scope_keys(bank, scope_key, scope_title, topic_title):
+    """The indexed bank sections for a scope, matched on first use and again only if its titles change.
+
+    Without a ``scope_key`` the titles are matched but not indexed.
+    """
+    cached = _SCOPE_INDEX.get((scope_key, id(bank))) if scope_key else None
+    if cached is not None:
+        cached_bank, entry = cached
+        if cached_bank is bank and (entry.scope_title, entry.topic_title) == (scope_title, topic_title):
+            return entry
+    scope_match = match_bank_key(bank, scope_title)
+    topic_match = scope_match if topic_title == scope_title else match_bank_key(bank, topic_title)
+    entry = ScopeBankKeys(scope_title, topic_title, scope_match, topic_match)
+    if scope_key:
+        _SCOPE_INDEX[(scope_key, id(bank))] = (bank, entry)
+    return entry
+
+
+def forget_bank_scopes(bank):
+    """Drop the title lookup and index entries for a bank that has been replaced."""
+    _BANK_TITLES.pop(id(bank), None)
+    for index_key, (indexed_bank, _) in list(_SCOPE_INDEX.items()):
+        if indexed_bank is bank:
+            _SCOPE_INDEX.pop(index_key, None)
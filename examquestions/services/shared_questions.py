@@ -0,0 +1,129 @@
+"""A cross-user pool of validated AI questions, keyed by exam board and scope.
+
+``ServedQuestion`` only stops one user seeing the same question twice, so a question generated for one student can
+be served to every other student who asks for the same scope. Generation draws from this pool first, skipping the
+user's served history, and asks the model only for the shortfall. Questions are stored by a fingerprint of their
+normalised text, so the same question is kept once per scope however many times it is generated, and
+near-duplicates of pooled or served questions are skipped on the way in and out.
+"""
+import logging
+
+from django.conf import settings
+from django.db.models import F
+
+from exambuilder.metrics import registry, span
+from examquestions.models import SharedQuestion
+from examquestions.services.fanout import shard_counts
+from examquestions.services.near_duplicates import NearDuplicateIndex
+
+
+logger = logging.getLogger(__name__)
+
+# Pooled questions read per draw or store; near-duplicate checks run in Python over these rows.
+MAX_POOL_CANDIDATES = 500
+SHARED_QUESTIONS = registry.counter(
+    "exambuilder_shared_questions_total",
+    "Questions served from or added to the shared AI question pool, by service and event (served or stored).",
+    ("service", "event"),
+)
+GENERATION_LLM_CALLS_SAVED = registry.counter(
+    "exambuilder_generation_llm_calls_saved_total",
+    "Question generation LLM calls avoided by serving questions from the shared pool, by service.",
+    ("service",),
+)
+
+
+def generation_calls_needed(number_of_questions):
+    """How many completions generating ``number_of_questions`` makes under the current shard size."""
+    if number_of_questions <= 0:
+        return 0
+    return len(shard_counts(number_of_questions, settings.QUESTION_GENERATION_SHARD_SIZE))
+
+
+def draw_shared_questions(exam_board, scope_key, count, excluded_questions):
+    """Up to ``count`` pooled question items that neither repeat nor nearly repeat ``excluded_questions``.
+
+    The least-served questions are drawn first so the pool is used evenly. Drawing does not count a question as
+    served; ``mark_shared_questions_served`` does that in the transaction that commits the generation.
+    """
+    if count <= 0 or not settings.SHARED_QUESTION_POOL_ENABLED:
+        return []
+    with span("shared_pool"):
+        seen = NearDuplicateIndex(excluded_questions)
+        drawn = []
+        candidates = (
+            SharedQuestion.objects.filter(exam_board=exam_board, scope_key=scope_key)
+            .order_by("served_count", "created_at")
+            .values("id", "normalized_question", "question_item")[:MAX_POOL_CANDIDATES]
+        )
+        # Served questions are skipped here rather than with an IN list, which would grow with the user's history.
+        for row in candidates:
+            if row["normalized_question"] in seen:
+                continue
+            seen.add(row["normalized_question"])
+            drawn.append(row)
+            if len(drawn) == count:
+                break
+    return [row["question_item"] for row in drawn]
+
+
+def mark_shared_questions_served(exam_board, scope_key, question_keys):
+    """Add one to ``served_count`` for the pooled questions with these ``QuestionKey``s."""
+    fingerprints = [key.fingerprint for key in question_keys]
+    if not fingerprints:
+        return 0
+    return SharedQuestion.objects.filter(exam_board=exam_board, scope_key=scope_key, fingerprint__in=fingerprints).update(
+        served_count=F("served_count") + 1
+    )
+
+
+def store_shared_questions(service, exam_board, scope_key, questions):
+    """Add ``(QuestionKey, question_item)`` pairs to the pool, skipping near-duplicates of pooled questions."""
+    if not questions or not settings.SHARED_QUESTION_POOL_ENABLED:
+        return 0
+    pooled = NearDuplicateIndex(
+        SharedQuestion.objects.filter(exam_board=exam_board, scope_key=scope_key)
+        .order_by("served_count", "created_at")
+        .values_list("normalized_question", flat=True)[:MAX_POOL_CANDIDATES]
+    )
+    records = []
+    for key, question_item in questions:
+        if key.normalized in pooled:
+            continue
+        pooled.add(key.normalized)
+        records.append(
+            SharedQuestion(
+                exam_board=exam_board,
+                scope_key=scope_key,
+                fingerprint=key.fingerprint,
+                normalized_question=key.normalized,
+                question_item=question_item,
+            )
+        )
+    # A concurrent request may have pooled the same question since the lookup.
+    SharedQuestion.objects.bulk_create(records, ignore_conflicts=True)
+    if records:
+        SHARED_QUESTIONS.inc(len(records), service=service, event="stored")
+    return len(records)
+
+
+def llm_calls_saved(number_of_questions, shared_count):
+    """Generation calls avoided by serving ``shared_count`` of ``number_of_questions`` from the pool."""
+    return generation_calls_needed(number_of_questions) - generation_calls_needed(number_of_questions - shared_count)
+
+
+def report_shared_generation(service, number_of_questions, shared_count):
+    """Count pooled questions served and the LLM calls that saved; returns the calls saved."""
+    saved = llm_calls_saved(number_of_questions, shared_count)
+    if shared_count:
+        SHARED_QUESTIONS.inc(shared_count, service=service, event="served")
+    if saved:
+        GENERATION_LLM_CALLS_SAVED.inc(saved, service=service)
+    logger.info(
+        "Shared question pool | service=%s | requested=%s | shared=%s | llm_calls_saved=%s",
+        service,
+        number_of_questions,
+        shared_count,
+        saved,
+    )
+    return saved
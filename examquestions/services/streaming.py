@@ -0,0 +1,52 @@
+"""Incremental parsing of streamed JSON completions."""
+import json
+
+import jiter
+
+from examquestions.services.json_salvage import salvage_json_array
+
+
+def iter_json_array_items(chunks, key, is_valid_item=None):
+    """Yield each element of the top-level ``key`` array as soon as the model has finished writing it.
+
+    ``chunks`` are the text deltas of a ``json_object`` completion. Elements are yielded once, in order. If the
+    finished document is not valid JSON, the remaining well-formed elements that pass ``is_valid_item`` are
+    salvaged; ``json.JSONDecodeError`` is only raised when nothing at all could be recovered.
+    """
+    buffer = bytearray()
+    emitted = 0
+
+    for chunk in chunks:
+        buffer.extend(chunk.encode("utf-8"))
+        # An element is only known to be finished once the next one opens, so skip re-parsing until then.
+        if "{" not in chunk:
+            continue
+
+        try:
+            partial = jiter.from_json(bytes(buffer), partial_mode=True)
+        except ValueError:
+            # Leave malformed output to the strict parse at the end of the stream.
+            continue
+        items = partial.get(key) if isinstance(partial, dict) else None
+        if not isinstance(items, list):
+            continue
+        # The last element may still be mid-write; everything before it is final.
+        while emitted < len(items) - 1:
+            yield items[emitted]
+            emitted += 1
+
+    content = buffer.decode("utf-8").strip()
+    try:
+        document = json.loads(content)
+    except json.JSONDecodeError:
+        salvaged = salvage_json_array(content, key, key, is_valid_item or (lambda item: True))
+        if not emitted and not salvaged.items:
+            raise
+        for position, item in zip(salvaged.positions, salvaged.items):
+            if position >= emitted:
+                yield item
+        return
+
+    items = document.get(key) if isinstance(document, dict) else None
+    for item in (items or [])[emitted:]:
+        yield item
@@ -1,17 +1,46 @@
+from datetime import timedelta
+import hashlib
 import json
+import os
+import random
 import tempfile
 from unittest.mock import Mock, patch
 from pathlib import Path
 from io import StringIO
 from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+import httpx
+from openai import APIConnectionError, OpenAI
 from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APITestCase
-from accounts.models import QuestionUsage
+from accounts.models import QuestionUsage, UserEntitlement
 from accounts.models import CustomUser
-from .models import BiologyTopic, BiologySubTopic, BiologySubCategory, GCSEScienceTopic, GCSEScienceSubTopic, GCSEScienceSubCategory, GCSEScienceRoute, QuestionSession, QualificationPath, ServedQuestion
-from .services import ai, aiEssay, aiGCSE
-from .views import GCSE_SUBJECT_ERROR_MESSAGE, is_self_contained_ai_question, resolve_gcse_fallback_bank_path
+from .models import BiologyTopic, BiologySubTopic, BiologySubCategory, GCSEScienceTopic, GCSEScienceSubTopic, GCSEScienceSubCategory, GCSEScienceRoute, IdempotencyRecord, Job, LLMCall, LLMCallRollup, AnswerResult, QuestionSession, QualificationPath, ServedQuestion, SessionQuestion, SharedQuestion
+from exambuilder.metrics import PHASE_DURATION, ServerTimingMiddleware, format_server_timing, span
+from .services import ai, aiEssay, aiGCSE, llm_provider, llm_telemetry
+from .services.answer_stats import question_difficulty, weak_areas
+from .services.fallback_banks import FALLBACK_BANK_LOADS, FallbackBankManager, bank_replaced
+from .services.fake_openai import FakeOpenAIConfig, start_fake_openai_server
+from .services.fanout import create_chat_completions_concurrently, shard_counts
+from .services.json_salvage import JSON_SALVAGE_ITEMS, is_valid_question_item, is_valid_result_item, scan_json_array
+from .services.llm_cassette import Cassette, CassetteBackend, CassetteMiss
+from .services.load_benchmark import parse_mix, percentile, summarize_samples
+from .services.model_routing import LLM_ROUTE_CALLS, LLM_ROUTE_SKIPS
+from .services.near_duplicates import NearDuplicateIndex, is_near_duplicate, question_sketch
+from .services.output_budget import marking_budget, question_marks
+from .services.shared_questions import GENERATION_LLM_CALLS_SAVED, SHARED_QUESTIONS, draw_shared_questions
+from .services.question_text import item_question_key, question_key
+from .services.scope_index import bank_scope_keys, match_bank_key, normalize_scope_title
+from .services.premarker import PREMARK_OUTCOMES, build_benchmark_corpus, point_alternatives, premark, run_benchmark, stem
+from .services.streaming import iter_json_array_items
+from .services.idempotency import request_fingerprint
+from .services.jobs import fail_stale_jobs, run_next_job
+from .views import GCSE_SUBJECT_ERROR_MESSAGE, collect_valid_ai_questions, generic_fallback_pools, get_fallback_pool, is_self_contained_ai_question, scan_question_context, resolve_gcse_fallback_bank_path
 
 
 class ExportCurriculumCommandTests(APITestCase):
@@ -645,6 +674,10 @@ class GenerateExamQuestionsLimitTests(APITestCase):
 
 
 class QuestionPromptContractTests(APITestCase):
+	def setUp(self):
+		llm_telemetry.call_buffer.reset()
+		self.addCleanup(llm_telemetry.call_buffer.reset)
+
 	@patch('examquestions.services.ai._create_json_chat_completion')
 	def test_alevel_generation_prompt_requires_self_contained_question_context(self, mock_create_completion):
 		mock_create_completion.return_value = _mock_openai_json_response({'questions': []})
@@ -652,7 +685,7 @@ class QuestionPromptContractTests(APITestCase):
 		ai.generate_questions('Module 1 (SubTopic: Evaluate methods)', 'OCR', 1)
 
 		messages = mock_create_completion.call_args.kwargs['messages']
-		prompt = messages[1]['content']
+		prompt = '\n'.join(message['content'] for message in messages)
 
 		self.assertIn('Make each question fully answerable from the text you return.', prompt)
 		self.assertIn('Do not refer to any unseen method, figure, graph, table, practical setup, results, or source material.', prompt)
@@ -665,7 +698,7 @@ class QuestionPromptContractTests(APITestCase):
 		aiEssay.generate_questions('Energy transfers', 3)
 
 		messages = mock_create_completion.call_args.kwargs['messages']
-		prompt = messages[1]['content']
+		prompt = '\n'.join(message['content'] for message in messages)
 
 		self.assertIn('qualified teacher creating AQA A-level Biology essay questions', prompt)
 		self.assertIn('Create exactly 1 essay-style question', prompt)
@@ -685,7 +718,7 @@ class QuestionPromptContractTests(APITestCase):
 		ai.generate_questions('Cells', 'EDEXCEL', 1, specification='Spec B')
 
 		messages = mock_create_completion.call_args.kwargs['messages']
-		prompt = messages[1]['content']
+		prompt = '\n'.join(message['content'] for message in messages)
 
 		self.assertIn('the EDEXCEL Spec B specification', prompt)
 
@@ -702,7 +735,7 @@ class QuestionPromptContractTests(APITestCase):
 		)
 
 		messages = mock_create_completion.call_args.kwargs['messages']
-		prompt = messages[1]['content']
+		prompt = '\n'.join(message['content'] for message in messages)
 
 		self.assertIn('the EDEXCEL Spec B specification', prompt)
 
@@ -729,11 +762,56 @@ class QuestionPromptContractTests(APITestCase):
 		)
 
 		messages = mock_create_completion.call_args.kwargs['messages']
-		prompt = messages[1]['content']
+		prompt = '\n'.join(message['content'] for message in messages)
 
 		self.assertIn('the EDEXCEL Spec B specification', prompt)
 
 
+	@patch('examquestions.services.ai._create_json_chat_completion')
+	def test_static_instructions_form_a_shared_system_prefix(self, mock_create_completion):
+		mock_create_completion.return_value = _mock_openai_json_response({'score': 1, 'out_of': 1, 'feedback': 'ok'})
+
+		ai.evaluate_response_with_openai('Name one organelle. [1 mark]', ['Nucleus'], 'Nucleus', 'OCR')
+		ai.evaluate_response_with_openai('State one function of ATP. [1 mark]', ['Energy source'], 'Energy', 'OCR')
+
+		first_messages, second_messages = (call.kwargs['messages'] for call in mock_create_completion.call_args_list)
+		self.assertEqual(first_messages[0]['content'], second_messages[0]['content'])
+		self.assertNotIn('Name one organelle', first_messages[0]['content'])
+		self.assertIn('Name one organelle', first_messages[1]['content'])
+		self.assertEqual(mock_create_completion.call_args.kwargs['cache_key'], 'alevel:mark:OCR:')
+
+	def test_static_prefixes_are_below_the_prompt_cache_minimum(self):
+		fake_server = start_fake_openai_server(FakeOpenAIConfig(latency_ms=0, latency_jitter_ms=0, tokens_per_second=1e6, seed=9))
+		self.addCleanup(fake_server.server_close)
+		self.addCleanup(fake_server.shutdown)
+		client = OpenAI(api_key='prefix', base_url=fake_server.base_url)
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			for _ in range(2):
+				ai.generate_questions('Cells', 'AQA', 1)
+				aiGCSE.evaluate_response_with_openai('Explain osmosis. [2 marks]', ['a', 'b'], 'Water moves', 'AQA', 'BIOLOGY', 'HIGHER')
+
+		# The README says these prompts are not cached yet; lengthening a prefix past 1024 tokens should update it.
+		llm_telemetry.call_buffer.flush()
+		self.assertEqual(LLMCall.objects.count(), 4)
+		self.assertFalse(LLMCall.objects.filter(cached_tokens__gt=0).exists())
+
+	def test_cached_prompt_tokens_are_recorded(self):
+		completion = _mock_openai_json_response({'questions': []})
+		completion.usage = Mock(prompt_tokens=2000, completion_tokens=100, prompt_tokens_details=Mock(cached_tokens=1536))
+		client = Mock()
+		client.chat.completions.create.return_value = completion
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			ai.generate_questions('Cells', 'AQA', 1)
+
+		llm_telemetry.call_buffer.flush()
+		call = LLMCall.objects.get()
+		self.assertEqual(call.cached_tokens, 1536)
+		self.assertEqual(str(call.cost_usd), '0.000499')
+		self.assertEqual(client.chat.completions.create.call_args.kwargs['prompt_cache_key'], 'alevel:generate:AQA:')
+
+
 class AIQuestionValidationTests(APITestCase):
 	def test_validator_rejects_unseen_graph_reference(self):
 		self.assertFalse(
@@ -749,6 +827,39 @@ class AIQuestionValidationTests(APITestCase):
 			})
 		)
 
+	def test_scanner_reports_every_category_in_one_pass(self):
+		hits = scan_question_context('a student heats the mixture in a water bath and measures the time taken. evaluate the method used.')
+
+		self.assertEqual(hits['unseen_resource'], set())
+		self.assertEqual(hits['method_evaluation'], {0})
+		self.assertEqual(hits['procedural_detail'], {1, 4, 6, 9, 13})
+		self.assertEqual(scan_question_context('use the data in the table to explain the trend.')['unseen_resource'], {3, 4})
+
+	def test_scanner_agrees_with_separate_patterns_on_every_bank(self):
+		output = StringIO()
+		call_command('self_contained_benchmark', '--repeat', '1', stdout=output)
+
+		summary = output.getvalue().strip().splitlines()[-1]
+		self.assertTrue(summary.startswith('All banks:'))
+		self.assertIn(' 0 mismatches', summary)
+
+	def test_generic_pools_are_built_once_per_bank(self):
+		bank = {
+			'Enzymes': [
+				{'question': 'Define the term enzyme. [1 mark]', 'total_marks': 1},
+				{'question': 'Explain how temperature affects enzyme activity. [5 marks]', 'total_marks': 5},
+				{'question': 'Use the graph to describe the trend. [2 marks]', 'total_marks': 2},
+			],
+			'Respiration': [{'question': 'Compare aerobic and anaerobic respiration in detail. [8 marks]', 'total_marks': 8}],
+		}
+
+		pools = generic_fallback_pools(bank)
+
+		self.assertEqual({band: len(questions) for band, questions in pools.items()}, {'1-3': 1, 'all': 3})
+		self.assertIs(generic_fallback_pools(bank), pools)
+		self.assertIs(get_fallback_pool(bank, 'Cells', 'Cells', allow_generic=True), pools['1-3'])
+		self.assertEqual(get_fallback_pool({'Respiration': bank['Respiration']}, 'Cells', 'Cells', allow_generic=True), bank['Respiration'])
+
 	@patch('examquestions.services.aiGCSE._create_json_chat_completion')
 	def test_gcse_generation_prompt_requires_self_contained_question_context(self, mock_create_completion):
 		mock_create_completion.return_value = _mock_openai_json_response({'questions': []})
@@ -756,7 +867,7 @@ class AIQuestionValidationTests(APITestCase):
 		aiGCSE.generate_questions('Enzymes', 'OCR', 1, 'BIOLOGY', 'FOUNDATION')
 
 		messages = mock_create_completion.call_args.kwargs['messages']
-		prompt = messages[1]['content']
+		prompt = '\n'.join(message['content'] for message in messages)
 
 		self.assertIn('Make each question fully answerable from the text you return.', prompt)
 		self.assertIn('Do not refer to any unseen method, figure, graph, table, practical setup, results, or source material.', prompt)
@@ -1582,3 +1693,1737 @@ class EdexcelSpecificationFlowTests(APITestCase):
 		session = QuestionSession.objects.get(user=self.user)
 		self.assertEqual(session.specification, 'Spec A')
 		self.assertEqual(session.exam_board, 'EDEXCEL')
+
+
+class AsyncJobQueueTests(APITestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create_user(
+			email='jobs@example.com',
+			username='jobs-user',
+			password='testpass123',
+			has_alevel_paid_access=True,
+		)
+		self.topic = BiologyTopic.objects.create(topic='Essays', exam_board='AQA')
+		self.generate_url = reverse('generate-exam-questions')
+		self.mark_url = reverse('mark-user-answer')
+		self.client.force_authenticate(user=self.user)
+
+	@patch('examquestions.views.generate_essay_questions')
+	def test_async_essay_generation_returns_job_and_worker_completes_it(self, mock_generate_essay_questions):
+		mock_generate_essay_questions.return_value = {
+			'questions': [
+				{
+					'question': 'The importance of ATP in biological processes. [25 marks]',
+					'total_marks': 25,
+					'mark_scheme': ['Reward breadth, relevance, and synoptic links.'],
+				}
+			]
+		}
+
+		response = self.client.post(
+			self.generate_url,
+			{'question_type': 'ESSAY_25_MARK', 'async': True},
+			format='json',
+		)
+
+		self.assertEqual(response.status_code, 202)
+		job_id = response.data['job_id']
+		self.assertEqual(response.data['poll_url'], reverse('get-job-status', args=[job_id]))
+		mock_generate_essay_questions.assert_not_called()
+		self.assertFalse(QuestionSession.objects.filter(user=self.user).exists())
+
+		poll_response = self.client.get(response.data['poll_url'])
+		self.assertEqual(poll_response.data['status'], Job.Status.QUEUED)
+
+		job = run_next_job(worker_id='test-worker')
+
+		self.assertEqual(job.id, job_id)
+		self.assertEqual(job.status, Job.Status.SUCCEEDED)
+		mock_generate_essay_questions.assert_called_once()
+		poll_response = self.client.get(response.data['poll_url'])
+		self.assertEqual(poll_response.status_code, 200)
+		self.assertEqual(poll_response.data['status'], Job.Status.SUCCEEDED)
+		self.assertEqual(poll_response.data['status_code'], 200)
+		session = QuestionSession.objects.get(user=self.user)
+		self.assertEqual(poll_response.data['result']['session_id'], session.id)
+		self.assertIsNone(run_next_job())
+
+	@patch('examquestions.views.evaluate_essay_response_with_openai')
+	def test_async_essay_marking_runs_in_worker(self, mock_essay_mark):
+		mock_essay_mark.return_value = {
+			'score': 18,
+			'out_of': 25,
+			'feedback': 'Good breadth.',
+			'strengths': ['a', 'b', 'c'],
+			'improvements': ['d', 'e', 'f'],
+		}
+
+		response = self.client.post(
+			f'{self.mark_url}?async=1',
+			{
+				'qualification': 'ALEVEL_BIOLOGY',
+				'exam_board': 'AQA',
+				'question_type': 'ESSAY_25_MARK',
+				'question': 'The importance of ATP in biological processes. [25 marks]',
+				'mark_scheme': ['Reward breadth, relevance, and synoptic links.'],
+				'user_answer': 'ATP provides energy for active transport.',
+			},
+			format='json',
+		)
+
+		self.assertEqual(response.status_code, 202)
+		mock_essay_mark.assert_not_called()
+
+		run_next_job()
+
+		poll_response = self.client.get(response.data['poll_url'])
+		self.assertEqual(poll_response.data['status'], Job.Status.SUCCEEDED)
+		self.assertEqual(poll_response.data['result']['score'], 18)
+
+	def test_async_validation_errors_are_returned_before_queueing(self):
+		response = self.client.post(
+			self.mark_url,
+			{'async': 'true', 'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'NOPE'},
+			format='json',
+		)
+
+		self.assertEqual(response.status_code, 400)
+		self.assertFalse(Job.objects.exists())
+
+	def test_async_generation_over_free_limit_is_rejected_before_queueing(self):
+		free_user = CustomUser.objects.create_user(
+			email='free-jobs@example.com',
+			username='free-jobs-user',
+			password='testpass123',
+		)
+		QuestionUsage.objects.create(
+			user=free_user,
+			date=timezone.localdate(),
+			question_count=UserEntitlement.FREE_DAILY_QUESTION_LIMIT,
+		)
+		self.client.force_authenticate(user=free_user)
+
+		response = self.client.post(
+			f'{self.generate_url}?async=1',
+			{
+				'qualification': 'ALEVEL_BIOLOGY',
+				'exam_board': 'AQA',
+				'topic_id': self.topic.id,
+				'number_of_questions': 1,
+			},
+			format='json',
+		)
+
+		self.assertEqual(response.status_code, 403)
+		self.assertFalse(Job.objects.exists())
+
+	def test_job_status_is_private_to_its_owner(self):
+		other_user = CustomUser.objects.create_user(
+			email='other-jobs@example.com',
+			username='other-jobs-user',
+			password='testpass123',
+		)
+		job = Job.objects.create(user=other_user, kind=Job.Kind.MARK_ANSWER, payload={})
+
+		response = self.client.get(reverse('get-job-status', args=[job.id]))
+
+		self.assertEqual(response.status_code, 404)
+
+	def test_stale_running_jobs_are_failed_not_retried(self):
+		stale_start = timezone.now() - timedelta(hours=1)
+		stale = Job.objects.create(user=self.user, kind=Job.Kind.MARK_ANSWER, status=Job.Status.RUNNING, attempts=1, started_at=stale_start)
+		recent = Job.objects.create(user=self.user, kind=Job.Kind.MARK_ANSWER, status=Job.Status.RUNNING, attempts=1, started_at=timezone.now())
+
+		self.assertEqual(fail_stale_jobs(), 1)
+
+		stale.refresh_from_db()
+		recent.refresh_from_db()
+		self.assertEqual(stale.status, Job.Status.FAILED)
+		self.assertIsNotNone(stale.finished_at)
+		self.assertEqual(recent.status, Job.Status.RUNNING)
+		self.assertIsNone(run_next_job())
+
+	def test_run_worker_command_drains_queue_once(self):
+		Job.objects.create(user=self.user, kind=Job.Kind.MARK_ANSWER, payload={'exam_board': 'NOPE'})
+		Job.objects.create(user=self.user, kind=Job.Kind.MARK_ANSWER, payload={'exam_board': 'NOPE'})
+
+		stdout_buffer = StringIO()
+		call_command('run_worker', once=True, worker_id='cmd-worker', stdout=stdout_buffer)
+
+		self.assertFalse(Job.objects.filter(status=Job.Status.QUEUED).exists())
+		self.assertEqual(set(Job.objects.values_list('worker_id', flat=True)), {'cmd-worker'})
+
+
+class IdempotencyKeyTests(APITestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create_user(
+			email='idempotent@example.com',
+			username='idempotent-user',
+			password='testpass123',
+			has_alevel_paid_access=True,
+		)
+		BiologyTopic.objects.create(topic='Essays', exam_board='AQA')
+		self.generate_url = reverse('generate-exam-questions')
+		self.mark_url = reverse('mark-user-answer')
+		self.payload = {'question_type': 'ESSAY_25_MARK'}
+		self.client.force_authenticate(user=self.user)
+
+	def _essay_questions(self):
+		return {
+			'questions': [
+				{
+					'question': 'The importance of ATP in biological processes. [25 marks]',
+					'total_marks': 25,
+					'mark_scheme': ['Reward breadth, relevance, and synoptic links.'],
+				}
+			]
+		}
+
+	@patch('examquestions.views.generate_essay_questions')
+	def test_repeated_key_replays_first_response_without_regenerating(self, mock_generate_essay_questions):
+		mock_generate_essay_questions.return_value = self._essay_questions()
+
+		first = self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+		second = self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+		self.assertEqual(first.status_code, 200)
+		self.assertEqual(second.status_code, 200)
+		self.assertEqual(second['Idempotent-Replayed'], 'true')
+		self.assertEqual(second.data['session_id'], first.data['session_id'])
+		mock_generate_essay_questions.assert_called_once()
+		self.assertEqual(QuestionSession.objects.filter(user=self.user).count(), 1)
+
+	@patch('examquestions.views.generate_essay_questions')
+	def test_different_keys_and_missing_key_run_independently(self, mock_generate_essay_questions):
+		mock_generate_essay_questions.side_effect = [
+			{'questions': [{'question': f'Discuss the importance of {theme}. [25 marks]', 'total_marks': 25, 'mark_scheme': ['Reward synoptic links.']}]}
+			for theme in ('ATP', 'enzymes', 'membranes')
+		]
+
+		self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+		self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+		self.client.post(self.generate_url, self.payload, format='json')
+
+		self.assertEqual(mock_generate_essay_questions.call_count, 3)
+		self.assertEqual(IdempotencyRecord.objects.filter(user=self.user).count(), 2)
+
+	@patch('examquestions.views.generate_essay_questions')
+	def test_reusing_key_with_different_body_is_rejected(self, mock_generate_essay_questions):
+		mock_generate_essay_questions.return_value = self._essay_questions()
+		self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+		response = self.client.post(
+			self.generate_url,
+			{'question_type': 'ESSAY_25_MARK', 'question_count': 2},
+			format='json',
+			HTTP_IDEMPOTENCY_KEY='retry-1',
+		)
+
+		self.assertEqual(response.status_code, 422)
+		mock_generate_essay_questions.assert_called_once()
+
+	@patch('examquestions.views.generate_essay_questions')
+	def test_concurrent_duplicate_waits_for_in_flight_result(self, mock_generate_essay_questions):
+		record = IdempotencyRecord.objects.create(
+			user=self.user,
+			endpoint='generate-questions',
+			key='retry-1',
+			request_fingerprint=request_fingerprint('generate-questions', self.payload),
+			expires_at=timezone.now() + timedelta(hours=1),
+		)
+
+		def finish_in_flight_request(_seconds):
+			IdempotencyRecord.objects.filter(pk=record.pk).update(
+				status=IdempotencyRecord.Status.COMPLETED,
+				response_status_code=200,
+				response_body={'session_id': 123},
+			)
+
+		with patch('examquestions.services.idempotency.time.sleep', side_effect=finish_in_flight_request) as mock_sleep:
+			response = self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+		mock_sleep.assert_called_once()
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data, {'session_id': 123})
+		mock_generate_essay_questions.assert_not_called()
+
+	@override_settings(IDEMPOTENCY_WAIT_TIMEOUT_SECONDS=0)
+	@patch('examquestions.views.generate_essay_questions')
+	def test_duplicate_of_running_request_gets_409_with_retry_after(self, mock_generate_essay_questions):
+		IdempotencyRecord.objects.create(
+			user=self.user,
+			endpoint='generate-questions',
+			key='retry-2',
+			request_fingerprint=request_fingerprint('generate-questions', self.payload),
+			locked_until=timezone.now() + timedelta(minutes=5),
+			expires_at=timezone.now() + timedelta(hours=1),
+		)
+
+		response = self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+
+		self.assertEqual(response.status_code, 409)
+		self.assertEqual(response['Retry-After'], '5')
+		mock_generate_essay_questions.assert_not_called()
+
+	@override_settings(IDEMPOTENCY_WAIT_TIMEOUT_SECONDS=0)
+	@patch('examquestions.views.generate_essay_questions')
+	def test_in_progress_key_past_its_lease_is_taken_over(self, mock_generate_essay_questions):
+		mock_generate_essay_questions.return_value = self._essay_questions()
+		IdempotencyRecord.objects.create(
+			user=self.user,
+			endpoint='generate-questions',
+			key='retry-3',
+			request_fingerprint=request_fingerprint('generate-questions', self.payload),
+			locked_until=timezone.now() - timedelta(seconds=1),
+			expires_at=timezone.now() + timedelta(hours=1),
+		)
+
+		response = self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-3')
+
+		self.assertEqual(response.status_code, 200)
+		mock_generate_essay_questions.assert_called_once()
+		record = IdempotencyRecord.objects.get(user=self.user, key='retry-3')
+		self.assertEqual(record.status, IdempotencyRecord.Status.COMPLETED)
+		self.assertIsNone(record.locked_until)
+
+	@patch('examquestions.views.generate_essay_questions')
+	def test_expired_key_runs_again(self, mock_generate_essay_questions):
+		mock_generate_essay_questions.return_value = self._essay_questions()
+		IdempotencyRecord.objects.create(
+			user=self.user,
+			endpoint='generate-questions',
+			key='retry-1',
+			request_fingerprint=request_fingerprint('generate-questions', self.payload),
+			status=IdempotencyRecord.Status.COMPLETED,
+			response_status_code=200,
+			response_body={'session_id': 123},
+			expires_at=timezone.now() - timedelta(seconds=1),
+		)
+
+		response = self.client.post(self.generate_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response.data['session_id'], 123)
+		mock_generate_essay_questions.assert_called_once()
+
+	@patch('examquestions.views.evaluate_essay_response_with_openai')
+	def test_server_errors_are_not_stored_so_retries_mark_again(self, mock_essay_mark):
+		mock_essay_mark.side_effect = [
+			RuntimeError('upstream timeout'),
+			{'score': 18, 'out_of': 25, 'feedback': 'Good breadth.', 'strengths': [], 'improvements': []},
+		]
+		payload = {
+			'qualification': 'ALEVEL_BIOLOGY',
+			'exam_board': 'AQA',
+			'question_type': 'ESSAY_25_MARK',
+			'question': 'The importance of ATP in biological processes. [25 marks]',
+			'mark_scheme': ['Reward breadth, relevance, and synoptic links.'],
+			'user_answer': 'ATP provides energy for active transport.',
+		}
+
+		first = self.client.post(self.mark_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='mark-1')
+		second = self.client.post(self.mark_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='mark-1')
+		third = self.client.post(self.mark_url, payload, format='json', HTTP_IDEMPOTENCY_KEY='mark-1')
+
+		self.assertEqual(first.status_code, 500)
+		self.assertEqual(second.status_code, 200)
+		self.assertEqual(third.data['score'], 18)
+		self.assertEqual(third['Idempotent-Replayed'], 'true')
+		self.assertEqual(mock_essay_mark.call_count, 2)
+
+
+class LoadBenchmarkTests(APITestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.fake_server = start_fake_openai_server(FakeOpenAIConfig(latency_ms=0, latency_jitter_ms=0, tokens_per_second=1e6, seed=7))
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.fake_server.shutdown()
+		cls.fake_server.server_close()
+		super().tearDownClass()
+
+	def _fake_client(self):
+		return OpenAI(api_key='loadbench', base_url=self.fake_server.base_url)
+
+	def test_fake_server_answers_every_prompt_shape(self):
+		client = self._fake_client()
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			questions = ai.generate_questions('Enzymes', 'AQA', 3)['questions']
+			gcse_questions = aiGCSE.generate_questions('Atoms', 'AQA', 2, 'CHEMISTRY', 'HIGHER')['questions']
+			essay = aiEssay.generate_questions('', 1)['questions'][0]
+			mark = ai.evaluate_response_with_openai(questions[0]['question'], questions[0]['mark_scheme'], 'answer', 'AQA')
+			batch = aiGCSE.evaluate_batch_responses_with_openai([{'question': 'q'}, {'question': 'q2'}], 'AQA', 'CHEMISTRY', 'HIGHER')
+			feedback = ai.get_feedback_from_openai('How did I do?')
+
+		self.assertEqual(len(questions), 3)
+		self.assertEqual(len(gcse_questions), 2)
+		self.assertEqual(len({q['question'] for q in questions + gcse_questions}), 5)
+		self.assertEqual(essay['total_marks'], 25)
+		self.assertLessEqual(mark['score'], mark['out_of'])
+		self.assertEqual(len(batch['results']), 2)
+		self.assertEqual(len(feedback['strengths']), 3)
+
+	def test_summary_reports_percentiles_and_rps_per_endpoint(self):
+		samples = [('mark', 200, value / 1000) for value in range(1, 101)] + [('catalog', 500, 0.002)]
+
+		summary = summarize_samples(samples, elapsed_seconds=10)
+
+		self.assertEqual(summary['endpoints']['mark']['p50_ms'], 50.0)
+		self.assertEqual(summary['endpoints']['mark']['p99_ms'], 99.0)
+		self.assertEqual(summary['endpoints']['mark']['rps'], 10.0)
+		self.assertEqual(summary['endpoints']['catalog']['errors'], 1)
+		self.assertEqual(summary['total']['requests'], 101)
+		self.assertIsNone(percentile([], 0.5))
+
+	def test_parse_mix_rejects_unknown_endpoints(self):
+		self.assertEqual(parse_mix('generate=1,mark=3'), {'generate': 1.0, 'mark': 3.0})
+		with self.assertRaises(ValueError):
+			parse_mix('delete=1')
+
+
+class StreamingGenerationTests(APITestCase):
+	def setUp(self):
+		llm_telemetry.call_buffer.reset()
+		self.addCleanup(llm_telemetry.call_buffer.reset)
+		self.user = CustomUser.objects.create_user(
+			email='streaming@example.com',
+			username='streaming-user',
+			password='testpass123',
+			has_alevel_paid_access=True,
+		)
+		self.topic = BiologyTopic.objects.create(topic='Enzymes', exam_board='AQA')
+		self.url = reverse('generate-exam-questions-stream')
+		self.client.force_authenticate(user=self.user)
+
+	def _question(self, text):
+		return {'question': f'{text} [2 marks]', 'total_marks': 2, 'mark_scheme': ['Point one (1 mark)', 'Point two (1 mark)']}
+
+	def _events(self, response):
+		events = []
+		for block in b''.join(response.streaming_content).decode().strip().split('\n\n'):
+			event_line, data_line = block.split('\n')
+			events.append((event_line.removeprefix('event: '), json.loads(data_line.removeprefix('data: '))))
+		return events
+
+	@patch('examquestions.views.stream_generate_questions')
+	def test_stream_sends_each_accepted_question_then_done(self, mock_stream_generate_questions):
+		consumed = []
+
+		def fake_stream(*args, **kwargs):
+			for item in [
+				self._question('Describe the induced fit model.'),
+				self._question('Use the graph in Figure 1 to describe the trend.'),
+				self._question('Describe the induced fit model.'),
+				self._question('Explain how competitive inhibitors work.'),
+				self._question('Never requested.'),
+			]:
+				consumed.append(item['question'])
+				yield item
+
+		mock_stream_generate_questions.side_effect = fake_stream
+
+		response = self.client.post(
+			self.url,
+			{'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': self.topic.id, 'number_of_questions': 2},
+			format='json',
+		)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		events = self._events(response)
+		self.assertEqual([name for name, _ in events], ['question', 'question', 'done'])
+		self.assertEqual([data['index'] for _, data in events[:2]], [0, 1])
+		self.assertEqual(events[1][1]['question']['question'], 'Explain how competitive inhibitors work. [2 marks]')
+		self.assertEqual(len(consumed), 4)
+		session = QuestionSession.objects.get(user=self.user)
+		self.assertEqual(events[2][1]['session_id'], session.id)
+		self.assertEqual(session.total_available, 4)
+		self.assertEqual(ServedQuestion.objects.filter(user=self.user).count(), 2)
+
+	def test_invalid_request_is_rejected_before_streaming(self):
+		response = self.client.post(self.url, {'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA'}, format='json')
+
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.data['error'], 'Missing required fields')
+
+	@patch('examquestions.views.stream_generate_questions')
+	def test_stream_failure_ends_with_error_event(self, mock_stream_generate_questions):
+		mock_stream_generate_questions.side_effect = RuntimeError('upstream timed out')
+
+		response = self.client.post(
+			self.url,
+			{'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': self.topic.id, 'number_of_questions': 1},
+			format='json',
+		)
+
+		self.assertEqual(self._events(response), [('error', {'error': 'upstream timed out', 'status': 500})])
+		self.assertFalse(QuestionSession.objects.filter(user=self.user).exists())
+
+	@patch('examquestions.views.stream_generate_questions')
+	def test_free_quota_is_charged_before_the_first_question_is_sent(self, mock_stream_generate_questions):
+		free_user = CustomUser.objects.create_user(
+			email='free-streaming@example.com',
+			username='free-streaming-user',
+			password='testpass123',
+		)
+		self.client.force_authenticate(user=free_user)
+		mock_stream_generate_questions.side_effect = lambda *args, **kwargs: (item for item in [
+			self._question('Describe the induced fit model.'),
+			self._question('Explain how competitive inhibitors work.'),
+		])
+
+		response = self.client.post(
+			self.url,
+			{'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': self.topic.id, 'number_of_questions': 2},
+			format='json',
+		)
+		first_event = next(iter(response.streaming_content)).decode()
+		response.close()
+
+		self.assertTrue(first_event.startswith('event: question'))
+		self.assertEqual(QuestionUsage.objects.get(user=free_user).question_count, 2)
+		self.assertEqual(ServedQuestion.objects.filter(user=free_user).count(), 1)
+		self.assertFalse(QuestionSession.objects.filter(user=free_user).exists())
+
+	@patch('examquestions.views.stream_generate_questions')
+	def test_repeated_idempotency_key_replays_the_stream(self, mock_stream_generate_questions):
+		mock_stream_generate_questions.side_effect = lambda *args, **kwargs: (item for item in [self._question('Describe the induced fit model.')])
+		payload = {'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': self.topic.id, 'number_of_questions': 1}
+
+		first = self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY='stream-1')
+		first_events = self._events(first)
+		second = self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY='stream-1')
+
+		self.assertEqual([name for name, _ in first_events], ['question', 'done'])
+		self.assertEqual(second['Idempotent-Replayed'], 'true')
+		self.assertEqual(second['Content-Type'], 'text/event-stream')
+		self.assertEqual(second.content.decode(), ''.join(
+			f'event: {name}\ndata: {json.dumps(data)}\n\n' for name, data in first_events
+		))
+		mock_stream_generate_questions.assert_called_once()
+		self.assertEqual(QuestionSession.objects.filter(user=self.user).count(), 1)
+
+	@patch('examquestions.views.stream_generate_questions')
+	def test_retry_after_a_disconnect_replays_the_partial_stream_without_charging_again(self, mock_stream_generate_questions):
+		mock_stream_generate_questions.side_effect = lambda *args, **kwargs: (item for item in [
+			self._question('Describe the induced fit model.'),
+			self._question('Explain how competitive inhibitors work.'),
+		])
+		payload = {'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': self.topic.id, 'number_of_questions': 2}
+
+		first = self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY='stream-cut')
+		first_event = next(iter(first.streaming_content)).decode()
+		first.close()
+		second = self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY='stream-cut')
+
+		self.assertEqual(second['Idempotent-Replayed'], 'true')
+		replayed = second.content.decode()
+		self.assertTrue(replayed.startswith(first_event))
+		events = [block.split('\n')[0] for block in replayed.strip().split('\n\n')]
+		self.assertEqual(events, ['event: question', 'event: error'])
+		self.assertIn('"status": 409', replayed)
+		mock_stream_generate_questions.assert_called_once()
+		self.assertEqual(ServedQuestion.objects.filter(user=self.user).count(), 1)
+
+	def test_array_items_are_yielded_before_the_stream_ends(self):
+		document = json.dumps({'questions': [self._question('First.'), self._question('Second.')]})
+		received = []
+
+		def chunks():
+			for index in range(0, len(document), 5):
+				yield document[index:index + 5]
+				received.append(index)
+
+		items = iter_json_array_items(chunks(), 'questions')
+		first = next(items)
+
+		self.assertEqual(first['question'], 'First. [2 marks]')
+		self.assertLess(received[-1] + 5, len(document))
+		self.assertEqual([item['question'] for item in items], ['Second. [2 marks]'])
+
+	def test_streamed_generation_against_fake_server_records_usage(self):
+		fake_server = start_fake_openai_server(FakeOpenAIConfig(latency_ms=0, latency_jitter_ms=0, tokens_per_second=1e6, seed=3))
+		self.addCleanup(fake_server.server_close)
+		self.addCleanup(fake_server.shutdown)
+		client = OpenAI(api_key='stream', base_url=fake_server.base_url)
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			questions = list(ai.stream_generate_questions('Enzymes', 'AQA', 3))
+
+		self.assertEqual(len(questions), 3)
+		llm_telemetry.call_buffer.flush()
+		call = LLMCall.objects.get(service='alevel', purpose='generate')
+		self.assertEqual(call.item_count, 3)
+		self.assertGreater(call.completion_tokens, 0)
+
+
+class QuestionFanOutTests(APITestCase):
+	def setUp(self):
+		llm_telemetry.call_buffer.reset()
+		self.addCleanup(llm_telemetry.call_buffer.reset)
+
+	def _response(self, questions):
+		return Mock(
+			choices=[Mock(message=Mock(content=json.dumps({'questions': questions})))],
+			usage=Mock(prompt_tokens=100, completion_tokens=50, prompt_tokens_details=Mock(cached_tokens=0)),
+		)
+
+	def test_shard_counts_split_evenly_and_respect_the_limit(self):
+		self.assertEqual(shard_counts(10, 4), [4, 3, 3])
+		self.assertEqual(shard_counts(6, 2), [2, 2, 2])
+		self.assertEqual(shard_counts(3, 5), [3])
+		self.assertEqual(shard_counts(3, 0), [3])
+
+	@override_settings(QUESTION_GENERATION_SHARD_SIZE=2, QUESTION_GENERATION_MAX_CONCURRENCY=4)
+	def test_shards_run_concurrently_and_are_recorded_separately(self):
+		fake_server = start_fake_openai_server(FakeOpenAIConfig(latency_ms=400, latency_jitter_ms=0, tokens_per_second=1e6, seed=5))
+		self.addCleanup(fake_server.server_close)
+		self.addCleanup(fake_server.shutdown)
+		client = OpenAI(api_key='fanout', base_url=fake_server.base_url)
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			started = timezone.now()
+			questions = aiGCSE.generate_questions('Atoms', 'AQA', 5, 'CHEMISTRY', 'HIGHER')['questions']
+			elapsed = (timezone.now() - started).total_seconds()
+
+		self.assertEqual(len(questions), 5)
+		self.assertLess(elapsed, 0.8)
+		llm_telemetry.call_buffer.flush()
+		calls = LLMCall.objects.filter(service='gcse', purpose='generate')
+		self.assertEqual(sorted(calls.values_list('item_count', flat=True)), [1, 2, 2])
+
+	@override_settings(QUESTION_GENERATION_SHARD_SIZE=2)
+	def test_failed_shard_is_skipped_and_the_rest_are_merged(self):
+		client = Mock()
+		client.chat.completions.create.side_effect = [
+			self._response([{'question': 'Q1 [1 mark]'}, {'question': 'Q2 [1 mark]'}]),
+			TimeoutError('shard timed out'),
+		]
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			result = ai.generate_questions('Enzymes', 'AQA', 4)
+
+		self.assertEqual([item['question'] for item in result['questions']], ['Q1 [1 mark]', 'Q2 [1 mark]'])
+		prompts = [call.kwargs['messages'][1]['content'] for call in client.chat.completions.create.call_args_list]
+		self.assertTrue(all('Create 2 exam-style questions' in prompt for prompt in prompts))
+		llm_telemetry.call_buffer.flush()
+		self.assertEqual(LLMCall.objects.filter(outcome=LLMCall.Outcome.ERROR, error_type='TimeoutError').count(), 1)
+
+	def test_spans_opened_on_worker_threads_reach_server_timing(self):
+		provider = Mock()
+
+		def send(request):
+			with span('shard'):
+				return self._response([])
+
+		provider.send.side_effect = send
+		requests = [
+			{'model': 'gpt-4.1-mini', 'messages': [], 'temperature': 0, 'max_tokens': 10, 'purpose': 'generate', 'item_count': 1}
+			for _ in range(2)
+		]
+
+		def view(request):
+			create_chat_completions_concurrently('alevel', requests, max_concurrency=2)
+			return HttpResponse()
+
+		with patch('examquestions.services.fanout.get_llm_provider', return_value=provider):
+			response = ServerTimingMiddleware(view)(RequestFactory().get('/'))
+
+		self.assertIn('shard;dur=', response['Server-Timing'])
+
+	@override_settings(QUESTION_GENERATION_SHARD_SIZE=2)
+	def test_every_shard_failing_raises(self):
+		client = Mock()
+		client.chat.completions.create.side_effect = TimeoutError('upstream down')
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client), self.assertRaises(TimeoutError):
+			ai.generate_questions('Enzymes', 'AQA', 4)
+
+
+class LLMProviderTests(APITestCase):
+	def setUp(self):
+		llm_telemetry.call_buffer.reset()
+		self.addCleanup(llm_telemetry.call_buffer.reset)
+		llm_provider.get_llm_provider.cache_clear()
+		self.addCleanup(llm_provider.get_llm_provider.cache_clear)
+
+	def _request(self, **overrides):
+		fields = {
+			'service': 'alevel',
+			'model': 'gpt-4.1-mini',
+			'messages': [{'role': 'system', 'content': 'Return JSON: {"score": 0, "out_of": 3}'}, {'role': 'user', 'content': 'Answer [3 marks]'}],
+			'temperature': 0.3,
+			'max_tokens': 300,
+			'purpose': 'mark',
+		}
+		fields.update(overrides)
+		return llm_provider.ChatRequest(**fields)
+
+	def _connection_error(self):
+		return APIConnectionError(request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+
+	@override_settings(LLM_BACKEND='local')
+	def test_local_backend_is_deterministic_and_recorded(self):
+		first = ai.generate_questions('Enzymes', 'AQA', 3)['questions']
+		second = ai.generate_questions('Enzymes', 'AQA', 3)['questions']
+		streamed = list(ai.stream_generate_questions('Enzymes', 'AQA', 3))
+
+		self.assertEqual(len(first), 3)
+		self.assertEqual(first, second)
+		self.assertEqual(streamed, first)
+		llm_telemetry.call_buffer.flush()
+		self.assertEqual(LLMCall.objects.filter(service='alevel', purpose='generate', outcome=LLMCall.Outcome.OK).count(), 3)
+
+	def test_local_backend_cuts_output_at_max_tokens(self):
+		response = llm_provider.LocalBackend()(self._request(messages=[{'role': 'user', 'content': 'Return {"questions": []}. Create 20 questions.'}], max_tokens=50))
+
+		self.assertEqual(response.choices[0].finish_reason, 'length')
+		self.assertEqual(len(response.choices[0].message.content), 50 * 4)
+
+	def test_transient_errors_are_retried_with_backoff(self):
+		backend = Mock(side_effect=[self._connection_error(), self._connection_error(), 'completion'])
+		sleep = Mock()
+		provider = llm_provider.LLMProvider(backend, [llm_provider.RetryMiddleware(2, 0.5, sleep=sleep)])
+
+		self.assertEqual(provider.send(self._request()), 'completion')
+		self.assertEqual(backend.call_count, 3)
+		self.assertEqual(sleep.call_count, 2)
+		self.assertTrue(all(0 <= call.args[0] <= 1.0 for call in sleep.call_args_list))
+
+	def test_breaker_opens_after_repeated_failures_and_recovers_after_a_probe(self):
+		now = [0.0]
+		backend = Mock(side_effect=[self._connection_error(), self._connection_error(), 'completion'])
+		breaker = llm_provider.CircuitBreakerMiddleware(2, 30, clock=lambda: now[0])
+		provider = llm_provider.LLMProvider(backend, [breaker])
+
+		for _ in range(2):
+			with self.assertRaises(APIConnectionError):
+				provider.send(self._request())
+		with self.assertRaises(llm_provider.ProviderUnavailable):
+			provider.send(self._request())
+		self.assertEqual(backend.call_count, 2)
+
+		now[0] = 31.0
+		self.assertEqual(provider.send(self._request()), 'completion')
+		backend.side_effect = None
+		backend.return_value = 'closed'
+		self.assertEqual(provider.send(self._request()), 'closed')
+
+	def test_bad_requests_do_not_trip_the_breaker(self):
+		backend = Mock(side_effect=ValueError('bad request'))
+		provider = llm_provider.LLMProvider(backend, [llm_provider.CircuitBreakerMiddleware(1, 30)])
+
+		for _ in range(3):
+			with self.assertRaises(ValueError):
+				provider.send(self._request())
+		self.assertEqual(backend.call_count, 3)
+
+	@override_settings(LLM_BACKEND='local', LLM_RESPONSE_CACHE_SECONDS=60, LLM_RESPONSE_CACHE_PURPOSES=['mark'])
+	def test_response_cache_answers_repeated_marking_without_a_call(self):
+		first = ai.evaluate_response_with_openai('Explain diffusion. [2 marks]', ['Net movement', 'Down a gradient'], 'Particles spread out', 'AQA')
+		second = ai.evaluate_response_with_openai('Explain diffusion. [2 marks]', ['Net movement', 'Down a gradient'], 'Particles spread out', 'AQA')
+		ai.generate_questions('Enzymes', 'AQA', 1)
+		ai.generate_questions('Enzymes', 'AQA', 1)
+
+		self.assertEqual(first, second)
+		llm_telemetry.call_buffer.flush()
+		self.assertEqual(LLMCall.objects.filter(purpose='mark').count(), 1)
+		self.assertEqual(LLMCall.objects.filter(purpose='generate').count(), 2)
+
+	@override_settings(OPEN_AI_KEY='test-key', LLM_MAX_CONNECTIONS=7, LLM_HTTP2=False)
+	def test_every_service_shares_one_pooled_client(self):
+		llm_provider.get_openai_client.cache_clear()
+		llm_provider.get_http_client.cache_clear()
+		self.addCleanup(llm_provider.get_http_client.cache_clear)
+		self.addCleanup(llm_provider.get_openai_client.cache_clear)
+
+		client = llm_provider.get_openai_client()
+
+		self.assertIs(client, llm_provider.get_openai_client())
+		self.assertIs(client._client, llm_provider.get_http_client())
+		self.assertEqual(client.max_retries, 0)
+		self.assertEqual(client._client._transport._pool._max_connections, 7)
+
+
+class LLMCassetteTests(APITestCase):
+	def setUp(self):
+		llm_telemetry.call_buffer.reset()
+		self.addCleanup(llm_telemetry.call_buffer.reset)
+		llm_provider.get_llm_provider.cache_clear()
+		self.addCleanup(llm_provider.get_llm_provider.cache_clear)
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = Path(directory.name) / 'cassette.jsonl.gz'
+
+	def _exercise(self):
+		questions = ai.generate_questions('Enzymes', 'AQA', 2)['questions']
+		mark = ai.evaluate_response_with_openai(questions[0]['question'], questions[0]['mark_scheme'], 'An answer', 'AQA')
+		streamed = list(aiGCSE.stream_generate_questions('Atoms', 'AQA', 2, 'CHEMISTRY', 'HIGHER'))
+		return questions, mark, streamed
+
+	def test_replay_serves_recorded_responses_without_the_backend(self):
+		with override_settings(LLM_BACKEND='local', LLM_CASSETTE_MODE='record', LLM_CASSETTE_PATH=str(self.path)):
+			recorded = self._exercise()
+		llm_provider.get_llm_provider.cache_clear()
+		client = Mock()
+		client.chat.completions.create.side_effect = AssertionError('replay must not call OpenAI')
+
+		with override_settings(LLM_CASSETTE_MODE='replay', LLM_CASSETTE_PATH=str(self.path)), patch.object(llm_provider, 'get_openai_client', return_value=client):
+			replayed = self._exercise()
+
+		self.assertEqual(replayed, recorded)
+		llm_telemetry.call_buffer.flush()
+		self.assertEqual(LLMCall.objects.filter(purpose='generate').count(), 4)
+		self.assertTrue(LLMCall.objects.filter(service='gcse', completion_tokens__gt=0).exists())
+
+	@override_settings(LLM_CASSETTE_MODE='replay')
+	def test_unrecorded_request_is_a_miss(self):
+		with override_settings(LLM_CASSETTE_PATH=str(self.path)), self.assertRaises(CassetteMiss):
+			ai.get_feedback_from_openai('How did I do?')
+
+	def test_repeated_requests_replay_in_order_with_recorded_latency(self):
+		request = llm_provider.ChatRequest('alevel', 'gpt-4.1-mini', [{'role': 'user', 'content': 'Return {"score": 1}'}], 0.3, 100, 'mark')
+		cassette = Cassette(self.path)
+		for content, latency in (('{"score": 1}', 0.25), ('{"score": 2}', 0.5)):
+			response = llm_provider.LocalBackend()(request).model_copy(deep=True)
+			response.choices[0].message.content = content
+			cassette.append(request, latency, response=response.model_dump(mode='json'))
+		sleep = Mock()
+		backend = CassetteBackend(Cassette(self.path), 'recorded', sleep=sleep)
+
+		contents = [backend(request).choices[0].message.content for _ in range(3)]
+
+		self.assertEqual(contents, ['{"score": 1}', '{"score": 2}', '{"score": 2}'])
+		self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.25, 0.5, 0.5])
+
+
+SHORT_ANSWER_NANO_ROUTES = [
+	{
+		'name': 'short-answer-marking',
+		'services': ['alevel', 'gcse'],
+		'purposes': ['mark'],
+		'max_marks': 2,
+		'models': ['gpt-4.1-nano', 'gpt-4.1-mini'],
+	},
+	{'name': 'marking', 'services': ['alevel', 'gcse'], 'purposes': ['mark'], 'models': ['gpt-4.1-mini', 'gpt-4.1']},
+]
+
+
+class ModelRoutingTests(APITestCase):
+	def setUp(self):
+		llm_telemetry.call_buffer.reset()
+		self.addCleanup(llm_telemetry.call_buffer.reset)
+		llm_provider.model_health.reset()
+		self.addCleanup(llm_provider.model_health.reset)
+		self.client_mock = Mock()
+		patcher = patch.object(llm_provider, 'get_openai_client', return_value=self.client_mock)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def _response(self, content):
+		response = _mock_openai_json_response({})
+		response.choices[0].message.content = content
+		return response
+
+	def _models_called(self):
+		return [call.kwargs['model'] for call in self.client_mock.chat.completions.create.call_args_list]
+
+	def test_default_routes_do_not_send_marking_to_a_smaller_model(self):
+		self.client_mock.chat.completions.create.return_value = self._response(json.dumps({'score': 5, 'out_of': 3, 'feedback': ''}))
+
+		ai.evaluate_response_with_openai('Name two organelles. [2 marks]', ['Nucleus', 'Ribosome'], 'Nucleus', 'AQA')
+		self.client_mock.chat.completions.create.reset_mock()
+		aiEssay.evaluate_response_with_openai('Essay title. [25 marks]', [], 'An essay')
+
+		# Essay marking matches no default route, so a low-confidence result is not retried on another model.
+		self.assertEqual(self._models_called(), [aiEssay.MODEL_NAME])
+
+	@override_settings(LLM_MODEL_ROUTES=SHORT_ANSWER_NANO_ROUTES)
+	def test_models_are_chosen_by_purpose_and_marks(self):
+		self.client_mock.chat.completions.create.return_value = self._response(json.dumps({'score': 1, 'out_of': 2, 'feedback': 'ok'}))
+
+		ai.evaluate_response_with_openai('Name two organelles. [2 marks]', ['Nucleus', 'Ribosome'], 'Nucleus', 'AQA')
+		aiGCSE.evaluate_response_with_openai('Explain osmosis. [4 marks]', ['a', 'b', 'c', 'd'], 'Water moves', 'AQA', 'BIOLOGY', 'HIGHER')
+		aiEssay.evaluate_response_with_openai('Essay title. [25 marks]', [], 'An essay')
+
+		self.assertEqual(self._models_called(), ['gpt-4.1-nano', 'gpt-4.1-mini', aiEssay.MODEL_NAME])
+
+	@override_settings(LLM_MODEL_ROUTES=SHORT_ANSWER_NANO_ROUTES)
+	def test_invalid_output_falls_back_to_the_larger_model(self):
+		self.client_mock.chat.completions.create.side_effect = [
+			self._response('{"score": 1, "out_of": 1, "feedb'),
+			self._response(json.dumps({'score': 1, 'out_of': 1, 'feedback': 'Correct.'})),
+		]
+		invalid_before = LLM_ROUTE_CALLS.value(route='short-answer-marking', model='gpt-4.1-nano', outcome='invalid')
+
+		result = ai.evaluate_response_with_openai('Name one organelle. [1 mark]', ['Nucleus'], 'Nucleus', 'AQA')
+
+		self.assertEqual(result['feedback'], 'Correct.')
+		self.assertEqual(self._models_called(), ['gpt-4.1-nano', 'gpt-4.1-mini'])
+		self.assertEqual(LLM_ROUTE_CALLS.value(route='short-answer-marking', model='gpt-4.1-nano', outcome='invalid') - invalid_before, 1)
+		llm_telemetry.call_buffer.flush()
+		self.assertEqual(list(LLMCall.objects.order_by('id').values_list('model', flat=True)), ['gpt-4.1-nano', 'gpt-4.1-mini'])
+
+	def test_low_confidence_mark_falls_back_and_the_last_model_is_final(self):
+		self.client_mock.chat.completions.create.return_value = self._response(json.dumps({'score': 5, 'out_of': 3, 'feedback': ''}))
+
+		result = ai.evaluate_response_with_openai('Explain osmosis. [3 marks]', ['a', 'b', 'c'], 'Water moves', 'AQA')
+
+		self.assertEqual(self._models_called(), ['gpt-4.1-mini', 'gpt-4.1'])
+		self.assertEqual(result['score'], 5)
+
+	@override_settings(LLM_MODEL_ROUTES=SHORT_ANSWER_NANO_ROUTES)
+	def test_unhealthy_model_is_passed_over(self):
+		for _ in range(5):
+			llm_provider.model_health.record('gpt-4.1-nano', 0.1, failed=True)
+		self.client_mock.chat.completions.create.return_value = self._response(json.dumps({'score': 1, 'out_of': 1, 'feedback': 'ok'}))
+		skips_before = LLM_ROUTE_SKIPS.value(route='short-answer-marking', model='gpt-4.1-nano')
+
+		ai.evaluate_response_with_openai('Name one organelle. [1 mark]', ['Nucleus'], 'Nucleus', 'AQA')
+
+		self.assertEqual(self._models_called(), ['gpt-4.1-mini'])
+		self.assertEqual(LLM_ROUTE_SKIPS.value(route='short-answer-marking', model='gpt-4.1-nano') - skips_before, 1)
+
+	@override_settings(LLM_MODEL_ROUTES=[{'name': 'cheap-feedback', 'purposes': ['feedback'], 'models': ['gpt-4.1-nano']}])
+	def test_routes_can_be_configured(self):
+		self.client_mock.chat.completions.create.return_value = self._response(json.dumps({'strengths': [], 'improvements': []}))
+
+		ai.get_feedback_from_openai('How did I do?')
+		ai.generate_questions('Enzymes', 'AQA', 1)
+
+		self.assertEqual(self._models_called(), ['gpt-4.1-nano', ai.MODEL_NAME])
+
+
+@override_settings(FALLBACK_BANK_RELOAD_SECONDS=0)
+class FallbackBankManagerTests(APITestCase):
+	def setUp(self):
+		temp_dir = tempfile.TemporaryDirectory()
+		self.addCleanup(temp_dir.cleanup)
+		self.path = Path(temp_dir.name) / 'bank.json'
+		self.manager = FallbackBankManager()
+		self.version = 0
+
+	def _write(self, content):
+		self.path.write_text(content if isinstance(content, str) else json.dumps(content), encoding='utf-8')
+		# Give every write a new mtime, as a deploy or an editor would.
+		self.version += 1
+		os.utime(self.path, ns=(self.version * 1_000_000_000, self.version * 1_000_000_000))
+
+	def _bank(self, question):
+		return {'Enzymes': [{'question': question, 'mark': 1, 'mark_scheme': ['Point (1 mark)']}]}
+
+	def test_changed_file_is_swapped_in_and_replacement_is_announced(self):
+		self._write(self._bank('Define enzyme.'))
+		first = self.manager.get(self.path)
+		replaced = []
+		handler = lambda sender, old_bank, new_bank, **kwargs: replaced.append((old_bank, new_bank))
+		bank_replaced.connect(handler)
+		self.addCleanup(bank_replaced.disconnect, handler)
+
+		self.assertIs(self.manager.get(self.path), first)
+		self._write(self._bank('Define substrate.'))
+		second = self.manager.get(self.path)
+
+		self.assertEqual(second['Enzymes'][0]['question'], 'Define substrate.')
+		self.assertEqual(first['Enzymes'][0]['question'], 'Define enzyme.')
+		self.assertEqual(replaced, [(first, second)])
+		self.assertGreater(self.manager.status()[str(self.path)].memory_bytes, 0)
+
+	def test_invalid_files_keep_the_previous_version(self):
+		self._write(self._bank('Define enzyme.'))
+		good = self.manager.get(self.path)
+		failed_before = FALLBACK_BANK_LOADS.value(bank='bank.json', outcome='failed')
+
+		self._write('{"Enzymes": [')
+		self.assertIs(self.manager.get(self.path), good)
+		self._write({'Enzymes': [{'mark': 1}]})
+		self.assertIs(self.manager.get(self.path), good)
+		self.path.unlink()
+		self.assertIs(self.manager.get(self.path), good)
+
+		self.assertEqual(FALLBACK_BANK_LOADS.value(bank='bank.json', outcome='failed'), failed_before + 3)
+		self._write(self._bank('Define substrate.'))
+		self.assertEqual(self.manager.get(self.path)['Enzymes'][0]['question'], 'Define substrate.')
+
+	def test_bank_that_never_loaded_is_empty(self):
+		self.assertEqual(self.manager.get(self.path), {})
+		self._write('not json')
+		self.assertEqual(self.manager.get(self.path), {})
+
+
+class ScopeIndexTests(APITestCase):
+	def test_titles_match_exactly_then_normalised_then_fuzzily(self):
+		bank = {'3.1.1 Monomers and Polymers': [{'question': 'Q'}], 'B2 Cell Structure & Transport': [{'question': 'Q'}], 'Lipids': [{'question': 'Q'}]}
+
+		self.assertEqual(normalize_scope_title('B2 Cell Structure & Transport'), 'cell structure and transport')
+		self.assertEqual(match_bank_key(bank, 'Lipids').method, 'exact')
+		self.assertEqual(match_bank_key(bank, 'Monomers and polymers'), match_bank_key(bank, '3.1.1 monomers & polymers'))
+		self.assertEqual(match_bank_key(bank, 'Monomers and polymers').key, '3.1.1 Monomers and Polymers')
+		self.assertEqual(match_bank_key(bank, 'Cell structure and transports').method, 'fuzzy')
+		self.assertIsNone(match_bank_key(bank, 'Cell structure').key)
+
+	def test_scopes_are_indexed_by_key_and_fall_back_to_their_topic(self):
+		bank = {'Nucleic Acids': [{'question': 'Q'}]}
+
+		entry = bank_scope_keys(bank, 'subtopic:7', 'DNA replication', 'nucleic acids')
+
+		self.assertEqual(entry.keys, ['Nucleic Acids'])
+		self.assertIs(bank_scope_keys(bank, 'subtopic:7', 'DNA replication', 'nucleic acids'), entry)
+		self.assertIsNot(bank_scope_keys(bank, 'subtopic:7', 'DNA structure', 'nucleic acids'), entry)
+
+	def test_generation_uses_a_section_whose_title_only_differs_in_numbering(self):
+		user = CustomUser.objects.create_user(email='scope@example.com', username='scope-user', password='testpass123', has_alevel_paid_access=True)
+		topic = BiologyTopic.objects.create(topic='Monomers and polymers', exam_board='AQA')
+		self.client.force_authenticate(user=user)
+
+		with patch('examquestions.views.generate_questions', return_value={'questions': []}):
+			response = self.client.post(
+				reverse('generate-exam-questions'),
+				{'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': topic.id, 'number_of_questions': 2},
+				format='json',
+			)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.data['questions']), 2)
+
+	def test_coverage_report_lists_unmapped_scopes(self):
+		BiologyTopic.objects.create(topic='Monomers and polymers', exam_board='AQA')
+		BiologyTopic.objects.create(topic='Quantum biology', exam_board='OCR')
+		GCSEScienceTopic.objects.create(topic='B1 Cell level systems', exam_board='OCR', subject='BIOLOGY', tier='HIGHER')
+		output = StringIO()
+
+		call_command('fallback_scope_coverage', stdout=output)
+
+		self.assertIn('Scopes: 3  exact: 1  normalized: 1  fuzzy: 0  topic section: 0  unmapped: 1  no bank: 0', output.getvalue())
+		self.assertIn("'Quantum biology' (ocr_questions.json)", output.getvalue())
+
+
+class QuestionTextTests(APITestCase):
+	def test_key_is_normalised_text_and_its_fingerprint(self):
+		key = item_question_key({'question': '  Describe   the Induced fit model. [2 marks] '})
+
+		self.assertEqual(key.normalized, 'describe the induced fit model.')
+		self.assertEqual(key.fingerprint, hashlib.sha256(b'describe the induced fit model.').hexdigest())
+		self.assertIs(item_question_key({'question': 'Describe   the Induced fit model. [2 marks]'}), item_question_key({'question': 'Describe   the Induced fit model. [2 marks]'}))
+
+	@patch('examquestions.views.generate_questions')
+	def test_repeat_requests_do_not_normalise_bank_questions_again(self, mock_generate_questions):
+		user = CustomUser.objects.create_user(email='keys@example.com', username='keys-user', password='testpass123', has_alevel_paid_access=True)
+		topic = BiologyTopic.objects.create(topic='3.1.1 Monomers and Polymers', exam_board='AQA')
+		mock_generate_questions.return_value = {'questions': []}
+		self.client.force_authenticate(user=user)
+		payload = {'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': topic.id, 'number_of_questions': 3}
+
+		self.assertEqual(self.client.post(reverse('generate-exam-questions'), payload, format='json').status_code, 200)
+		misses = question_key.cache_info().misses
+		self.assertEqual(self.client.post(reverse('generate-exam-questions'), payload, format='json').status_code, 200)
+
+		self.assertEqual(question_key.cache_info().misses, misses)
+
+
+class NearDuplicateTests(APITestCase):
+	def test_paraphrases_are_near_duplicates_but_substituted_terms_are_not(self):
+		self.assertTrue(is_near_duplicate(
+			question_sketch('state two general features of monomers.'),
+			question_sketch('give two general features of monomers.'),
+			0.5,
+		))
+		self.assertFalse(is_near_duplicate(
+			question_sketch('name the pentose sugar in rna.'),
+			question_sketch('name the pentose sugar in dna.'),
+			0.5,
+		))
+
+	def test_index_finds_the_matching_question(self):
+		index = NearDuplicateIndex(['describe the induced fit model of enzyme action.'], threshold=0.5)
+
+		self.assertEqual(
+			index.find('outline the induced fit model of enzyme action.'),
+			'describe the induced fit model of enzyme action.',
+		)
+		self.assertNotIn('describe the lock and key model of enzyme action.', index)
+		self.assertNotIn('outline the induced fit model of enzyme action.', NearDuplicateIndex(['describe the induced fit model of enzyme action.'], threshold=0))
+
+	@override_settings(QUESTION_NEAR_DUPLICATE_THRESHOLD=0.5)
+	def test_generated_paraphrases_of_served_questions_are_dropped(self):
+		questions = [
+			{'question': 'Give two general features of monomers. [2 marks]'},
+			{'question': 'Explain how competitive inhibitors work. [2 marks]'},
+			{'question': 'Explain briefly how competitive inhibitors work. [2 marks]'},
+		]
+
+		accepted = collect_valid_ai_questions(questions, {'state two general features of monomers.'})
+
+		self.assertEqual(accepted, [questions[1]])
+
+	def test_report_lists_each_threshold(self):
+		output = StringIO()
+		call_command('near_duplicate_report', '--thresholds', '0.5', stdout=output)
+
+		self.assertIn('threshold 0.50:', output.getvalue())
+		self.assertIn('paraphrase recall', output.getvalue())
+
+
+@override_settings(SHARED_QUESTION_POOL_ENABLED=True)
+class SharedQuestionPoolTests(APITestCase):
+	def setUp(self):
+		self.topic = BiologyTopic.objects.create(topic='Enzymes', exam_board='AQA')
+		self.first_user, self.second_user = [
+			CustomUser.objects.create_user(email=f'pool{index}@example.com', username=f'pool-user-{index}', password='testpass123', has_alevel_paid_access=True)
+			for index in range(2)
+		]
+		self.payload = {'qualification': 'ALEVEL_BIOLOGY', 'exam_board': 'AQA', 'topic_id': self.topic.id, 'number_of_questions': 2}
+
+	def _question(self, text):
+		return {'question': f'{text} [2 marks]', 'total_marks': 2, 'mark_scheme': ['Point one (1 mark)', 'Point two (1 mark)']}
+
+	def _generate(self, user, url_name='generate-exam-questions'):
+		self.client.force_authenticate(user=user)
+		response = self.client.post(reverse(url_name), self.payload, format='json')
+		self.assertEqual(response.status_code, 200)
+		return response
+
+	@patch('examquestions.views.generate_questions')
+	def test_other_users_are_served_from_the_pool_before_the_model(self, mock_generate_questions):
+		mock_generate_questions.return_value = {
+			'questions': [self._question('Describe the induced fit model.'), self._question('Explain how competitive inhibitors work.')],
+		}
+		saved_before = GENERATION_LLM_CALLS_SAVED.value(service='alevel')
+
+		first = self._generate(self.first_user)
+		second = self._generate(self.second_user)
+
+		self.assertEqual(mock_generate_questions.call_count, 1)
+		self.assertEqual(SharedQuestion.objects.filter(scope_key=f'topic:{self.topic.id}').count(), 2)
+		self.assertEqual(
+			{question['question'] for question in second.data['questions']},
+			{question['question'] for question in first.data['questions']},
+		)
+		self.assertEqual(GENERATION_LLM_CALLS_SAVED.value(service='alevel'), saved_before + 1)
+		self.assertEqual((first.data['llm_calls_saved'], second.data['llm_calls_saved']), (0, 1))
+		self.assertEqual(set(SharedQuestion.objects.values_list('served_count', flat=True)), {1})
+
+	def test_drawing_does_not_count_questions_as_served_until_the_generation_commits(self):
+		SharedQuestion.objects.create(
+			exam_board='AQA',
+			scope_key=f'topic:{self.topic.id}',
+			fingerprint='b' * 64,
+			normalized_question='describe the induced fit model.',
+			question_item=self._question('Describe the induced fit model.'),
+		)
+
+		drawn = draw_shared_questions('AQA', f'topic:{self.topic.id}', 2, set())
+
+		self.assertEqual(len(drawn), 1)
+		self.assertEqual(SharedQuestion.objects.get().served_count, 0)
+
+	def test_served_history_is_filtered_in_python_not_in_the_query(self):
+		for text in ('Describe the induced fit model.', 'Explain how competitive inhibitors work.'):
+			SharedQuestion.objects.create(
+				exam_board='AQA',
+				scope_key=f'topic:{self.topic.id}',
+				fingerprint=item_question_key(self._question(text)).fingerprint,
+				normalized_question=item_question_key(self._question(text)).normalized,
+				question_item=self._question(text),
+			)
+		served = {f'state {index} features of enzymes.' for index in range(2000)}
+		served.add(item_question_key(self._question('Describe the induced fit model.')).normalized)
+
+		with CaptureQueriesContext(connection) as queries:
+			drawn = draw_shared_questions('AQA', f'topic:{self.topic.id}', 2, served)
+
+		self.assertEqual([item['question'] for item in drawn], ['Explain how competitive inhibitors work. [2 marks]'])
+		self.assertEqual(len(queries), 1)
+		self.assertNotIn('features of enzymes', queries[0]['sql'])
+
+	@patch('examquestions.views.generate_questions')
+	def test_only_the_shortfall_is_generated_when_the_user_has_seen_pooled_questions(self, mock_generate_questions):
+		mock_generate_questions.side_effect = [
+			{'questions': [self._question('Describe the induced fit model.'), self._question('Explain how competitive inhibitors work.')]},
+			{'questions': [self._question('Describe the lock and key model.')]},
+		]
+		self._generate(self.first_user)
+		ServedQuestion.objects.create(user=self.second_user, exam_board='AQA', scope_key=f'topic:{self.topic.id}', normalized_question='describe the induced fit model.')
+
+		response = self._generate(self.second_user)
+
+		mock_generate_questions.assert_called_with('Enzymes', 'AQA', 1, specification='')
+		self.assertEqual(
+			[question['question'] for question in response.data['questions']],
+			['Explain how competitive inhibitors work. [2 marks]', 'Describe the lock and key model. [2 marks]'],
+		)
+		self.assertEqual(SharedQuestion.objects.count(), 3)
+
+	@patch('examquestions.views.stream_generate_questions')
+	def test_stream_sends_pooled_questions_first(self, mock_stream_generate_questions):
+		SharedQuestion.objects.create(
+			exam_board='AQA',
+			scope_key=f'topic:{self.topic.id}',
+			fingerprint=item_question_key(self._question('Describe the induced fit model.')).fingerprint,
+			normalized_question='describe the induced fit model.',
+			question_item=self._question('Describe the induced fit model.'),
+		)
+		mock_stream_generate_questions.side_effect = lambda *args, **kwargs: (item for item in [self._question('Explain how competitive inhibitors work.')])
+		served_before = SHARED_QUESTIONS.value(service='alevel', event='served')
+
+		response = self._generate(self.first_user, 'generate-exam-questions-stream')
+
+		events = [json.loads(block.split('\n')[1].removeprefix('data: ')) for block in b''.join(response.streaming_content).decode().strip().split('\n\n')]
+		self.assertEqual([event.get('source') for event in events], ['shared', 'ai', None])
+		self.assertEqual(events[-1]['llm_calls_saved'], 0)
+		self.assertEqual(SharedQuestion.objects.get(normalized_question='describe the induced fit model.').served_count, 1)
+		mock_stream_generate_questions.assert_called_once_with('Enzymes', 'AQA', 1, specification='')
+		self.assertEqual(SHARED_QUESTIONS.value(service='alevel', event='served'), served_before + 1)
+		self.assertEqual(SharedQuestion.objects.count(), 2)
+
+
+class SessionQuestionTests(APITestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create_user(
+			email='stored@example.com',
+			username='stored-user',
+			password='testpass123',
+			has_alevel_paid_access=True,
+		)
+		self.topic = BiologyTopic.objects.create(topic='Cells', exam_board='AQA')
+		self.client.force_authenticate(user=self.user)
+
+	@patch('examquestions.views.generate_questions')
+	def _generate(self, mock_generate_questions):
+		mock_generate_questions.return_value = {
+			'questions': [
+				{'question': 'State the function of ribosomes. [1 mark]', 'total_marks': 1, 'mark_scheme': ['Protein synthesis']},
+				{'question': 'Name two organelles in a plant cell. [2 marks]', 'total_marks': 2, 'mark_scheme': ['Chloroplast (1 mark)', 'Vacuole (1 mark)']},
+			],
+		}
+		response = self.client.post(
+			reverse('generate-exam-questions'),
+			{'qualification': 'ALEVEL_BIOLOGY', 'topic_id': self.topic.id, 'exam_board': 'AQA', 'number_of_questions': 2},
+			format='json',
+		)
+		self.assertEqual(response.status_code, 200)
+		return response.data
+
+	def test_generation_stores_questions_with_formatted_mark_schemes(self):
+		body = self._generate()
+
+		stored = list(SessionQuestion.objects.filter(session_id=body['session_id']))
+		self.assertEqual(body['question_ids'], [question.id for question in stored])
+		self.assertEqual([question['question_id'] for question in body['questions']], body['question_ids'])
+		self.assertEqual([question.position for question in stored], [0, 1])
+		self.assertEqual(stored[0].mark_scheme, ['Protein synthesis (1 mark)'])
+		self.assertEqual(stored[1].marks, 2)
+
+	@override_settings(PREMARK_ENABLED=False)
+	@patch('examquestions.views.evaluate_batch_responses_with_openai')
+	@patch('examquestions.views.evaluate_response_with_openai')
+	def test_marking_uses_stored_questions_instead_of_client_copies(self, mock_evaluate, mock_batch_evaluate):
+		body = self._generate()
+		first_id, second_id = body['question_ids']
+		mock_evaluate.return_value = {'score': 1, 'out_of': 1, 'feedback': 'Correct.'}
+		mock_batch_evaluate.return_value = {'results': [], 'strengths': [], 'improvements': []}
+
+		single = self.client.post(
+			reverse('mark-user-answer'),
+			{'session_id': body['session_id'], 'question_id': first_id, 'mark_scheme': ['Anything (1 mark)'], 'user_answer': 'Makes proteins'},
+			format='json',
+		)
+		batch = self.client.post(
+			reverse('mark-user-answer'),
+			{'session_id': body['session_id'], 'answers': [{'question_id': second_id, 'user_answer': 'Chloroplast and vacuole'}]},
+			format='json',
+		)
+
+		self.assertEqual(single.status_code, 200)
+		mock_evaluate.assert_called_once_with(
+			'State the function of ribosomes. [1 mark]', ['Protein synthesis (1 mark)'], 'Makes proteins', 'AQA', specification=''
+		)
+		self.assertEqual(batch.status_code, 200)
+		batch_answer = mock_batch_evaluate.call_args.args[0][0]
+		self.assertEqual(batch_answer['mark_scheme'], ['Chloroplast (1 mark)', 'Vacuole (1 mark)'])
+		self.assertEqual(batch_answer['question'], 'Name two organelles in a plant cell. [2 marks]')
+
+	def test_question_ids_must_belong_to_the_session(self):
+		body = self._generate()
+		other_session = QuestionSession.objects.create(user=self.user, topic=self.topic, exam_board='AQA', number_of_questions=1)
+
+		mark = self.client.post(
+			reverse('mark-user-answer'),
+			{'session_id': other_session.id, 'question_id': body['question_ids'][0], 'user_answer': 'Proteins'},
+			format='json',
+		)
+		submit = self.client.post(
+			reverse('submit_question_session'),
+			{'session_id': other_session.id, 'answers': [{'question_id': body['question_ids'][0], 'score': 1}]},
+			format='json',
+		)
+		without_session = self.client.post(
+			reverse('mark-user-answer'), {'question_id': body['question_ids'][0], 'user_answer': 'Proteins'}, format='json'
+		)
+
+		self.assertEqual(mark.status_code, 400)
+		self.assertEqual(submit.status_code, 400)
+		self.assertEqual(without_session.status_code, 400)
+
+
+class AnswerResultTests(APITestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create_user(email='results@example.com', username='results-user', password='testpass123')
+		self.cells = BiologyTopic.objects.create(topic='Cells', exam_board='AQA')
+		self.enzymes = BiologyTopic.objects.create(topic='Enzymes', exam_board='AQA')
+		self.client.force_authenticate(user=self.user)
+
+	def _session(self, topic, marks):
+		session = QuestionSession.objects.create(user=self.user, topic=topic, exam_board='AQA', number_of_questions=len(marks), total_available=sum(marks))
+		questions = SessionQuestion.objects.bulk_create(
+			SessionQuestion(session=session, position=position, question=f'{topic.topic} question {position}', marks=mark, mark_scheme=['Point (1 mark)'] * mark)
+			for position, mark in enumerate(marks)
+		)
+		return session, questions
+
+	def _submit(self, session, answers):
+		response = self.client.post(reverse('submit_question_session'), {'session_id': session.id, 'answers': answers}, format='json')
+		self.assertEqual(response.status_code, 200)
+		return response
+
+	def _issue(self, question, score, marked_by='model'):
+		SessionQuestion.objects.filter(pk=question.pk).update(score=score, marked_by=marked_by)
+
+	def test_submit_stores_one_result_per_answer_and_replaces_on_resubmit(self):
+		session, (first, second) = self._session(self.cells, [1, 2])
+		self._issue(first, 1, 'local')
+		self._issue(second, 1.5)
+
+		self._submit(session, [{'question_id': first.id, 'score': 0}, {'question_id': second.id, 'score': 0}])
+		response = self._submit(session, [{'question_id': first.id, 'score': 1, 'marked_by': 'model'}, {'question_id': second.id, 'score': 2, 'marked_by': 'local'}])
+
+		results = list(AnswerResult.objects.filter(session=session))
+		self.assertEqual([(result.position, result.score, result.out_of, result.marked_by) for result in results], [(0, 1, 1, 'local'), (1, 1.5, 2, 'model')])
+		self.assertEqual(response.data['score'], 2.5)
+		self.assertEqual({result.scope_key for result in results}, {f'topic:{self.cells.id}'})
+		self.assertEqual(results[1].question, second)
+
+	def test_scores_for_questions_the_server_never_marked_are_recorded_as_client(self):
+		session, (question,) = self._session(self.cells, [2])
+
+		self._submit(session, [{'question_id': question.id, 'score': 2, 'marked_by': 'local'}])
+
+		result = AnswerResult.objects.get(session=session)
+		self.assertEqual((result.score, result.marked_by), (2, 'client'))
+
+	@override_settings(PREMARK_ENABLED=True)
+	def test_submit_records_the_mark_issued_by_mark_answer(self):
+		session, (question,) = self._session(self.cells, [1])
+		SessionQuestion.objects.filter(pk=question.pk).update(question='Name the monomer of starch. [1 mark]', mark_scheme=['Alpha glucose (1 mark)'])
+
+		marked = self.client.post(
+			reverse('mark-user-answer'),
+			{'session_id': session.id, 'question_id': question.id, 'user_answer': 'alpha glucose'},
+			format='json',
+		)
+		self._submit(session, [{'question_id': question.id, 'score': 0, 'marked_by': 'model'}])
+
+		self.assertEqual(marked.data['marked_by'], 'local')
+		result = AnswerResult.objects.get(session=session)
+		self.assertEqual((result.score, result.marked_by), (1, 'local'))
+
+	def test_weak_areas_and_question_difficulty_are_sql_aggregates(self):
+		cells, (cell_question,) = self._session(self.cells, [2])
+		enzymes, (enzyme_question,) = self._session(self.enzymes, [2])
+		self._issue(cell_question, 2)
+		self._issue(enzyme_question, 0.5)
+		self._submit(cells, [{'question_id': cell_question.id}])
+		self._submit(enzymes, [{'question_id': enzyme_question.id}])
+
+		with self.assertNumQueries(1):
+			areas = weak_areas(self.user)
+		self.assertEqual([area['scope_title'] for area in areas], ['Enzymes', 'Cells'])
+		self.assertAlmostEqual(areas[0]['facility'], 0.25)
+		self.assertEqual(question_difficulty(f'topic:{self.enzymes.id}', min_answers=1)[0]['text'], 'Enzymes question 0')
+
+		response = self.client.get(reverse('answer-stats'), {'scope_key': f'topic:{self.cells.id}'})
+		self.assertEqual(response.data['weak_areas'][0]['scope_key'], f'topic:{self.enzymes.id}')
+		self.assertEqual(response.data['hardest_questions'], [])
+
+
+class PremarkTests(APITestCase):
+	SUBATOMIC = 'State the three subatomic particles found in an atom. [3 marks]'
+	SUBATOMIC_SCHEME = ['Proton (1 mark)', 'Neutron (1 mark)', 'Electron (1 mark)']
+
+	def test_points_are_split_into_stemmed_alternatives(self):
+		self.assertEqual(stem('hydrolysed'), stem('hydrolysis'))
+		self.assertEqual(point_alternatives('Carbon (C) (1 mark)'), [{'carbon'}, {'c'}])
+		self.assertEqual(point_alternatives('1/4 (25%) (1 mark)'), [{'1/4'}, {'25'}])
+		self.assertEqual(len(point_alternatives('Membrane glycoproteins/glycolipids acting as antigens (1 mark)')), 2)
+
+	def test_full_and_blank_answers_are_marked_locally(self):
+		full = premark(self.SUBATOMIC, self.SUBATOMIC_SCHEME, 'Protons, neutrons and electrons.')
+		blank = premark(self.SUBATOMIC, self.SUBATOMIC_SCHEME, "I don't know")
+
+		self.assertEqual((full.score, full.out_of, full.reason), (3, 3, 'full_match'))
+		self.assertEqual((blank.score, blank.reason), (0, 'blank'))
+		self.assertEqual(premark('How many phosphate groups does ATP contain? [1 mark]', ['Three (1 mark)'], 'three').score, 1)
+
+	def test_uncertain_answers_are_escalated(self):
+		cases = [
+			(self.SUBATOMIC, self.SUBATOMIC_SCHEME, 'Protons and neutrons', 'partial_match'),
+			('Name the monomer of starch. [1 mark]', ['Alpha glucose (1 mark)'], 'It is not alpha glucose', 'negation'),
+			('Name two organelles. [2 marks]', ['Any two from: nucleus, ribosome, mitochondrion'], 'Nucleus and ribosome', 'points_not_one_per_mark'),
+			('Explain osmosis. [4 marks]', ['a', 'b', 'c', 'd'], 'a b c d', 'too_many_marks'),
+			('Name the gas exchange surfaces. [2 marks]', ['Gill filaments (1 mark)', 'Gill lamellae (1 mark)'], 'Gill filaments', 'partial_match'),
+			('Describe the trend in rate. [1 mark]', ['Rate increases (1 mark)'], 'The rate increases then decreases', 'opposing'),
+			('Describe the cells. [1 mark]', ['Large cells (1 mark)'], 'Cells are large and small', 'opposing'),
+		]
+		for question, mark_scheme, answer, reason in cases:
+			with self.subTest(reason=reason):
+				decision = premark(question, mark_scheme, answer)
+				self.assertIsNone(decision.score)
+				self.assertEqual(decision.reason, reason)
+
+	@override_settings(PREMARK_ENABLED=True)
+	def test_marking_view_skips_the_model_for_confident_answers(self):
+		user = CustomUser.objects.create_user(email='premark@example.com', username='premark-user', password='testpass123')
+		self.client.force_authenticate(user=user)
+		payload = {'question': self.SUBATOMIC, 'mark_scheme': self.SUBATOMIC_SCHEME, 'exam_board': 'AQA', 'qualification': 'ALEVEL_BIOLOGY'}
+		marked_before = PREMARK_OUTCOMES.value(outcome='marked', reason='full_match')
+
+		with patch('examquestions.views.evaluate_response_with_openai') as mock_evaluate:
+			mock_evaluate.return_value = {'score': 2, 'out_of': 3, 'feedback': 'Two particles named.'}
+			local = self.client.post(reverse('mark-user-answer'), {**payload, 'user_answer': 'proton, neutron, electron'}, format='json')
+			escalated = self.client.post(reverse('mark-user-answer'), {**payload, 'user_answer': 'proton and neutron'}, format='json')
+			with override_settings(PREMARK_ENABLED=False):
+				disabled = self.client.post(reverse('mark-user-answer'), {**payload, 'user_answer': 'proton, neutron, electron'}, format='json')
+
+		self.assertEqual((local.data['score'], local.data['marked_by']), (3, 'local'))
+		self.assertEqual(escalated.data['score'], 2)
+		self.assertNotIn('marked_by', disabled.data)
+		self.assertEqual(mock_evaluate.call_count, 2)
+		self.assertEqual(PREMARK_OUTCOMES.value(outcome='marked', reason='full_match'), marked_before + 1)
+
+	def test_benchmark_corpus_agrees_with_its_labels(self):
+		banks = {'alevel:AQA': json.loads(Path('examquestions/fallbackQuestions/aqa_questions.json').read_text(encoding='utf-8'))}
+		cases = build_benchmark_corpus(banks, random.Random(0), limit=40)
+		llm_mark = Mock(side_effect=lambda case: case['expected'] or 0)
+
+		summary = run_benchmark(cases, llm_mark)
+
+		self.assertEqual(set(summary['by_kind']), {'full', 'partial', 'off_topic', 'blank', 'opposing'})
+		for kind in ('partial', 'opposing'):
+			self.assertEqual(summary['by_kind'][kind]['escalated'], summary['by_kind'][kind]['cases'])
+		self.assertEqual(summary['label_agreement'], summary['labelled'])
+		self.assertEqual(llm_mark.call_count, summary['llm_compared'])
+		self.assertLess(summary['escalated'], summary['cases'])
+
+
+class OutputBudgetTests(APITestCase):
+	def _response(self, payload, finish_reason='stop'):
+		response = _mock_openai_json_response(payload)
+		response.choices[0].finish_reason = finish_reason
+		response.usage = None
+		return response
+
+	def test_budgets_grow_with_question_count_marks_and_answer_length(self):
+		small = ai._generation_request('Enzymes', 'AQA', 1)['max_tokens']
+		large = ai._generation_request('Enzymes', 'AQA', 10)['max_tokens']
+
+		self.assertLess(small, 500)
+		self.assertGreater(large, 1500)
+		self.assertEqual(marking_budget(1, 'Carbon', 150, 40), 500)
+		self.assertLess(marking_budget(1, 'Carbon', 150, 40), marking_budget(10, 'A long answer. ' * 100, 150, 40))
+		self.assertEqual(question_marks('Explain osmosis. [4 marks]'), 4)
+		self.assertEqual(question_marks('Explain osmosis.', ['a', 'b']), 2)
+
+	def test_truncated_generation_is_retried_as_two_half_size_requests(self):
+		def create(**kwargs):
+			prompt = kwargs['messages'][1]['content']
+			if 'Create 5 ' in prompt:
+				return self._response({'questions': []}, finish_reason='length')
+			count = 3 if 'Create 3 ' in prompt else 2
+			return self._response({'questions': [{'question': f'{count}-{index} [1 mark]'} for index in range(count)]})
+
+		client = Mock()
+		client.chat.completions.create.side_effect = create
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			result = ai.generate_questions('Enzymes', 'AQA', 5)
+
+		self.assertEqual(len(result['questions']), 5)
+		self.assertEqual(client.chat.completions.create.call_count, 3)
+
+	def test_truncated_single_marking_is_retried_with_a_larger_budget(self):
+		client = Mock()
+		client.chat.completions.create.side_effect = [
+			self._response({}, finish_reason='length'),
+			self._response({'score': 2, 'out_of': 3, 'feedback': 'Good.'}),
+		]
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			result = aiGCSE.evaluate_response_with_openai('Name the gas. [3 marks]', ['Oxygen'], 'Oxygen', 'AQA', 'CHEMISTRY', 'HIGHER')
+
+		self.assertEqual(result['score'], 2)
+		budgets = [call.kwargs['max_tokens'] for call in client.chat.completions.create.call_args_list]
+		self.assertEqual(budgets[1], budgets[0] * 2)
+
+	def test_truncated_batch_marking_is_split_and_merged(self):
+		def create(**kwargs):
+			answers = json.loads(kwargs['messages'][1]['content'].removeprefix('Input answers:\n'))
+			if len(answers) == 3:
+				return self._response({}, finish_reason='length')
+			return self._response({
+				'results': [{'index': answer['index'], 'score': 1, 'out_of': 1, 'feedback': answer['question']} for answer in answers],
+				'strengths': [f'{answers[0]["question"]} strength {index}' for index in range(3)],
+				'improvements': ['Add detail', 'Use key terms', 'Check units'],
+			})
+
+		client = Mock()
+		client.chat.completions.create.side_effect = create
+		answers = [{'question': f'Q{index}', 'mark_scheme': ['Point'], 'user_answer': 'answer'} for index in range(1, 4)]
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			result = ai.evaluate_batch_responses_with_openai(answers, 'AQA')
+
+		self.assertEqual([item['index'] for item in result['results']], [1, 2, 3])
+		self.assertEqual([item['feedback'] for item in result['results']], ['Q1', 'Q2', 'Q3'])
+		self.assertEqual(result['strengths'], ['Q1 strength 0', 'Q3 strength 0', 'Q1 strength 1'])
+		self.assertEqual(result['improvements'], ['Add detail', 'Use key terms', 'Check units'])
+
+
+BROKEN_LLM_OUTPUTS_PATH = Path(__file__).resolve().parent / 'testdata' / 'broken_llm_outputs.json'
+
+
+class JSONSalvageTests(APITestCase):
+	def _questions(self, count):
+		return [
+			{'question': f'Explain process {index} in detail. [2 marks]', 'total_marks': 2, 'mark_scheme': ['First point (1 mark)', 'Second point (1 mark)']}
+			for index in range(count)
+		]
+
+	def _response(self, content, finish_reason='stop'):
+		response = _mock_openai_json_response({})
+		response.choices[0].message.content = content
+		response.choices[0].finish_reason = finish_reason
+		response.usage = None
+		return response
+
+	def test_recovers_expected_items_from_broken_output_corpus(self):
+		validators = {'questions': is_valid_question_item, 'results': is_valid_result_item}
+		for case in json.loads(BROKEN_LLM_OUTPUTS_PATH.read_text(encoding='utf-8')):
+			with self.subTest(case['name']):
+				result = scan_json_array(case['content'], case['key'], validators[case['key']])
+				recovered = result.positions if case['key'] == 'questions' else [item['index'] for item in result.items]
+				self.assertEqual(recovered, case['recovered'])
+
+	def test_fuzzed_outputs_never_crash_or_invent_items(self):
+		originals = self._questions(6)
+		document = json.dumps({'questions': originals}, indent=2)
+		item_ends = [document.index(json.dumps(item, indent=2).replace('\n', '\n    ')) for item in originals]
+		rng = random.Random(20240601)
+
+		for _ in range(400):
+			cut = rng.randrange(len(document))
+			truncated = scan_json_array(document[:cut], 'questions', is_valid_question_item)
+			self.assertTrue(all(item in originals for item in truncated.items))
+			self.assertGreaterEqual(len(truncated.items), sum(1 for start in item_ends[1:] if start <= cut) - 1)
+
+			mutated = list(document)
+			for _ in range(rng.randint(1, 4)):
+				position = rng.randrange(len(mutated))
+				if rng.random() < 0.5:
+					del mutated[position]
+				else:
+					mutated.insert(position, rng.choice('{}[],:"\\x'))
+			result = scan_json_array(''.join(mutated), 'questions', is_valid_question_item)
+			self.assertTrue(all(item in originals or is_valid_question_item(item) for item in result.items))
+			self.assertLessEqual(len(result.items), len(originals) + 1)
+
+	def test_malformed_generation_returns_the_valid_questions(self):
+		good = self._questions(2)
+		content = '{"questions": [' + json.dumps(good[0]) + ', {"question": "Broken "quote" here", "total_marks": 2}, ' + json.dumps(good[1]) + ']}'
+		client = Mock()
+		client.chat.completions.create.return_value = self._response(content)
+		recovered_before = JSON_SALVAGE_ITEMS.value(kind='questions', status='recovered')
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			result = ai.generate_questions('Enzymes', 'AQA', 3)
+
+		self.assertEqual(result['questions'], good)
+		self.assertEqual(JSON_SALVAGE_ITEMS.value(kind='questions', status='recovered') - recovered_before, 2)
+
+	def test_truncated_generation_keeps_complete_questions_and_requests_only_the_rest(self):
+		questions = self._questions(3)
+		truncated = '{"questions": [' + json.dumps(questions[0]) + ', ' + json.dumps(questions[1]) + ', {"question": "Expl'
+		client = Mock()
+		client.chat.completions.create.side_effect = [
+			self._response(truncated, finish_reason='length'),
+			self._response(json.dumps({'questions': [questions[2]]})),
+		]
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			result = aiGCSE.generate_questions('Atoms', 'AQA', 3, 'CHEMISTRY', 'HIGHER')
+
+		self.assertEqual(result['questions'], questions)
+		follow_up_prompt = client.chat.completions.create.call_args_list[1].kwargs['messages'][1]['content']
+		self.assertIn('Create 1 exam-style questions', follow_up_prompt)
+
+	def test_batch_marking_remarks_only_the_lost_answers(self):
+		broken = (
+			'{"results": [{"index": 1, "score": 1, "out_of": 1, "feedback": "Q1"}, {"index": 2, "score": "?", "out_of": 1}, '
+			'{"index": 3, "score": 0, "out_of": 1, "feedback": "Q3"}], "strengths": ["A", "B", "C"], "improvements": ["D", "E", '
+		)
+		client = Mock()
+		client.chat.completions.create.side_effect = [
+			self._response(broken),
+			self._response(json.dumps({'results': [{'index': 1, 'score': 1, 'out_of': 1, 'feedback': 'Q2'}], 'strengths': ['X'], 'improvements': ['Y', 'Z', 'W']})),
+		]
+		answers = [{'question': f'Q{index}', 'mark_scheme': ['Point'], 'user_answer': 'answer'} for index in range(1, 4)]
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			result = aiEssay.evaluate_batch_responses_with_openai(answers)
+
+		self.assertEqual([(item['index'], item['feedback']) for item in result['results']], [(1, 'Q1'), (2, 'Q2'), (3, 'Q3')])
+		self.assertEqual(result['strengths'], ['A', 'B', 'C'])
+		self.assertEqual(result['improvements'], ['Y', 'Z', 'W'])
+		remarked = json.loads(client.chat.completions.create.call_args_list[1].kwargs['messages'][1]['content'].removeprefix('Input answers:\n'))
+		self.assertEqual([answer['question'] for answer in remarked], ['Q2'])
+
+
+class RequestInstrumentationTests(APITestCase):
+	def setUp(self):
+		self.user = CustomUser.objects.create_user(
+			email='timing@example.com',
+			username='timing-user',
+			password='testpass123',
+			has_alevel_paid_access=True,
+		)
+		self.client.force_authenticate(user=self.user)
+
+	@patch('examquestions.views.generate_essay_questions')
+	def test_generate_reports_phase_timings_in_server_timing_header(self, mock_generate_essay_questions):
+		mock_generate_essay_questions.return_value = {
+			'questions': [
+				{
+					'question': 'The importance of ATP in biological processes. [25 marks]',
+					'total_marks': 25,
+					'mark_scheme': ['Reward breadth, relevance, and synoptic links.'],
+				}
+			]
+		}
+
+		response = self.client.post(reverse('generate-exam-questions'), {'question_type': 'ESSAY_25_MARK'}, format='json')
+
+		self.assertEqual(response.status_code, 200)
+		phases = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+		self.assertIn('served_set', phases)
+		self.assertIn('quota', phases)
+		self.assertEqual(phases[-1], 'total')
+
+	def test_llm_calls_are_timed(self):
+		completion = Mock()
+		completion.choices = [Mock(message=Mock(content='{"strengths": [], "improvements": []}'))]
+		client = Mock()
+		client.chat.completions.create.return_value = completion
+		before = PHASE_DURATION.count(phase='llm')
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			ai.get_feedback_from_openai('How did I do?')
+
+		self.assertEqual(PHASE_DURATION.count(phase='llm'), before + 1)
+
+	def test_server_timing_sums_repeated_phases(self):
+		self.assertEqual(
+			format_server_timing([('llm', 0.1), ('quota', 0.002), ('llm', 0.2)], 0.5),
+			'llm;dur=300.0, quota;dur=2.0, total;dur=500.0',
+		)
+
+	@override_settings(METRICS_AUTH_TOKEN='scrape-token')
+	def test_metrics_endpoint_exposes_prometheus_text_behind_token(self):
+		self.client.get(reverse('biology-topics'), {'exam_board': 'AQA'})
+
+		unauthorized = self.client.get(reverse('metrics'))
+		response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+
+		self.assertEqual(unauthorized.status_code, 401)
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+		body = response.content.decode()
+		self.assertIn('# TYPE exambuilder_http_request_duration_seconds histogram', body)
+		self.assertIn('exambuilder_http_requests_total{method="GET",route="api/biology-topics/",status="200"}', body)
+
+	@override_settings(METRICS_AUTH_TOKEN='', DEBUG=False)
+	def test_metrics_endpoint_is_hidden_without_token_outside_debug(self):
+		self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class LLMTelemetryTests(APITestCase):
+	def setUp(self):
+		llm_telemetry.call_buffer.reset()
+		self.addCleanup(llm_telemetry.call_buffer.reset)
+
+	def _client_returning(self, content, prompt_tokens=1200, completion_tokens=300):
+		completion = Mock()
+		completion.choices = [Mock(message=Mock(content=content))]
+		completion.usage = Mock(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+		client = Mock()
+		client.chat.completions.create.return_value = completion
+		return client
+
+	def test_completion_usage_is_recorded_per_call(self):
+		client = self._client_returning('{"questions": []}')
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			aiGCSE.generate_questions('Atoms', 'AQA', 3, 'CHEMISTRY', 'HIGHER')
+
+		llm_telemetry.call_buffer.flush()
+		call = LLMCall.objects.get()
+		self.assertEqual((call.service, call.purpose, call.model), ('gcse', 'generate', aiGCSE.MODEL_NAME))
+		self.assertEqual(call.item_count, 3)
+		self.assertEqual((call.prompt_tokens, call.completion_tokens), (1200, 300))
+		self.assertEqual(call.outcome, LLMCall.Outcome.OK)
+		self.assertEqual(str(call.cost_usd), '0.000960')
+
+	@override_settings(LLM_TELEMETRY_FLUSH_SIZE=3)
+	def test_calls_are_buffered_and_written_in_one_batch(self):
+		client = self._client_returning('{"questions": []}')
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client):
+			for _ in range(2):
+				ai.generate_questions('Enzymes', 'AQA', 1)
+			self.assertEqual(LLMCall.objects.count(), 0)
+			ai.generate_questions('Enzymes', 'AQA', 1)
+			self.assertEqual(LLMCall.objects.count(), 3)
+
+			ai.generate_questions('Enzymes', 'AQA', 1)
+			request_finished.send(sender=self.__class__)
+
+		self.assertEqual(LLMCall.objects.count(), 4)
+
+	def test_failed_calls_are_recorded_and_still_raise(self):
+		client = Mock()
+		client.chat.completions.create.side_effect = TimeoutError('upstream timeout')
+
+		with patch.object(llm_provider, 'get_openai_client', return_value=client), self.assertRaises(TimeoutError):
+			aiEssay.evaluate_response_with_openai('Essay title. [25 marks]', ['Breadth'], 'answer')
+
+		llm_telemetry.call_buffer.flush()
+		call = LLMCall.objects.get()
+		self.assertEqual((call.service, call.purpose), ('essay', 'mark'))
+		self.assertEqual(call.outcome, LLMCall.Outcome.ERROR)
+		self.assertEqual(call.error_type, 'TimeoutError')
+
+	def test_report_command_rolls_up_and_shows_tokens_per_item(self):
+		for latency_ms in (800, 1200):
+			LLMCall.objects.create(service='alevel', purpose='generate', model='gpt-4.1-mini', item_count=4, prompt_tokens=1000, completion_tokens=600, latency_ms=latency_ms)
+		LLMCall.objects.update(created_at=timezone.now() - timedelta(days=1))
+
+		stdout_buffer = StringIO()
+		call_command('llm_usage_report', rollup=True, days=3, stdout=stdout_buffer)
+
+		rollup = LLMCallRollup.objects.get()
+		self.assertEqual(rollup.date, timezone.localdate() - timedelta(days=1))
+		self.assertEqual((rollup.calls, rollup.items, rollup.prompt_tokens), (2, 8, 2000))
+		self.assertEqual((rollup.latency_p50_ms, rollup.latency_p99_ms), (800, 1200))
+		output = stdout_buffer.getvalue()
+		self.assertIn('Rolled up 1 group(s)', output)
+		self.assertIn(' 400.0 ', output)
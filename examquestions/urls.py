@@ -1,18 +1,21 @@
 from django.urls import path
-from .views import generate_exam_questions, mark_user_answer, submit_question_session, get_user_sessions, delete_user_results, get_biology_topics, get_biology_subtopics, get_biology_subcategories, get_gcse_topics, get_gcse_subtopics, get_gcse_subcategories
+from .views import generate_exam_questions, generate_exam_questions_stream, mark_user_answer, submit_question_session, get_user_sessions, delete_user_results, get_biology_topics, get_biology_subtopics, get_biology_subcategories, get_gcse_topics, get_gcse_subtopics, get_gcse_subcategories, get_job_status, get_answer_stats
 
 urlpatterns = [
     path("generate-questions/", generate_exam_questions, name="generate-exam-questions"),
+    path("generate-questions/stream/", generate_exam_questions_stream, name="generate-exam-questions-stream"),
     path("mark-answer/", mark_user_answer, name="mark-user-answer"),
     path('submit-question-session/', submit_question_session, name='submit_question_session'),
     path('user-sessions/', get_user_sessions, name='get_user_sessions'),
     path('user-sessions/delete-all/', delete_user_results, name='delete_user_results'),
+    path('answer-stats/', get_answer_stats, name='answer-stats'),
     path('biology-topics/', get_biology_topics, name='biology-topics'),
     path("biology-subtopics/", get_biology_subtopics),           # add
     path("biology-subcategories/", get_biology_subcategories),
     path("gcse-topics/", get_gcse_topics, name="gcse-topics"),
     path("gcse-subtopics/", get_gcse_subtopics, name="gcse-subtopics"),
     path("gcse-subcategories/", get_gcse_subcategories, name="gcse-subcategories"),
+    path("jobs/<int:job_id>/", get_job_status, name="get-job-status"),
 
     
 ]
\ No newline at end of file
@@ -1,7 +1,13 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .services.ai import generate_questions, evaluate_batch_responses_with_openai, evaluate_response_with_openai
+from .services.ai import (
+    _format_mark_scheme_points,
+    generate_questions,
+    stream_generate_questions,
+    evaluate_batch_responses_with_openai,
+    evaluate_response_with_openai,
+)
 from .services.aiEssay import (
     generate_questions as generate_essay_questions,
     evaluate_batch_responses_with_openai as evaluate_essay_batch_responses_with_openai,
@@ -9,6 +15,7 @@ from .services.aiEssay import (
 )
 from .services.aiGCSE import (
     generate_questions as generate_gcse_questions,
+    stream_generate_questions as stream_generate_gcse_questions,
     evaluate_batch_responses_with_openai as evaluate_gcse_batch_responses_with_openai,
     evaluate_response_with_openai as evaluate_gcse_response_with_openai,
 )
@@ -20,17 +27,41 @@ from .models import (
     GCSEScienceTopic,
     GCSEScienceSubTopic,
     GCSEScienceSubCategory,
+    AnswerResult,
     ServedQuestion,
+    SessionQuestion,
     ExamBoard,
     QualificationPath,
     GCSESubject,
     GCSEScienceRoute,
     GCSETier,
+    Job,
+)
+from .services.answer_stats import question_difficulty, weak_areas
+from .services.idempotency import idempotent
+from .services.shared_questions import (
+    draw_shared_questions,
+    llm_calls_saved,
+    mark_shared_questions_served,
+    report_shared_generation,
+    store_shared_questions,
 )
+from .services.near_duplicates import NearDuplicateIndex
+from .services.premarker import premark_or_evaluate
+from .services.fallback_banks import bank_replaced, fallback_banks
+from .services.scope_index import bank_scope_keys, forget_bank_scopes
+from .services.question_text import item_question_key, normalized_item_question, question_text_from_item
+from .services.jobs import enqueue_job, serialize_job
 from accounts.models import CustomUser, QuestionUsage, UserEntitlement
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+from exambuilder.metrics import span
+from django.urls import reverse
 from django.utils import timezone
-from functools import lru_cache
+from contextlib import closing, nullcontext
+from functools import partial
 import json
 from .serializers import (
     QuestionSessionSerializer,
@@ -263,17 +294,6 @@ def normalize_feedback_payload(feedback_value, answers):
     return build_session_feedback_from_answers(answers)
 
 
-def normalize_question_text(question_text):
-    normalized = str(question_text or "").strip().lower()
-    normalized = re.sub(r"\s+", " ", normalized)
-    normalized = re.sub(r"\s*\[\d+\s+marks?\]\s*$", "", normalized)
-    return normalized.strip()
-
-
-def question_text_from_item(question_item):
-    return str(question_item.get("question", "")).strip()
-
-
 UNSEEN_RESOURCE_PATTERNS = [
     re.compile(r"\b(?:figure|fig\.?|graph|table|chart|diagram|image)\b"),
     re.compile(r"\b(?:data|results?|information)\s+(?:above|below|provided|shown|in)\b"),
@@ -316,18 +336,58 @@ PROCEDURAL_DETAIL_PATTERNS = [
 ]
 
 
+QUESTION_CONTEXT_CATEGORIES = {
+    "unseen_resource": UNSEEN_RESOURCE_PATTERNS,
+    "method_evaluation": METHOD_EVALUATION_PATTERNS,
+    "procedural_detail": PROCEDURAL_DETAIL_PATTERNS,
+}
+
+
+def _compile_question_context_scanner(named):
+    # All the patterns as one alternation, optionally with a named group per pattern. Every pattern starts with
+    # ``\b`` at a word, so that anchor is hoisted out as a word-start check; otherwise every alternative would be
+    # tried at every character. Only unseen-resource patterns span a word another category starts with ("using the
+    # data"), so listing them first means a non-overlapping scan still reports every category the separate patterns
+    # would.
+    alternatives = []
+    for category, patterns in QUESTION_CONTEXT_CATEGORIES.items():
+        for index, pattern in enumerate(patterns):
+            if not pattern.pattern.startswith(r"\b"):
+                raise ValueError(f"Question context pattern must start at a word boundary: {pattern.pattern}")
+            source = pattern.pattern[2:]
+            alternatives.append(f"(?P<{category}_{index}>{source})" if named else source)
+    return re.compile(r"(?<!\w)\b(?:" + "|".join(alternatives) + ")")
+
+
+# Named groups stop the regex engine skipping alternatives by their first letter, so the plain alternation, about
+# three times faster, finds the first hit and the named scanner only runs from there. Most questions have no hit.
+QUESTION_CONTEXT_PREFILTER = _compile_question_context_scanner(named=False)
+QUESTION_CONTEXT_SCANNER = _compile_question_context_scanner(named=True)
+
+
+def scan_question_context(normalized_question):
+    """Indexes of the patterns hit in each ``QUESTION_CONTEXT_CATEGORIES`` category, found in one pass."""
+    hits = {category: set() for category in QUESTION_CONTEXT_CATEGORIES}
+    first_hit = QUESTION_CONTEXT_PREFILTER.search(normalized_question)
+    if first_hit is None:
+        return hits
+    for match in QUESTION_CONTEXT_SCANNER.finditer(normalized_question, first_hit.start()):
+        category, _, index = match.lastgroup.rpartition("_")
+        hits[category].add(int(index))
+    return hits
+
+
 def is_self_contained_ai_question(question_item):
-    normalized_question = normalize_question_text(question_text_from_item(question_item))
+    normalized_question = normalized_item_question(question_item)
     if not normalized_question:
         return False
 
-    if any(pattern.search(normalized_question) for pattern in UNSEEN_RESOURCE_PATTERNS):
+    hits = scan_question_context(normalized_question)
+    if hits["unseen_resource"]:
         return False
 
-    if any(pattern.search(normalized_question) for pattern in METHOD_EVALUATION_PATTERNS):
-        detail_matches = sum(bool(pattern.search(normalized_question)) for pattern in PROCEDURAL_DETAIL_PATTERNS)
-        if detail_matches < 2:
-            return False
+    if hits["method_evaluation"] and len(hits["procedural_detail"]) < 2:
+        return False
 
     return True
 
@@ -342,37 +402,60 @@ def filter_self_contained_ai_questions(ai_questions):
     return valid_questions
 
 
-def get_fallback_pool(all_fallback_questions, scope_title, topic_title, allow_generic=False):
-    if not isinstance(all_fallback_questions, dict):
-        return []
+# Upper mark limit of each generic pool band; ``None`` takes everything above the previous band.
+# Generic pools prefer short questions, as the old per-request filter did; "all" is used when a bank has none.
+GENERIC_POOL_MAX_MARKS = 3
+# id(bank) -> (bank, pools). Keying on id() is only safe because ``_forget_replaced_bank`` pops a bank's entry when
+# bank_replaced fires for it. The identity check on the stored bank guards against a reused id, but without that
+# eviction every replaced bank, and its pools, would stay in memory for the life of the process.
+_GENERIC_FALLBACK_POOLS = {}
 
-    scope_pool = all_fallback_questions.get(scope_title)
-    if isinstance(scope_pool, list) and scope_pool:
-        return scope_pool
 
-    topic_pool = all_fallback_questions.get(topic_title)
-    if isinstance(topic_pool, list) and topic_pool:
-        return topic_pool
+def generic_fallback_pools(all_fallback_questions):
+    """Self-contained questions from every scope of a bank, built once per bank.
 
-    if not allow_generic:
-        return []
+    ``"1-3"`` holds those worth at most ``GENERIC_POOL_MAX_MARKS`` and ``"all"`` holds every one.
 
-    lower_mark_questions = []
-    all_self_contained_questions = []
+    The lists are shared between requests, so callers must not modify them.
+    """
+    cached = _GENERIC_FALLBACK_POOLS.get(id(all_fallback_questions))
+    if cached is not None and cached[0] is all_fallback_questions:
+        return cached[1]
+
+    pools = {"1-3": [], "all": []}
     for question_group in all_fallback_questions.values():
         if not isinstance(question_group, list):
             continue
         for question_item in question_group:
             if not is_self_contained_ai_question(question_item):
                 continue
-            all_self_contained_questions.append(question_item)
+            pools["all"].append(question_item)
             total_marks = question_item.get("total_marks", question_item.get("mark", 0)) or 0
-            if total_marks <= 3:
-                lower_mark_questions.append(question_item)
+            if total_marks <= GENERIC_POOL_MAX_MARKS:
+                pools["1-3"].append(question_item)
+
+    _GENERIC_FALLBACK_POOLS[id(all_fallback_questions)] = (all_fallback_questions, pools)
+    return pools
 
-    if lower_mark_questions:
-        return lower_mark_questions
-    return all_self_contained_questions
+
+def get_fallback_pool(all_fallback_questions, scope_title, topic_title, allow_generic=False, scope_key=None):
+    """The bank section for the scope, else its topic's, else (with ``allow_generic``) the bank's generic pool.
+
+    Sections are found through the scope index, so titles that differ from the bank's in case, punctuation or
+    specification numbering still match.
+    """
+    if not isinstance(all_fallback_questions, dict):
+        return []
+
+    bank_keys = bank_scope_keys(all_fallback_questions, scope_key, scope_title, topic_title).keys
+    if bank_keys:
+        return all_fallback_questions[bank_keys[0]]
+
+    if not allow_generic:
+        return []
+
+    generic_pools = generic_fallback_pools(all_fallback_questions)
+    return generic_pools["1-3"] or generic_pools["all"]
 
 
 def build_gcse_scope_metadata(topic, subtopic=None, subcategory=None, tier=None):
@@ -383,19 +466,16 @@ def build_gcse_scope_metadata(topic, subtopic=None, subcategory=None, tier=None)
     return topic.topic, f"gcse-topic:{topic.id}:{tier}"
 
 
-@lru_cache(maxsize=None)
 def load_fallback_bank_from_path(path_value: str) -> dict:
-    path = Path(path_value)
+    """The current bank in the file, reloaded when the file changes; ``{}`` if it has never loaded."""
+    return fallback_banks.get(path_value)
 
-    logger.info("Using fallback file: %s | Exists: %s", path, path.exists())
 
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logger.warning("Fallback file NOT FOUND at %s", path)
-        return {}
-    # Let JSONDecodeError bubble up so the caller's except block handles it.
+@receiver(bank_replaced)
+def _forget_replaced_bank(sender, old_bank, **kwargs):
+    # Derived data for a replaced bank would otherwise be kept alive by the caches' own references to it.
+    _GENERIC_FALLBACK_POOLS.pop(id(old_bank), None)
+    forget_bank_scopes(old_bank)
 
 
 def load_fallback_bank_for_board(exam_board: str) -> dict:
@@ -451,10 +531,11 @@ def build_scope_metadata(topic, subtopic=None, subcategory=None):
 
 
 def get_user_served_question_set(user, exam_board, scope_key):
-    return set(
-        ServedQuestion.objects.filter(user=user, exam_board=exam_board, scope_key=scope_key)
-        .values_list("normalized_question", flat=True)
-    )
+    with span("served_set"):
+        return set(
+            ServedQuestion.objects.filter(user=user, exam_board=exam_board, scope_key=scope_key)
+            .values_list("normalized_question", flat=True)
+        )
 
 
 def reset_user_served_questions(user, exam_board, scope_key):
@@ -468,8 +549,7 @@ def select_fallback_questions(fallback_pool, count, excluded_questions):
     unique_candidates = []
     seen_in_pool = set()
     for candidate in fallback_pool:
-        question_text = question_text_from_item(candidate)
-        normalized = normalize_question_text(question_text)
+        normalized = normalized_item_question(candidate)
         if not normalized or normalized in excluded_questions or normalized in seen_in_pool:
             continue
         seen_in_pool.add(normalized)
@@ -487,18 +567,19 @@ def replace_duplicate_questions_from_fallback(
     requested_count,
     served_questions,
 ):
-    current_questions = list(accepted_questions)
-    excluded_questions = {normalize_question_text(question_text_from_item(item)) for item in current_questions}
-    excluded_questions.update(served_questions)
-    missing_count = max(requested_count - len(current_questions), 0)
-    replacements = select_fallback_questions(fallback_pool, missing_count, excluded_questions)
-
-    if len(replacements) < missing_count:
-        reset_user_served_questions(user, exam_board, scope_key)
-        served_questions.clear()
-        excluded_questions = {normalize_question_text(question_text_from_item(item)) for item in current_questions}
+    with span("fallback"):
+        current_questions = list(accepted_questions)
+        current_normalized = {normalized_item_question(item) for item in current_questions}
+        excluded_questions = current_normalized | set(served_questions)
+        missing_count = max(requested_count - len(current_questions), 0)
         replacements = select_fallback_questions(fallback_pool, missing_count, excluded_questions)
 
+        if len(replacements) < missing_count:
+            reset_user_served_questions(user, exam_board, scope_key)
+            served_questions.clear()
+            excluded_questions = current_normalized
+            replacements = select_fallback_questions(fallback_pool, missing_count, excluded_questions)
+
     if len(replacements) < missing_count:
         raise ValueError(
             "Not enough stored fallback questions are available to replace duplicate questions for this selection."
@@ -511,7 +592,7 @@ def replace_duplicate_questions_from_fallback(
 def record_served_questions(user, exam_board, scope_key, questions):
     records = []
     for question_item in questions:
-        normalized = normalize_question_text(question_text_from_item(question_item))
+        normalized = normalized_item_question(question_item)
         if not normalized:
             continue
         records.append(
@@ -527,6 +608,125 @@ def record_served_questions(user, exam_board, scope_key, questions):
         ServedQuestion.objects.bulk_create(records, ignore_conflicts=True)
 
 
+def record_session_questions(session, questions, question_type=QUESTION_TYPE_STANDARD):
+    """Store the served questions and their mark schemes so marking and submit can refer to them by id.
+
+    Point-per-mark schemes are stored already formatted; essay schemes are kept as generated.
+    """
+    records = []
+    for position, question_item in enumerate(questions):
+        mark_scheme = question_item.get("mark_scheme") or []
+        if question_type != QUESTION_TYPE_ESSAY_25_MARK and isinstance(mark_scheme, list):
+            mark_scheme = _format_mark_scheme_points(mark_scheme)
+        records.append(
+            SessionQuestion(
+                session=session,
+                position=position,
+                question=question_text_from_item(question_item),
+                marks=_coerce_numeric_score(question_item.get("total_marks", question_item.get("mark", 0))),
+                mark_scheme=mark_scheme,
+            )
+        )
+    return SessionQuestion.objects.bulk_create(records)
+
+
+def attach_session_questions(session, answers):
+    """Fill each answer that names a ``question_id`` with the stored question text, marks and mark scheme.
+
+    Stored values replace anything the client sent. Returns ``(answers, error_message)``.
+    """
+    question_ids = {answer.get("question_id") for answer in answers if answer.get("question_id") is not None}
+    stored = {question.id: question for question in session.questions.filter(id__in=question_ids)}
+    attached = []
+    for answer in answers:
+        question_id = answer.get("question_id")
+        if question_id is None:
+            attached.append(answer)
+            continue
+        question = stored.get(_coerce_numeric_score(question_id))
+        if question is None:
+            return None, f"Question {question_id} does not belong to this session."
+        attached.append(
+            {**answer, "question": question.question, "mark_scheme": question.mark_scheme, "total_marks": question.marks}
+        )
+    return attached, None
+
+
+def session_scope_metadata(session):
+    if session.gcse_topic_id:
+        return build_gcse_scope_metadata(session.gcse_topic, session.gcse_subtopic, session.gcse_subcategory, session.gcse_tier)
+    if session.topic_id:
+        return build_scope_metadata(session.topic, session.subtopic, session.subcategory)
+    return "AQA A-level essay", "essay_25_mark_aqa_alevel"
+
+
+def record_issued_marks(session, issued):
+    """Store the mark given to each stored question, from ``(question_id, marking result)`` pairs."""
+    questions = {question.id: question for question in session.questions.filter(id__in=[question_id for question_id, _ in issued])}
+    updated = []
+    for question_id, result in issued:
+        question = questions.get(_coerce_numeric_score(question_id))
+        if question is None or not isinstance(result, dict):
+            continue
+        question.score = _coerce_numeric_score(result.get("score", 0))
+        question.marked_by = (
+            AnswerResult.MarkedBy.LOCAL if result.get("marked_by") == "local" else AnswerResult.MarkedBy.MODEL
+        )
+        updated.append(question)
+    SessionQuestion.objects.bulk_update(updated, ["score", "marked_by"])
+
+
+def apply_issued_marks(session, answers):
+    """Set each answer's ``score`` and ``marked_by`` from the mark this server issued for its stored question.
+
+    Scores sent by the client are ignored for marked questions; answers naming no marked question keep their
+    reported score and are recorded as ``client``.
+    """
+    issued = {
+        question_id: (score, marked_by)
+        for question_id, score, marked_by in session.questions.filter(score__isnull=False).values_list("id", "score", "marked_by")
+    }
+    resolved = []
+    for answer in answers:
+        question_id = answer.get("question_id")
+        mark = issued.get(_coerce_numeric_score(question_id)) if question_id is not None else None
+        if mark is None:
+            resolved.append({**answer, "marked_by": AnswerResult.MarkedBy.CLIENT})
+        else:
+            resolved.append({**answer, "score": _coerce_numeric_score(mark[0]), "marked_by": mark[1]})
+    return resolved
+
+
+def record_answer_results(session, answers):
+    """Replace the session's per-answer results with one ``AnswerResult`` row per submitted answer.
+
+    ``answers`` must already have been through ``apply_issued_marks``.
+    """
+    scope_title, scope_key = session_scope_metadata(session)
+    positions = dict(session.questions.values_list("id", "position"))
+    records = []
+    for index, answer in enumerate(answers):
+        question_id = _coerce_numeric_score(answer.get("question_id")) if answer.get("question_id") is not None else None
+        marked_by = answer.get("marked_by")
+        records.append(
+            AnswerResult(
+                user_id=session.user_id,
+                session=session,
+                question_id=question_id,
+                position=positions.get(question_id, index),
+                qualification=session.qualification,
+                exam_board=session.exam_board,
+                scope_key=scope_key,
+                scope_title=scope_title[:255],
+                score=_coerce_numeric_score(answer.get("score", 0)),
+                out_of=_answer_out_of(answer),
+                marked_by=marked_by if marked_by in AnswerResult.MarkedBy.values else AnswerResult.MarkedBy.CLIENT,
+            )
+        )
+    session.answer_results.all().delete()
+    return AnswerResult.objects.bulk_create(records)
+
+
 def build_question_scope(topic_title, subtopic=None, subcategory=None):
     scope = topic_title
     if subtopic:
@@ -537,60 +737,63 @@ def build_question_scope(topic_title, subtopic=None, subcategory=None):
 
 
 def collect_valid_ai_questions(ai_questions, served_questions):
+    """Drop questions that repeat or nearly repeat a served question or an earlier one in the batch.
+
+    ``served_questions`` is a set of normalised texts or a ``NearDuplicateIndex``; an index is extended in place with
+    the accepted questions, which lets the streaming path check one question at a time.
+    """
+    if not isinstance(served_questions, NearDuplicateIndex):
+        served_questions = NearDuplicateIndex(served_questions)
     accepted_questions = []
-    current_batch_questions = set()
 
     for ai_question in ai_questions:
-        normalized = normalize_question_text(question_text_from_item(ai_question))
-        if not normalized or normalized in served_questions or normalized in current_batch_questions:
+        normalized = normalized_item_question(ai_question)
+        if not normalized or normalized in served_questions:
             continue
-        current_batch_questions.add(normalized)
+        served_questions.add(normalized)
         accepted_questions.append(ai_question)
 
     return accepted_questions
 
 
-def prepare_alevel_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id, number):
-    topic_filters = {"id": topic_id, "exam_board": board_key}
-    if board_key == ExamBoard.EDEXCEL:
-        topic_filters["specification"] = specification
-    topic = BiologyTopic.objects.get(**topic_filters)
+def _iter_generated_questions(generate, *args, **kwargs):
+    yield from generate(*args, **kwargs).get("questions", [])
 
-    subtopic = None
-    if subtopic_id:
-        subtopic = BiologySubTopic.objects.get(id=subtopic_id, topic_id=topic.id)
 
-    subcategory = None
-    if subcategory_id:
-        if not subtopic_id:
-            raise ValueError("subcategory_id provided without subtopic_id")
-        subcategory = BiologySubCategory.objects.get(id=subcategory_id, subtopic_id=subtopic.id)
+def resolve_alevel_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id, number):
+    with span("curriculum"):
+        topic_filters = {"id": topic_id, "exam_board": board_key}
+        if board_key == ExamBoard.EDEXCEL:
+            topic_filters["specification"] = specification
+        topic = BiologyTopic.objects.get(**topic_filters)
+
+        subtopic = None
+        if subtopic_id:
+            subtopic = BiologySubTopic.objects.get(id=subtopic_id, topic_id=topic.id)
+
+        subcategory = None
+        if subcategory_id:
+            if not subtopic_id:
+                raise ValueError("subcategory_id provided without subtopic_id")
+            subcategory = BiologySubCategory.objects.get(id=subcategory_id, subtopic_id=subtopic.id)
 
-    all_fallback_questions = load_fallback_bank_for_board(board_key)
     scope_title, scope_key = build_scope_metadata(topic, subtopic, subcategory)
     served_questions = get_user_served_question_set(user, board_key, scope_key)
-    fallback_pool = get_fallback_pool(all_fallback_questions, scope_title, topic.topic)
+    with span("fallback"):
+        all_fallback_questions = load_fallback_bank_for_board(board_key)
+        fallback_pool = get_fallback_pool(all_fallback_questions, scope_title, topic.topic, scope_key=scope_key)
 
     scope = build_question_scope(topic.topic, subtopic, subcategory)
-    ai_response = generate_questions(scope, board_key, number, specification=specification)
-    ai_questions = filter_self_contained_ai_questions(ai_response.get("questions", []))
-    combined_questions = collect_valid_ai_questions(ai_questions, served_questions)
-
-    if len(combined_questions) < number:
-        combined_questions, served_questions = replace_duplicate_questions_from_fallback(
-            user=user,
-            exam_board=board_key,
-            scope_key=scope_key,
-            fallback_pool=fallback_pool if isinstance(fallback_pool, list) else [],
-            accepted_questions=combined_questions,
-            requested_count=number,
-            served_questions=served_questions,
-        )
-
-    total_available = sum(q.get("total_marks", q.get("mark", 0)) for q in combined_questions)
     return {
+        "board_key": board_key,
         "scope_key": scope_key,
-        "combined_questions": combined_questions,
+        "number": number,
+        "served_questions": served_questions,
+        "fallback_pool": fallback_pool if isinstance(fallback_pool, list) else [],
+        "missing_fallback_error": None,
+        "shared_pool_service": "alevel",
+        "generate_ai_questions": partial(generate_questions, scope, board_key, specification=specification),
+        "stream_ai_questions": partial(stream_generate_questions, scope, board_key, specification=specification),
         "session_kwargs": {
             "topic": topic,
             "subtopic": subtopic,
@@ -599,29 +802,29 @@ def prepare_alevel_generation(user, board_key, specification, topic_id, subtopic
             "exam_board": board_key,
             "specification": specification,
             "number_of_questions": number,
-            "total_available": total_available,
         },
     }
 
 
-def prepare_essay_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id):
+def resolve_essay_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id):
     topic = None
     subtopic = None
     subcategory = None
 
     if topic_id:
-        topic_filters = {"id": topic_id, "exam_board": board_key}
-        if board_key == ExamBoard.EDEXCEL:
-            topic_filters["specification"] = specification
-        topic = BiologyTopic.objects.get(**topic_filters)
+        with span("curriculum"):
+            topic_filters = {"id": topic_id, "exam_board": board_key}
+            if board_key == ExamBoard.EDEXCEL:
+                topic_filters["specification"] = specification
+            topic = BiologyTopic.objects.get(**topic_filters)
 
-        if subtopic_id:
-            subtopic = BiologySubTopic.objects.get(id=subtopic_id, topic_id=topic.id)
+            if subtopic_id:
+                subtopic = BiologySubTopic.objects.get(id=subtopic_id, topic_id=topic.id)
 
-        if subcategory_id:
-            if not subtopic_id:
-                raise ValueError("subcategory_id provided without subtopic_id")
-            subcategory = BiologySubCategory.objects.get(id=subcategory_id, subtopic_id=subtopic.id)
+            if subcategory_id:
+                if not subtopic_id:
+                    raise ValueError("subcategory_id provided without subtopic_id")
+                subcategory = BiologySubCategory.objects.get(id=subcategory_id, subtopic_id=subtopic.id)
 
         _, scope_key = build_scope_metadata(topic, subtopic, subcategory)
     else:
@@ -630,18 +833,18 @@ def prepare_essay_generation(user, board_key, specification, topic_id, subtopic_
     served_questions = get_user_served_question_set(user, board_key, scope_key)
 
     scope = build_question_scope(topic.topic, subtopic, subcategory) if topic else ""
-    ai_response = generate_essay_questions(scope, 1, specification=specification)
-    ai_questions = filter_self_contained_ai_questions(ai_response.get("questions", []))
-    combined_questions = collect_valid_ai_questions(ai_questions, served_questions)
-
-    if not combined_questions:
-        raise ValueError("No valid essay question returned.")
-
-    combined_questions = combined_questions[:1]
-    total_available = sum(q.get("total_marks", q.get("mark", 0)) for q in combined_questions)
+    # A single essay question gains nothing from streaming, so both paths make one ordinary call.
+    generate_ai_questions = partial(generate_essay_questions, scope, specification=specification)
     return {
+        "board_key": board_key,
         "scope_key": scope_key,
-        "combined_questions": combined_questions,
+        "number": 1,
+        "served_questions": served_questions,
+        "fallback_pool": None,
+        "missing_fallback_error": None,
+        "shared_pool_service": None,
+        "generate_ai_questions": generate_ai_questions,
+        "stream_ai_questions": partial(_iter_generated_questions, generate_ai_questions),
         "session_kwargs": {
             "topic": topic,
             "subtopic": subtopic,
@@ -650,59 +853,53 @@ def prepare_essay_generation(user, board_key, specification, topic_id, subtopic_
             "exam_board": board_key,
             "specification": specification,
             "number_of_questions": 1,
-            "total_available": total_available,
         },
     }
 
 
-def prepare_gcse_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id, gcse_subject, gcse_tier, number):
-    topic_filters = {"id": topic_id, "exam_board": board_key, "subject": gcse_subject}
-    if board_key == ExamBoard.EDEXCEL:
-        topic_filters["specification"] = specification
-    gcse_topic = GCSEScienceTopic.objects.get(**topic_filters)
+def resolve_gcse_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id, gcse_subject, gcse_tier, number):
+    with span("curriculum"):
+        topic_filters = {"id": topic_id, "exam_board": board_key, "subject": gcse_subject}
+        if board_key == ExamBoard.EDEXCEL:
+            topic_filters["specification"] = specification
+        gcse_topic = GCSEScienceTopic.objects.get(**topic_filters)
+
+        gcse_subtopic = None
+        if subtopic_id:
+            gcse_subtopic = GCSEScienceSubTopic.objects.get(id=subtopic_id, topic_id=gcse_topic.id)
+
+        gcse_subcategory = None
+        if subcategory_id:
+            if not subtopic_id:
+                raise ValueError("subcategory_id provided without subtopic_id")
+            gcse_subcategory = GCSEScienceSubCategory.objects.get(id=subcategory_id, subtopic_id=gcse_subtopic.id)
+
     science_route = (
         GCSEScienceRoute.COMBINED
         if gcse_subject == GCSESubject.COMBINED
         else GCSEScienceRoute.SEPARATE
     )
-
-    gcse_subtopic = None
-    if subtopic_id:
-        gcse_subtopic = GCSEScienceSubTopic.objects.get(id=subtopic_id, topic_id=gcse_topic.id)
-
-    gcse_subcategory = None
-    if subcategory_id:
-        if not subtopic_id:
-            raise ValueError("subcategory_id provided without subtopic_id")
-        gcse_subcategory = GCSEScienceSubCategory.objects.get(id=subcategory_id, subtopic_id=gcse_subtopic.id)
-
-    all_fallback_questions = load_fallback_bank_for_gcse(board_key, gcse_subject)
     scope_title, scope_key = build_gcse_scope_metadata(gcse_topic, gcse_subtopic, gcse_subcategory, gcse_tier)
     served_questions = get_user_served_question_set(user, board_key, scope_key)
-    fallback_pool = get_fallback_pool(all_fallback_questions, scope_title, gcse_topic.topic, allow_generic=True)
-
-    scope = build_question_scope(gcse_topic.topic, gcse_subtopic, gcse_subcategory)
-    ai_response = generate_gcse_questions(scope, board_key, number, gcse_subject, gcse_tier)
-    ai_questions = filter_self_contained_ai_questions(ai_response.get("questions", []))
-    combined_questions = collect_valid_ai_questions(ai_questions, served_questions)
-
-    if len(combined_questions) < number:
-        if not fallback_pool:
-            raise ValueError(f"No GCSE fallback question bank configured for {board_key} {gcse_subject}.")
-        combined_questions, served_questions = replace_duplicate_questions_from_fallback(
-            user=user,
-            exam_board=board_key,
-            scope_key=scope_key,
-            fallback_pool=fallback_pool if isinstance(fallback_pool, list) else [],
-            accepted_questions=combined_questions,
-            requested_count=number,
-            served_questions=served_questions,
+    with span("fallback"):
+        all_fallback_questions = load_fallback_bank_for_gcse(board_key, gcse_subject)
+        fallback_pool = get_fallback_pool(
+            all_fallback_questions, scope_title, gcse_topic.topic, allow_generic=True, scope_key=scope_key
         )
 
-    total_available = sum(q.get("total_marks", q.get("mark", 0)) for q in combined_questions)
+    scope = build_question_scope(gcse_topic.topic, gcse_subtopic, gcse_subcategory)
     return {
+        "board_key": board_key,
         "scope_key": scope_key,
-        "combined_questions": combined_questions,
+        "number": number,
+        "served_questions": served_questions,
+        "fallback_pool": fallback_pool if isinstance(fallback_pool, list) else [],
+        "missing_fallback_error": (
+            None if fallback_pool else f"No GCSE fallback question bank configured for {board_key} {gcse_subject}."
+        ),
+        "shared_pool_service": "gcse",
+        "generate_ai_questions": lambda count: generate_gcse_questions(scope, board_key, count, gcse_subject, gcse_tier),
+        "stream_ai_questions": lambda count: stream_generate_gcse_questions(scope, board_key, count, gcse_subject, gcse_tier),
         "session_kwargs": {
             "qualification": QualificationPath.GCSE_SCIENCE,
             "gcse_topic": gcse_topic,
@@ -714,22 +911,137 @@ def prepare_gcse_generation(user, board_key, specification, topic_id, subtopic_i
             "exam_board": board_key,
             "specification": specification,
             "number_of_questions": number,
-            "total_available": total_available,
         },
     }
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def generate_exam_questions(request):
-    topic_id = request.data.get("topic_id")
-    subtopic_id = request.data.get("subtopic_id")         # optional
-    subcategory_id = request.data.get("subcategory_id")   # optional
-    exam_board = request.data.get("exam_board")
-    qualification = _normalize_qualification(request.data.get("qualification"), default='')
-    question_type = _normalize_question_type(request.data.get("question_type"))
+def complete_generation(user, context, accepted_questions, shared_questions=()):
+    """Top up accepted AI questions from the fallback bank and build the session fields for them.
+
+    ``shared_questions`` are the leading accepted questions drawn from the shared pool.
+    """
+    number = context["number"]
+    combined_questions = list(accepted_questions)
+
+    if context["fallback_pool"] is None:
+        if not combined_questions:
+            raise ValueError("No valid essay question returned.")
+        combined_questions = combined_questions[:number]
+    elif len(combined_questions) < number:
+        if context["missing_fallback_error"]:
+            raise ValueError(context["missing_fallback_error"])
+        combined_questions, _ = replace_duplicate_questions_from_fallback(
+            user=user,
+            exam_board=context["board_key"],
+            scope_key=context["scope_key"],
+            fallback_pool=context["fallback_pool"],
+            accepted_questions=combined_questions,
+            requested_count=number,
+            served_questions=context["served_questions"],
+        )
+
+    total_available = sum(q.get("total_marks", q.get("mark", 0)) for q in combined_questions)
+    return {
+        "scope_key": context["scope_key"],
+        "combined_questions": combined_questions,
+        "session_kwargs": {**context["session_kwargs"], "total_available": total_available},
+        "shared_pool_service": context["shared_pool_service"],
+        "shared_questions": list(shared_questions),
+        "llm_calls_saved": llm_calls_saved(context["number"], len(shared_questions)),
+    }
+
+
+def mark_shared_pool_served(generation_request, scope_key, shared_questions):
+    """Count pooled questions as served; call inside the transaction that records them for the user."""
+    if shared_questions:
+        mark_shared_questions_served(
+            generation_request["board_key"], scope_key, [item_question_key(item) for item in shared_questions]
+        )
+
+
+def report_shared_pool_generation(generation_request, generation_result):
+    """Update the shared-pool counters once the generation has been committed."""
+    if generation_result["shared_pool_service"]:
+        report_shared_generation(
+            generation_result["shared_pool_service"], generation_request["number"], len(generation_result["shared_questions"])
+        )
+
+
+def draw_shared_pool_questions(context):
+    """Pooled questions other users were served for this scope, skipping this user's history; essays are not pooled."""
+    if not context["shared_pool_service"]:
+        return []
+    return draw_shared_questions(context["board_key"], context["scope_key"], context["number"], context["served_questions"])
+
+
+def pool_ai_questions(context, ai_questions):
+    """Add freshly generated, validated questions to the shared pool and report the calls the pool saved."""
+    if not context["shared_pool_service"]:
+        return
+    store_shared_questions(
+        context["shared_pool_service"],
+        context["board_key"],
+        context["scope_key"],
+        [(item_question_key(item), item) for item in ai_questions],
+    )
+
+
+def _prepare_generation(user, context):
+    shared_questions = draw_shared_pool_questions(context)
+    shortfall = context["number"] - len(shared_questions)
+    accepted_questions = list(shared_questions)
+    if shortfall > 0:
+        excluded_questions = set(context["served_questions"])
+        excluded_questions.update(normalized_item_question(item) for item in shared_questions)
+        ai_response = context["generate_ai_questions"](shortfall)
+        ai_questions = filter_self_contained_ai_questions(ai_response.get("questions", []))
+        valid_ai_questions = collect_valid_ai_questions(ai_questions, excluded_questions)
+        pool_ai_questions(context, valid_ai_questions)
+        accepted_questions.extend(valid_ai_questions[:shortfall])
+    return complete_generation(user, context, accepted_questions, shared_questions)
+
+
+def prepare_alevel_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id, number):
+    context = resolve_alevel_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id, number)
+    return _prepare_generation(user, context)
+
+
+def prepare_essay_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id):
+    context = resolve_essay_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id)
+    return _prepare_generation(user, context)
+
+
+def prepare_gcse_generation(user, board_key, specification, topic_id, subtopic_id, subcategory_id, gcse_subject, gcse_tier, number):
+    context = resolve_gcse_generation(
+        user, board_key, specification, topic_id, subtopic_id, subcategory_id, gcse_subject, gcse_tier, number
+    )
+    return _prepare_generation(user, context)
+
+
+def _free_limit_error(current_plan_type, questions_remaining_today):
+    return (
+        {
+            "error": "Free users can only generate 1 question per day total. Upgrade this qualification for unlimited access.",
+            "plan_type": current_plan_type,
+            "questions_remaining_today": questions_remaining_today,
+        },
+        403,
+    )
+
+
+def _validate_generation_request(user, data):
+    """Check a generate request and the free daily quota.
+
+    Returns ``(generation_request, None)`` when the request can go ahead, otherwise ``(None, (body, status))``.
+    """
+    topic_id = data.get("topic_id")
+    subtopic_id = data.get("subtopic_id")         # optional
+    subcategory_id = data.get("subcategory_id")   # optional
+    exam_board = data.get("exam_board")
+    qualification = _normalize_qualification(data.get("qualification"), default='')
+    question_type = _normalize_question_type(data.get("question_type"))
     try:
-        number = int(request.data.get("number_of_questions"))
+        number = int(data.get("number_of_questions"))
     except (TypeError, ValueError):
         number = 0
 
@@ -739,36 +1051,36 @@ def generate_exam_questions(request):
         number = 1
 
     if question_type != QUESTION_TYPE_ESSAY_25_MARK and not all([topic_id, exam_board, number]):
-        return Response({"error": "Missing required fields"}, status=400)
-    if request.data.get('qualification') in {None, ''} and question_type != QUESTION_TYPE_ESSAY_25_MARK:
-        return Response({"error": "qualification is required. Use 'GCSE_SCIENCE' or 'ALEVEL_BIOLOGY'."}, status=400)
+        return None, ({"error": "Missing required fields"}, 400)
+    if data.get('qualification') in {None, ''} and question_type != QUESTION_TYPE_ESSAY_25_MARK:
+        return None, ({"error": "qualification is required. Use 'GCSE_SCIENCE' or 'ALEVEL_BIOLOGY'."}, 400)
 
     board_key = (exam_board or "").strip().upper()
-    specification = _normalize_specification(request.data.get("specification"))
+    specification = _normalize_specification(data.get("specification"))
     if board_key not in ALLOWED_BOARDS:
-        return Response({"error": EXAM_BOARD_ERROR_MESSAGE}, status=400)
+        return None, ({"error": EXAM_BOARD_ERROR_MESSAGE}, 400)
     if question_type not in ALLOWED_QUESTION_TYPES:
-        return Response({"error": QUESTION_TYPE_ERROR_MESSAGE}, status=400)
+        return None, ({"error": QUESTION_TYPE_ERROR_MESSAGE}, 400)
     specification_error = _validate_specification_for_board(board_key, specification)
     if specification_error:
-        return Response({"error": specification_error}, status=400)
+        return None, ({"error": specification_error}, 400)
     if qualification not in ALLOWED_QUALIFICATIONS:
-        return Response({"error": "Invalid qualification. Use 'ALEVEL_BIOLOGY' or 'GCSE_SCIENCE'."}, status=400)
+        return None, ({"error": "Invalid qualification. Use 'ALEVEL_BIOLOGY' or 'GCSE_SCIENCE'."}, 400)
     if question_type == QUESTION_TYPE_ESSAY_25_MARK:
         if qualification != QualificationPath.ALEVEL_BIOLOGY:
-            return Response({"error": "Essay questions are only available for A-level Biology."}, status=400)
+            return None, ({"error": "Essay questions are only available for A-level Biology."}, 400)
         if board_key != ExamBoard.AQA:
-            return Response({"error": "Essay questions are only available for AQA."}, status=400)
+            return None, ({"error": "Essay questions are only available for AQA."}, 400)
 
-    entitlement = get_or_create_entitlement(request.user)
-    current_plan_type = _current_plan_type(request.user, entitlement)
+    entitlement = get_or_create_entitlement(user)
+    current_plan_type = _current_plan_type(user, entitlement)
     today = timezone.localdate()
     questions_remaining_today = None
-    has_paid_access_for_request = _has_paid_generation_access(request.user, qualification)
+    has_paid_access_for_request = _has_paid_generation_access(user, qualification)
 
     if not has_paid_access_for_request:
         current_usage = (
-            QuestionUsage.objects.filter(user=request.user, date=today)
+            QuestionUsage.objects.filter(user=user, date=today)
             .values_list("question_count", flat=True)
             .first()
             or 0
@@ -778,169 +1090,350 @@ def generate_exam_questions(request):
             0,
         )
         if number > questions_remaining_today:
-            return Response(
-                {
-                    "error": "Free users can only generate 1 question per day total. Upgrade this qualification for unlimited access.",
-                    "plan_type": current_plan_type,
-                    "questions_remaining_today": questions_remaining_today,
-                },
-                status=403,
-            )
+            return None, _free_limit_error(current_plan_type, questions_remaining_today)
 
-    try:
-        if qualification == QualificationPath.ALEVEL_BIOLOGY:
-            if question_type == QUESTION_TYPE_ESSAY_25_MARK:
-                generation_result = prepare_essay_generation(
-                    user=request.user,
-                    board_key=board_key,
-                    specification=specification,
-                    topic_id=topic_id,
-                    subtopic_id=subtopic_id,
-                    subcategory_id=subcategory_id,
-                )
-            else:
-                generation_result = prepare_alevel_generation(
-                    user=request.user,
-                    board_key=board_key,
-                    specification=specification,
-                    topic_id=topic_id,
-                    subtopic_id=subtopic_id,
-                    subcategory_id=subcategory_id,
-                    number=number,
-                )
-        else:
-            gcse_subject = _normalize_gcse_subject(request.data.get("subject"))
-            gcse_tier = _normalize_gcse_tier(request.data.get("tier"))
-            if gcse_subject not in ALLOWED_GCSE_SUBJECTS:
-                return Response({"error": GCSE_SUBJECT_ERROR_MESSAGE}, status=400)
-            if gcse_tier not in ALLOWED_GCSE_TIERS:
-                return Response({"error": "Invalid GCSE tier. Use 'FOUNDATION' or 'HIGHER'."}, status=400)
-
-            generation_result = prepare_gcse_generation(
-                user=request.user,
-                board_key=board_key,
-                specification=specification,
-                topic_id=topic_id,
-                subtopic_id=subtopic_id,
-                subcategory_id=subcategory_id,
-                gcse_subject=gcse_subject,
-                gcse_tier=gcse_tier,
-                number=number,
-            )
+    gcse_subject = None
+    gcse_tier = None
+    if qualification == QualificationPath.GCSE_SCIENCE:
+        gcse_subject = _normalize_gcse_subject(data.get("subject"))
+        gcse_tier = _normalize_gcse_tier(data.get("tier"))
+        if gcse_subject not in ALLOWED_GCSE_SUBJECTS:
+            return None, ({"error": GCSE_SUBJECT_ERROR_MESSAGE}, 400)
+        if gcse_tier not in ALLOWED_GCSE_TIERS:
+            return None, ({"error": "Invalid GCSE tier. Use 'FOUNDATION' or 'HIGHER'."}, 400)
 
-        scope_key = generation_result["scope_key"]
-        combined_questions = generation_result["combined_questions"]
-        session_kwargs = generation_result["session_kwargs"]
+    return {
+        "topic_id": topic_id,
+        "subtopic_id": subtopic_id,
+        "subcategory_id": subcategory_id,
+        "board_key": board_key,
+        "specification": specification,
+        "qualification": qualification,
+        "question_type": question_type,
+        "number": number,
+        "gcse_subject": gcse_subject,
+        "gcse_tier": gcse_tier,
+        "today": today,
+        "current_plan_type": current_plan_type,
+        "has_paid_access": has_paid_access_for_request,
+        "questions_remaining_today": questions_remaining_today,
+    }, None
+
+
+def _resolve_generation_context(user, generation_request):
+    common = {
+        "user": user,
+        "board_key": generation_request["board_key"],
+        "specification": generation_request["specification"],
+        "topic_id": generation_request["topic_id"],
+        "subtopic_id": generation_request["subtopic_id"],
+        "subcategory_id": generation_request["subcategory_id"],
+    }
+    if generation_request["qualification"] == QualificationPath.GCSE_SCIENCE:
+        return resolve_gcse_generation(
+            **common,
+            gcse_subject=generation_request["gcse_subject"],
+            gcse_tier=generation_request["gcse_tier"],
+            number=generation_request["number"],
+        )
+    if generation_request["question_type"] == QUESTION_TYPE_ESSAY_25_MARK:
+        return resolve_essay_generation(**common)
+    return resolve_alevel_generation(**common, number=generation_request["number"])
 
-        with transaction.atomic():
-            if not has_paid_access_for_request:
-                usage, _ = QuestionUsage.objects.select_for_update().get_or_create(
-                    user=request.user,
-                    date=today,
-                    defaults={"question_count": 0},
-                )
-                questions_remaining_today = max(
-                    UserEntitlement.FREE_DAILY_QUESTION_LIMIT - usage.question_count,
-                    0,
-                )
-                if number > questions_remaining_today:
-                    raise DailyQuestionLimitExceeded()
 
-            session = QuestionSession.objects.create(
-                user=request.user,
-                **session_kwargs,
-            )
-            record_served_questions(request.user, board_key, scope_key, combined_questions)
-
-            if not has_paid_access_for_request:
-                usage.question_count += number
-                usage.save(update_fields=["question_count"])
-                questions_remaining_today = max(
-                    UserEntitlement.FREE_DAILY_QUESTION_LIMIT - usage.question_count,
-                    0,
-                )
+def _charge_generation_quota(user, generation_request):
+    """Charge a free user's daily quota for the request and return the questions left today.
 
-        return Response({
-            "questions": combined_questions,
-            "session_id": session.id,
-            "qualification": qualification,
-            "question_type": question_type,
-            "questions_remaining_today": questions_remaining_today,
-            "plan_type": current_plan_type,
-        }, status=200)
+    Call inside a transaction. Paid access is not charged. Raises ``DailyQuestionLimitExceeded`` when the quota ran
+    out after the request was validated.
+    """
+    if generation_request["has_paid_access"]:
+        return generation_request["questions_remaining_today"]
 
-    except DailyQuestionLimitExceeded:
-        return Response(
-            {
-                "error": "Free users can only generate 1 question per day total. Upgrade this qualification for unlimited access.",
-                "plan_type": current_plan_type,
-                "questions_remaining_today": 0,
-            },
-            status=403,
+    number = generation_request["number"]
+    usage, _ = QuestionUsage.objects.select_for_update().get_or_create(
+        user=user,
+        date=generation_request["today"],
+        defaults={"question_count": 0},
+    )
+    if number > max(UserEntitlement.FREE_DAILY_QUESTION_LIMIT - usage.question_count, 0):
+        raise DailyQuestionLimitExceeded()
+    usage.question_count += number
+    usage.save(update_fields=["question_count"])
+    return max(UserEntitlement.FREE_DAILY_QUESTION_LIMIT - usage.question_count, 0)
+
+
+def _save_generation_session(user, generation_request, generation_result):
+    session = QuestionSession.objects.create(
+        user=user,
+        **generation_result["session_kwargs"],
+    )
+    session_questions = record_session_questions(
+        session, generation_result["combined_questions"], generation_request["question_type"]
+    )
+    return session, session_questions
+
+
+def _generation_body(generation_request, generation_result, session, session_questions, questions_remaining_today):
+    return {
+        "questions": [
+            {**question_item, "question_id": session_question.id}
+            for question_item, session_question in zip(generation_result["combined_questions"], session_questions)
+        ],
+        "session_id": session.id,
+        "question_ids": [session_question.id for session_question in session_questions],
+        "qualification": generation_request["qualification"],
+        "question_type": generation_request["question_type"],
+        "questions_remaining_today": questions_remaining_today,
+        "plan_type": generation_request["current_plan_type"],
+        "llm_calls_saved": generation_result["llm_calls_saved"],
+    }
+
+
+def _commit_generation(user, generation_request, generation_result):
+    """Charge the free quota, create the session and record the served questions in one transaction."""
+    with span("quota"), transaction.atomic():
+        questions_remaining_today = _charge_generation_quota(user, generation_request)
+        session, session_questions = _save_generation_session(user, generation_request, generation_result)
+        record_served_questions(
+            user, generation_request["board_key"], generation_result["scope_key"], generation_result["combined_questions"]
         )
-    except BiologyTopic.DoesNotExist:
-        return Response({"error": "Invalid topic selected for this exam board"}, status=400)
-    except BiologySubTopic.DoesNotExist:
-        return Response({"error": "Invalid subtopic for the selected topic"}, status=400)
-    except BiologySubCategory.DoesNotExist:
-        return Response({"error": "Invalid subcategory for the selected subtopic"}, status=400)
-    except GCSEScienceTopic.DoesNotExist:
-        return Response({"error": "Invalid GCSE topic selected for this exam board and subject"}, status=400)
-    except GCSEScienceSubTopic.DoesNotExist:
-        return Response({"error": "Invalid GCSE subtopic for the selected GCSE topic"}, status=400)
-    except GCSEScienceSubCategory.DoesNotExist:
-        return Response({"error": "Invalid GCSE subcategory for the selected GCSE subtopic"}, status=400)
-    except ValueError as exc:
+        mark_shared_pool_served(generation_request, generation_result["scope_key"], generation_result["shared_questions"])
+
+    report_shared_pool_generation(generation_request, generation_result)
+    return _generation_body(generation_request, generation_result, session, session_questions, questions_remaining_today)
+
+
+GENERATION_LOOKUP_ERRORS = (
+    (BiologyTopic.DoesNotExist, "Invalid topic selected for this exam board"),
+    (BiologySubTopic.DoesNotExist, "Invalid subtopic for the selected topic"),
+    (BiologySubCategory.DoesNotExist, "Invalid subcategory for the selected subtopic"),
+    (GCSEScienceTopic.DoesNotExist, "Invalid GCSE topic selected for this exam board and subject"),
+    (GCSEScienceSubTopic.DoesNotExist, "Invalid GCSE subtopic for the selected GCSE topic"),
+    (GCSEScienceSubCategory.DoesNotExist, "Invalid GCSE subcategory for the selected GCSE subtopic"),
+)
+
+
+def _generation_error_response(exc, generation_request):
+    """Map a generation failure to ``(body, status)``; ``None`` means the exception should propagate."""
+    if isinstance(exc, DailyQuestionLimitExceeded):
+        return _free_limit_error(generation_request["current_plan_type"], 0)
+    for exception_type, message in GENERATION_LOOKUP_ERRORS:
+        if isinstance(exc, exception_type):
+            return {"error": message}, 400
+    if isinstance(exc, ValueError):
         if str(exc) == "subcategory_id provided without subtopic_id":
-            return Response({"error": str(exc)}, status=400)
-        raise
-    except json.JSONDecodeError:
-        return Response({"error": "Invalid JSON format in fallback question bank"}, status=500)
-    except Exception as e:
-        logger.exception("generate_exam_questions failed")
-        return Response({"error": str(e)}, status=500)
+            return {"error": str(exc)}, 400
+        return None
+    logger.exception("generate_exam_questions failed")
+    return {"error": str(exc)}, 500
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def mark_user_answer(request):
-    qualification = _normalize_qualification(request.data.get("qualification"))
-    answers = request.data.get("answers")
-    exam_board = (request.data.get("exam_board", "AQA") or "AQA").strip().upper()
-    specification = _normalize_specification(request.data.get("specification"))
-    question_type = _normalize_question_type(request.data.get("question_type"))
+def run_generate_exam_questions(user, data):
+    generation_request, error_response = _validate_generation_request(user, data)
+    if error_response is not None:
+        return error_response
+
+    try:
+        generation_result = _prepare_generation(user, _resolve_generation_context(user, generation_request))
+        return _commit_generation(user, generation_request, generation_result), 200
+    except Exception as exc:
+        error_response = _generation_error_response(exc, generation_request)
+        if error_response is None:
+            raise
+        return error_response
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def stream_generate_exam_questions(user, generation_request):
+    """Yield server-sent events for an already validated generate request.
+
+    Each AI question is checked and sent as a ``question`` event as soon as the model finishes it; fallback
+    top-ups follow, then a ``done`` event carrying the session id once the session has been saved. The free quota
+    is charged before the first question is sent, and each question is recorded as served before it is sent, so a
+    client that disconnects before ``done`` has still paid for what it saw. Failures end the stream with an
+    ``error`` event shaped like the JSON endpoint's error body plus its ``status``.
+    """
+    sent_questions = []
+    questions_remaining_today = generation_request["questions_remaining_today"]
+
+    def question_event(context, source, question_item):
+        nonlocal questions_remaining_today
+        with span("quota"), transaction.atomic():
+            if not sent_questions:
+                questions_remaining_today = _charge_generation_quota(user, generation_request)
+            record_served_questions(user, generation_request["board_key"], context["scope_key"], [question_item])
+            if source == "shared":
+                mark_shared_pool_served(generation_request, context["scope_key"], [question_item])
+        sent_questions.append(question_item)
+        return _sse_event("question", {"index": len(sent_questions) - 1, "source": source, "question": question_item})
+
+    try:
+        context = _resolve_generation_context(user, generation_request)
+        accepted_questions = draw_shared_pool_questions(context)
+        excluded_questions = NearDuplicateIndex(context["served_questions"])
+        for question_item in accepted_questions:
+            excluded_questions.add(normalized_item_question(question_item))
+            yield question_event(context, "shared", question_item)
+        shared_count = len(accepted_questions)
+
+        shortfall = context["number"] - shared_count
+        ai_stream = closing(context["stream_ai_questions"](shortfall)) if shortfall > 0 else nullcontext(())
+        with ai_stream as ai_questions:
+            for question_item in ai_questions:
+                if not isinstance(question_item, dict):
+                    continue
+                valid_questions = collect_valid_ai_questions(
+                    filter_self_contained_ai_questions([question_item]),
+                    excluded_questions,
+                )
+                if not valid_questions:
+                    continue
+                accepted_questions.append(question_item)
+                yield question_event(context, "ai", question_item)
+                if len(accepted_questions) >= context["number"]:
+                    break
+
+        pool_ai_questions(context, accepted_questions[shared_count:])
+        generation_result = complete_generation(user, context, accepted_questions, accepted_questions[:shared_count])
+        for question_item in generation_result["combined_questions"][len(accepted_questions):]:
+            yield question_event(context, "fallback", question_item)
+
+        with span("quota"), transaction.atomic():
+            if not sent_questions:
+                questions_remaining_today = _charge_generation_quota(user, generation_request)
+            session, session_questions = _save_generation_session(user, generation_request, generation_result)
+        report_shared_pool_generation(generation_request, generation_result)
+    except Exception as exc:
+        error_response = _generation_error_response(exc, generation_request)
+        if error_response is None:
+            logger.exception("generate_exam_questions stream failed")
+            error_response = ({"error": str(exc)}, 500)
+        error_body, status_code = error_response
+        yield _sse_event("error", {**error_body, "status": status_code})
+        return
+
+    body = _generation_body(generation_request, generation_result, session, session_questions, questions_remaining_today)
+    body.pop("questions")
+    yield _sse_event("done", body)
+
+
+def _session_marking_defaults(session):
+    defaults = {
+        "qualification": session.qualification,
+        "exam_board": session.exam_board,
+        "specification": session.specification,
+        "subject": session.gcse_subject,
+        "tier": session.gcse_tier,
+    }
+    return {key: value for key, value in defaults.items() if value}
+
+
+def _validate_marking_request(user, data):
+    """Check a mark request and resolve any stored questions it names.
+
+    Returns ``(marking_request, None)`` when the answers can be marked, otherwise ``(None, (body, status))``.
+    """
+    session = None
+    if data.get("session_id") is not None:
+        # Answers can then name stored questions by question_id instead of re-sending them.
+        session = QuestionSession.objects.filter(id=data.get("session_id"), user=user).first()
+        if session is None:
+            return None, ({"error": "Session not found"}, 404)
+        data = {**_session_marking_defaults(session), **data}
+    elif data.get("question_id") is not None:
+        return None, ({"error": "question_id requires session_id."}, 400)
+
+    qualification = _normalize_qualification(data.get("qualification"))
+    answers = data.get("answers")
+    exam_board = (data.get("exam_board", "AQA") or "AQA").strip().upper()
+    specification = _normalize_specification(data.get("specification"))
+    question_type = _normalize_question_type(data.get("question_type"))
     if exam_board not in ALLOWED_BOARDS:
-        return Response({"error": EXAM_BOARD_ERROR_MESSAGE}, status=400)
+        return None, ({"error": EXAM_BOARD_ERROR_MESSAGE}, 400)
     if question_type not in ALLOWED_QUESTION_TYPES:
-        return Response({"error": QUESTION_TYPE_ERROR_MESSAGE}, status=400)
+        return None, ({"error": QUESTION_TYPE_ERROR_MESSAGE}, 400)
     if qualification not in ALLOWED_QUALIFICATIONS:
-        return Response({"error": "Invalid qualification. Use 'ALEVEL_BIOLOGY' or 'GCSE_SCIENCE'."}, status=400)
+        return None, ({"error": "Invalid qualification. Use 'ALEVEL_BIOLOGY' or 'GCSE_SCIENCE'."}, 400)
     if question_type == QUESTION_TYPE_ESSAY_25_MARK:
         if qualification != QualificationPath.ALEVEL_BIOLOGY:
-            return Response({"error": "Essay questions are only available for A-level Biology."}, status=400)
+            return None, ({"error": "Essay questions are only available for A-level Biology."}, 400)
         if exam_board != ExamBoard.AQA:
-            return Response({"error": "Essay questions are only available for AQA."}, status=400)
+            return None, ({"error": "Essay questions are only available for AQA."}, 400)
     if qualification == QualificationPath.ALEVEL_BIOLOGY:
         specification_error = _validate_specification_for_board(exam_board, specification)
         if specification_error:
-            return Response({"error": specification_error}, status=400)
+            return None, ({"error": specification_error}, 400)
 
-    gcse_subject = _normalize_gcse_subject(request.data.get("subject"))
-    gcse_tier = _normalize_gcse_tier(request.data.get("tier"))
+    gcse_subject = _normalize_gcse_subject(data.get("subject"))
+    gcse_tier = _normalize_gcse_tier(data.get("tier"))
     if qualification == QualificationPath.GCSE_SCIENCE:
         if gcse_subject not in ALLOWED_GCSE_SUBJECTS:
-            return Response({"error": GCSE_SUBJECT_ERROR_MESSAGE}, status=400)
+            return None, ({"error": GCSE_SUBJECT_ERROR_MESSAGE}, 400)
         if gcse_tier not in ALLOWED_GCSE_TIERS:
-            return Response({"error": "Invalid GCSE tier. Use 'FOUNDATION' or 'HIGHER'."}, status=400)
+            return None, ({"error": "Invalid GCSE tier. Use 'FOUNDATION' or 'HIGHER'."}, 400)
+
+    marking_request = {
+        "session": session,
+        "question_id": None,
+        "qualification": qualification,
+        "exam_board": exam_board,
+        "specification": specification,
+        "question_type": question_type,
+        "subject": gcse_subject,
+        "tier": gcse_tier,
+        "answers": None,
+    }
 
     if answers is not None:
         if not isinstance(answers, list) or not answers:
-            return Response({"error": "answers must be a non-empty list."}, status=400)
+            return None, ({"error": "answers must be a non-empty list."}, 400)
+        if session is not None:
+            answers, error_message = attach_session_questions(session, answers)
+            if error_message:
+                return None, ({"error": error_message}, 400)
 
         for answer in answers:
             if not answer.get("question") or not answer.get("mark_scheme"):
-                return Response({"error": "Each answer must include question and mark_scheme."}, status=400)
+                return None, ({"error": "Each answer must include question and mark_scheme."}, 400)
+        marking_request["answers"] = answers
+        return marking_request, None
+
+    question = data.get("question")
+    mark_scheme = data.get("mark_scheme")
+    user_answer = data.get("user_answer")
+    if data.get("question_id") is not None:
+        attached, error_message = attach_session_questions(session, [{"question_id": data.get("question_id")}])
+        if error_message:
+            return None, ({"error": error_message}, 400)
+        question, mark_scheme = attached[0]["question"], attached[0]["mark_scheme"]
+        marking_request["question_id"] = data.get("question_id")
+
+    if not all([question, mark_scheme, user_answer]):
+        return None, ({"error": "Missing one or more fields."}, 400)
+
+    marking_request.update(question=question, mark_scheme=mark_scheme, user_answer=user_answer)
+    return marking_request, None
+
+
+def run_mark_user_answer(user, data):
+    marking_request, error_response = _validate_marking_request(user, data)
+    if error_response is not None:
+        return error_response
+
+    qualification = marking_request["qualification"]
+    exam_board = marking_request["exam_board"]
+    specification = marking_request["specification"]
+    question_type = marking_request["question_type"]
+    gcse_subject = marking_request["subject"]
+    gcse_tier = marking_request["tier"]
+    answers = marking_request["answers"]
+    session = marking_request["session"]
 
+    if answers is not None:
         try:
             if qualification == QualificationPath.GCSE_SCIENCE:
                 result = evaluate_gcse_batch_responses_with_openai(answers, exam_board, gcse_subject, gcse_tier)
@@ -948,17 +1441,27 @@ def mark_user_answer(request):
                 result = evaluate_essay_batch_responses_with_openai(answers, specification=specification)
             else:
                 result = evaluate_batch_responses_with_openai(answers, exam_board, specification=specification)
-            return Response(result, status=200)
+            if session is not None:
+                # Results come back in answer order, one per answer.
+                record_issued_marks(
+                    session,
+                    [
+                        (answer["question_id"], answer_result)
+                        for answer, answer_result in zip(answers, result.get("results", []))
+                        if answer.get("question_id") is not None
+                    ],
+                )
+            return result, 200
         except json.JSONDecodeError as e:
             logger.error("Invalid JSON from OpenAI batch marking: %s", e)
-            return Response({"error": "Invalid JSON returned by OpenAI"}, status=500)
+            return {"error": "Invalid JSON returned by OpenAI"}, 500
         except Exception as e:
             logger.error("Unexpected batch marking error: %s", e)
-            return Response({"error": str(e)}, status=500)
+            return {"error": str(e)}, 500
 
-    question = request.data.get("question")
-    mark_scheme = request.data.get("mark_scheme")
-    user_answer = request.data.get("user_answer")
+    question = marking_request["question"]
+    mark_scheme = marking_request["mark_scheme"]
+    user_answer = marking_request["user_answer"]
 
     logger.info("Incoming marking request:")
     logger.info("Question: %s", question)
@@ -967,23 +1470,120 @@ def mark_user_answer(request):
     logger.info("Exam Board: %s", exam_board)
     logger.info("Qualification: %s", qualification)
 
-    if not all([question, mark_scheme, user_answer]):
-        return Response({"error": "Missing one or more fields."}, status=400)
-
     try:
         if qualification == QualificationPath.GCSE_SCIENCE:
-            result = evaluate_gcse_response_with_openai(question, mark_scheme, user_answer, exam_board, gcse_subject, gcse_tier)
+            result = premark_or_evaluate(
+                question,
+                mark_scheme,
+                user_answer,
+                lambda: evaluate_gcse_response_with_openai(
+                    question, mark_scheme, user_answer, exam_board, gcse_subject, gcse_tier
+                ),
+            )
         elif question_type == QUESTION_TYPE_ESSAY_25_MARK:
             result = evaluate_essay_response_with_openai(question, mark_scheme, user_answer, specification=specification)
         else:
-            result = evaluate_response_with_openai(question, mark_scheme, user_answer, exam_board, specification=specification)
-        return Response(result, status=200)
+            result = premark_or_evaluate(
+                question,
+                mark_scheme,
+                user_answer,
+                lambda: evaluate_response_with_openai(
+                    question, mark_scheme, user_answer, exam_board, specification=specification
+                ),
+            )
+        if marking_request["question_id"] is not None:
+            record_issued_marks(session, [(marking_request["question_id"], result)])
+        return result, 200
     except json.JSONDecodeError as e:
         logger.error("Invalid JSON from OpenAI: %s", e)
-        return Response({"error": "Invalid JSON returned by OpenAI"}, status=500)
+        return {"error": "Invalid JSON returned by OpenAI"}, 500
     except Exception as e:
         logger.error("Unexpected error: %s", e)
-        return Response({"error": str(e)}, status=500)
+        return {"error": str(e)}, 500
+
+
+def _wants_async(request):
+    raw_value = request.query_params.get("async", request.data.get("async"))
+    return str(raw_value or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _request_payload(request):
+    if hasattr(request.data, "dict"):
+        return request.data.dict()
+    return dict(request.data)
+
+
+# Checks run before a job is queued, so a request that would be rejected gets the same 4xx as the sync path.
+JOB_REQUEST_VALIDATORS = {
+    Job.Kind.GENERATE_QUESTIONS: _validate_generation_request,
+    Job.Kind.MARK_ANSWER: _validate_marking_request,
+}
+
+
+def _queued_job_response(request, kind):
+    payload = _request_payload(request)
+    _, error_response = JOB_REQUEST_VALIDATORS[kind](request.user, payload)
+    if error_response is not None:
+        body, status_code = error_response
+        return Response(body, status=status_code)
+
+    job = enqueue_job(request.user, kind, payload)
+    return Response(
+        {
+            "job_id": job.id,
+            "status": job.status,
+            "poll_url": reverse("get-job-status", args=[job.id]),
+        },
+        status=202,
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent("generate-questions")
+def generate_exam_questions(request):
+    if _wants_async(request):
+        return _queued_job_response(request, Job.Kind.GENERATE_QUESTIONS)
+    body, status_code = run_generate_exam_questions(request.user, request.data)
+    return Response(body, status=status_code)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent("generate-questions-stream", event_stream=True)
+def generate_exam_questions_stream(request):
+    generation_request, error_response = _validate_generation_request(request.user, _request_payload(request))
+    if error_response is not None:
+        body, status_code = error_response
+        return Response(body, status=status_code)
+
+    response = StreamingHttpResponse(
+        stream_generate_exam_questions(request.user, generation_request),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx-style proxies from buffering the stream until it ends.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent("mark-answer")
+def mark_user_answer(request):
+    if _wants_async(request):
+        return _queued_job_response(request, Job.Kind.MARK_ANSWER)
+    body, status_code = run_mark_user_answer(request.user, request.data)
+    return Response(body, status=status_code)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_job_status(request, job_id):
+    job = Job.objects.filter(id=job_id, user=request.user).first()
+    if job is None:
+        return Response({"error": "Job not found"}, status=404)
+    return Response(serialize_job(job), status=200)
 
 
 @api_view(['POST'])
@@ -998,11 +1598,17 @@ def submit_question_session(request):
 
     try:
         session = QuestionSession.objects.get(id=session_id, user=request.user)
+        answers, error_message = attach_session_questions(session, answers)
+        if error_message:
+            return Response({"error": error_message}, status=400)
+        answers = apply_issued_marks(session, answers)
         total_score = sum(_coerce_numeric_score(a.get("score", 0)) for a in answers)
         feedback = normalize_feedback_payload(feedback_text, answers)
-        session.total_score = total_score
-        session.feedback = json.dumps(feedback)
-        session.save()
+        with transaction.atomic():
+            session.total_score = total_score
+            session.feedback = json.dumps(feedback)
+            session.save()
+            record_answer_results(session, answers)
 
         return Response({
             "message": "Session submitted",
@@ -1032,6 +1638,16 @@ def get_user_sessions(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_answer_stats(request):
+    body = {"weak_areas": weak_areas(request.user, since=request.user.performance_tracking_start_date)}
+    scope_key = request.query_params.get("scope_key")
+    if scope_key:
+        body["hardest_questions"] = question_difficulty(scope_key)
+    return Response(body)
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_user_results(request):